@@ -45,6 +45,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'images_api_app.metrics.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -68,13 +69,38 @@ AUTHENTICATION_BACKENDS = [
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
+        'images_api_app.authentication.SignedTokenAuthentication',
         'rest_framework.authentication.BasicAuthentication'
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
-    ]
+    ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'images_api_app.throttling.TierRateThrottle',
+    ],
 }
 
+# Per-tier limits are set on AccountTier, see images_api_app.throttling.
+# Buckets live in a cache shared by all workers, see CACHES. Bucket updates
+# wait at most THROTTLE_LOCK_WAIT seconds for the bucket's lock before the
+# request is throttled.
+
+THROTTLE_CACHE_ALIAS = 'throttle'
+THROTTLE_CACHE_MAX_ENTRIES = 1_000_000
+THROTTLE_UPLOAD_SLOT_TIMEOUT = 600
+THROTTLE_LOCK_WAIT = 0.5
+THROTTLE_LOCK_TIMEOUT = 2
+
+# Bearer tokens issued by /api/token/, see images_api_app.authentication.
+# Revoked tokens are kept in the RevokedToken table until they expire and
+# copied into each worker, which reloads them when the version token in the
+# API_TOKEN_CACHE_ALIAS cache changes. Each client address may request
+# API_TOKEN_REQUESTS_PER_MINUTE tokens.
+
+API_TOKEN_CACHE_ALIAS = 'image_list'
+API_TOKEN_MAX_AGE = 7 * 24 * 60 * 60
+API_TOKEN_REQUESTS_PER_MINUTE = 10
+
 ROOT_URLCONF = 'image_hosting_api.urls'
 
 TEMPLATES = [
@@ -101,11 +127,97 @@ WSGI_APPLICATION = 'image_hosting_api.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'images_api_app.db_backend',
         'NAME': BASE_DIR / 'db.sqlite3',
     }
 }
 
+# Applied to each new SQLite connection, see images_api_app.db. Atomic blocks
+# start with BEGIN IMMEDIATE, see images_api_app.db_backend.
+# https://www.sqlite.org/pragma.html
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'busy_timeout': 5000,
+    'synchronous': 'NORMAL',
+    'cache_size': -20000,
+    'temp_store': 'MEMORY',
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# All caches are shared by all worker processes. The throttle cache holds
+# the throttle buckets in the database (python manage.py createcachetable),
+# whose writes are serialized. Culling a live bucket would reset its limit,
+# so the throttle cache allows far more entries than there are live buckets;
+# a bucket expires once it would be full again. The default cache is not
+# used by the application. The image_list cache holds list pages, sprite
+# sheet maps and the version tokens of those, of the similarity indexes and
+# of the revoked token list on the local disk, which suits a single host
+# without a database round trip.
+# Tests use per-process memory caches, so no entries outlive a test run.
+
+if 'test' in sys.argv:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'throttle': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'throttle',
+            'OPTIONS': {'MAX_ENTRIES': THROTTLE_CACHE_MAX_ENTRIES},
+        },
+        'image_list': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'image-list',
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'image_api_cache',
+        },
+        'throttle': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'image_api_throttle',
+            'OPTIONS': {'MAX_ENTRIES': THROTTLE_CACHE_MAX_ENTRIES},
+        },
+        'image_list': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.path.join(BASE_DIR, 'cache', 'image_list'),
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        },
+    }
+
+# Serialized image list pages contain signed expiring links, so keep them
+# cached for well under the minimum expiry time of 300 seconds.
+IMAGE_LIST_CACHE_ALIAS = 'image_list'
+IMAGE_LIST_CACHE_TIMEOUT = 60
+
+
+# Logging
+# https://docs.djangoproject.com/en/3.2/topics/logging/
+# Errors go to image_api_app.log, opened on the first error of each process.
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'file': {
+            'class': 'logging.FileHandler',
+            'filename': 'image_api_app.log',
+            'level': 'ERROR',
+            'delay': True,
+        },
+    },
+    'root': {
+        'handlers': ['file'],
+        'level': 'ERROR',
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -157,6 +269,142 @@ if 'test' in sys.argv:
 else:
     MEDIA_ROOT = os.path.join(BASE_DIR, 'media/')
 
+# Imports done by the WSGI module before serving, see images_api_app.startup.
+# With gunicorn --preload they happen once in the master and are shared by
+# the workers. IMAGE_PRELOAD_IMAGING also loads PIL and NumPy up front, which
+# only saves memory when the workers are forked from a preloaded master.
+
+IMAGE_PRELOAD_IMAGING = True
+
+# Background tasks, see images_api_app.tasks. Tests run them inline.
+
+IMAGE_TASK_WORKERS = 2
+IMAGE_TASKS_EAGER = 'test' in sys.argv
+
+# Served file counters are flushed to the usage stats tables every
+# IMAGE_USAGE_FLUSH_INTERVAL seconds or once IMAGE_USAGE_FLUSH_MAX_NAMES files
+# have pending counts, see images_api_app.usage
+
+IMAGE_USAGE_FLUSH_INTERVAL = 0 if 'test' in sys.argv else 10
+IMAGE_USAGE_FLUSH_MAX_NAMES = 1000
+
+# Originals neither uploaded nor requested for IMAGE_COLD_STORAGE_AFTER_DAYS
+# days are moved to IMAGE_COLD_STORAGE_ROOT by the archive_cold_images
+# command, gzip-compressed with IMAGE_COLD_STORAGE_COMPRESS, and restored on
+# access, see images_api_app.coldstorage. The root must be outside MEDIA_ROOT.
+
+IMAGE_COLD_STORAGE_ROOT = os.path.join(BASE_DIR, 'cold_media/')
+IMAGE_COLD_STORAGE_AFTER_DAYS = 30
+IMAGE_COLD_STORAGE_COMPRESS = False
+
+# Number of deleted files removed from storage per background batch
+
+IMAGE_RECLAIM_BATCH_SIZE = 500
+
+# Decoder limits enforced on upload and before rendering, see
+# images_api_app.rendering. Rendering runs in a child process whose address
+# space may grow by at most IMAGE_RENDER_MEMORY_LIMIT bytes, started with the
+# multiprocessing method IMAGE_RENDER_START_METHOD.
+
+IMAGE_MAX_PIXELS = 50_000_000
+IMAGE_MAX_DECODE_BYTES = 256 * 1024 * 1024
+IMAGE_RENDER_IN_SUBPROCESS = True
+IMAGE_RENDER_START_METHOD = 'forkserver'
+IMAGE_RENDER_MEMORY_LIMIT = 512 * 1024 * 1024
+IMAGE_RENDER_TIMEOUT = 10
+
+# In-memory cache of thumbnail bytes served under MEDIA_URL/thumbnails/, see
+# images_api_app.hotcache. Files up to IMAGE_HOT_CACHE_MAX_ITEM_BYTES are
+# cached, IMAGE_HOT_CACHE_MAX_BYTES per worker (0 disables the cache). With
+# IMAGE_HOT_CACHE_ARENA_PATH the workers share IMAGE_HOT_CACHE_ARENA_SLOTS
+# slots in a memory-mapped file instead.
+
+IMAGE_HOT_CACHE_MAX_BYTES = 32 * 1024 * 1024
+IMAGE_HOT_CACHE_MAX_ITEM_BYTES = 64 * 1024
+IMAGE_HOT_CACHE_TIMEOUT = 300
+IMAGE_HOT_CACHE_ARENA_PATH = None
+IMAGE_HOT_CACHE_ARENA_SLOTS = 1024
+
+# Multi-frame images (GIF, APNG, WebP) are thumbnailed from a single frame
+# unless animated thumbnails are enabled. Animated thumbnails stop after
+# IMAGE_ANIMATED_MAX_FRAMES frames or IMAGE_ANIMATED_MAX_PIXELS decoded pixels.
+
+IMAGE_THUMBNAIL_FRAME = 0
+IMAGE_ANIMATED_THUMBNAILS = False
+IMAGE_ANIMATED_MAX_FRAMES = 50
+IMAGE_ANIMATED_MAX_PIXELS = 50_000_000
+
+# Smart-cropped thumbnails (ThumbnailSize.crop_width) choose their crop window
+# on a proxy of the image at most this many pixels on its longer side
+# before the crop is cut from the full image.
+
+IMAGE_SMART_CROP_PROXY_SIZE = 128
+
+# Ingest pipeline run on every upload, see images_api_app.pipeline. Originals
+# above IMAGE_INGEST_MAX_BYTES are re-encoded at the recompress quality.
+
+IMAGE_INGEST_STAGES = ['auto_orient', 'strip_metadata', 'recompress']
+IMAGE_INGEST_MAX_BYTES = 2 * 1024 * 1024
+IMAGE_INGEST_JPEG_QUALITY = 90
+IMAGE_INGEST_RECOMPRESS_QUALITY = 82
+IMAGE_INGEST_STRIP_ICC = False
+
+# Maximum number of files accepted by a single bulk upload request
+
+IMAGE_BULK_UPLOAD_MAX_FILES = 100
+
+# Direct uploads: clients PUT the file to a signed URL valid for
+# IMAGE_DIRECT_UPLOAD_MAX_AGE seconds, then finalize it within
+# IMAGE_DIRECT_UPLOAD_FINALIZE_MAX_AGE seconds of the URL being issued.
+
+IMAGE_DIRECT_UPLOAD_MAX_AGE = 600
+IMAGE_DIRECT_UPLOAD_FINALIZE_MAX_AGE = 3600
+IMAGE_DIRECT_UPLOAD_MAX_BYTES = 50 * 1024 * 1024
+
+# Near-duplicate detection, see images_api_app.similarity. Distances are in
+# bits of the 64-bit perceptual hash. Uploads report existing images within
+# IMAGE_SIMILARITY_DUPLICATE_DISTANCE; /api/similar/ searches within
+# IMAGE_SIMILARITY_MAX_DISTANCE by default. Each worker keeps the hash index
+# of the IMAGE_SIMILARITY_INDEX_USERS most recently searched users.
+
+IMAGE_SIMILARITY_DUPLICATE_DISTANCE = 4
+IMAGE_SIMILARITY_MAX_DISTANCE = 10
+IMAGE_SIMILARITY_MAX_RESULTS = 50
+IMAGE_SIMILARITY_INDEX_USERS = 100
+
+# Rows fetched per database round trip when streaming /api/list/export/
+
+IMAGE_EXPORT_CHUNK_SIZE = 500
+
+# ZIP exports from /api/list/export/zip/: images per archive and bytes read
+# from storage per step
+
+IMAGE_ZIP_EXPORT_MAX_IMAGES = 10000
+IMAGE_ZIP_CHUNK_SIZE = 64 * 1024
+
+# Sprite sheets from /api/list/sprite/: images per sheet, maximum sheet width
+# in pixels and encoding. Sheets are stored under IMAGE_SPRITE_DIRECTORY in
+# the default storage and their names and maps cached for
+# IMAGE_SPRITE_CACHE_TIMEOUT seconds, see images_api_app.sprites.
+
+IMAGE_SPRITE_CACHE_ALIAS = 'image_list'
+IMAGE_SPRITE_DIRECTORY = 'sprites'
+IMAGE_SPRITE_CACHE_TIMEOUT = 3600
+IMAGE_SPRITE_BUILD_TIMEOUT = 60
+IMAGE_SPRITE_MAX_IMAGES = 100
+IMAGE_SPRITE_MAX_WIDTH = 2048
+IMAGE_SPRITE_FORMAT = 'JPEG'
+IMAGE_SPRITE_QUALITY = 85
+
+# Maximum number of change log entries returned by one /api/list/changes/ call
+
+IMAGE_CHANGES_PAGE_SIZE = 500
+
+# Unfiltered admin changelists of tables larger than this show the database's
+# row estimate instead of running COUNT(*)
+
+ADMIN_ESTIMATED_COUNT_THRESHOLD = 10000
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
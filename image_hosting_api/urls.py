@@ -18,7 +18,10 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from images_api_app.views import serve_thumbnail
+
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('api/', include('images_api_app.urls'))
+    path('api/', include('images_api_app.urls')),
+    path(f'{settings.MEDIA_URL.lstrip("/")}thumbnails/<path:path>', serve_thumbnail, name='serve_thumbnail'),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
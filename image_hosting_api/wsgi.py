@@ -7,10 +7,19 @@ For more information on this file, see
 https://docs.djangoproject.com/en/3.2/howto/deployment/wsgi/
 """
 
+import gc
 import os
 
 from django.core.wsgi import get_wsgi_application
 
+# Collecting during start-up only leaves holes in pages the workers share,
+# see images_api_app.startup.preload, which turns the collector back on.
+gc.disable()
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'image_hosting_api.settings')
 
 application = get_wsgi_application()
+
+from images_api_app.startup import preload  # noqa: E402
+
+preload()
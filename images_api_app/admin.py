@@ -1,9 +1,113 @@
+from collections import defaultdict
+
+from django.conf import settings
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db.models import Prefetch
+from django.utils.functional import cached_property
+from django.utils.html import format_html
 
+from .db import estimate_row_count
 from .models import AccountTier, Image, ImageThumbnail, ThumbnailSize, UserProfile
+from .tasks import enqueue, render_thumbnails
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Use the database's row estimate instead of COUNT(*) for unfiltered
+    changelists of tables with more than ADMIN_ESTIMATED_COUNT_THRESHOLD rows.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimate_row_count(queryset.model)
+            if estimate is not None and estimate > settings.ADMIN_ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+
+def rerender_thumbnails(thumbnails):
+    """
+    Delete the given thumbnails and queue them to be rendered again by the
+    background tasks. Returns the number of thumbnails queued.
+    """
+    by_size = defaultdict(list)
+    for image_id, height in thumbnails.values_list('image_id', 'thumbnail_size__height'):
+        by_size[height].append(image_id)
+    count = thumbnails.count()
+    thumbnails.delete()
+    for height, image_ids in by_size.items():
+        enqueue(render_thumbnails, image_ids, [height])
+    return count
+
+
+def thumbnail_preview(thumbnail):
+    if not thumbnail or not thumbnail.thumbnail:
+        return '-'
+    return format_html('<img src="{}" style="max-height: 50px">', thumbnail.thumbnail.url)
+
+
+@admin.register(Image)
+class ImageAdmin(LargeTableAdmin):
+    list_display = ['id', 'user', 'uploaded_at', 'preview']
+    list_select_related = ['user']
+    list_filter = [('uploaded_at', admin.DateFieldListFilter)]
+    search_fields = ['=id', '=user__username']
+    raw_id_fields = ['user']
+    readonly_fields = ['uploaded_at', 'ingest_saved_bytes']
+    actions = ['rerender_thumbnails']
+
+    def get_queryset(self, request):
+        # The smallest rendered thumbnail of each image on the page, fetched in one query.
+        return super().get_queryset(request).prefetch_related(Prefetch(
+            'image_thumbnails',
+            queryset=ImageThumbnail.objects.select_related('thumbnail_size').order_by('thumbnail_size__height')))
+
+    @admin.display(description='Preview')
+    def preview(self, obj):
+        return thumbnail_preview(next((t for t in obj.image_thumbnails.all() if t.thumbnail), None))
+
+    @admin.action(description='Re-render thumbnails of selected images')
+    def rerender_thumbnails(self, request, queryset):
+        count = rerender_thumbnails(ImageThumbnail.objects.filter(image__in=queryset))
+        self.message_user(request, f'{count} thumbnails queued for rendering.')
+
+
+@admin.register(ImageThumbnail)
+class ImageThumbnailAdmin(LargeTableAdmin):
+    list_display = ['id', 'image', 'thumbnail_size', 'preview']
+    list_select_related = ['image', 'thumbnail_size']
+    list_filter = ['thumbnail_size']
+    search_fields = ['=image__id']
+    raw_id_fields = ['image']
+    actions = ['rerender_thumbnails']
+
+    @admin.display(description='Preview')
+    def preview(self, obj):
+        return thumbnail_preview(obj)
+
+    @admin.action(description='Re-render selected thumbnails')
+    def rerender_thumbnails(self, request, queryset):
+        count = rerender_thumbnails(queryset)
+        self.message_user(request, f'{count} thumbnails queued for rendering.')
+
+
+@admin.register(UserProfile)
+class UserProfileAdmin(LargeTableAdmin):
+    list_display = ['user', 'account_tier']
+    list_select_related = ['user', 'account_tier']
+    list_filter = ['account_tier']
+    search_fields = ['=user__username']
+    raw_id_fields = ['user']
+
 
 admin.site.register(AccountTier)
 admin.site.register(ThumbnailSize)
-admin.site.register(ImageThumbnail)
-admin.site.register(Image)
-admin.site.register(UserProfile)
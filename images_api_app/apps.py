@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class ImagesApiAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'images_api_app'
+
+    def ready(self):
+        from .db import configure_sqlite_connection
+
+        connection_created.connect(configure_sqlite_connection)
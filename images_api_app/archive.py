@@ -0,0 +1,69 @@
+"""
+ZIP archives streamed while they are being written.
+
+Entries are stored without compression, since images are already compressed,
+and copied from storage chunk by chunk. Only the current chunk and the
+central directory, a few dozen bytes per entry, are held in memory.
+"""
+import logging
+import zipfile
+
+from django.core.files.storage import default_storage
+
+from .coldstorage import rehydrate
+
+
+class ZipSink:
+    """
+    Unseekable file object ZipFile writes into; the written bytes are
+    collected until the next drain().
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def write(self, data):
+        self.buffer += data
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def stream_zip(entries, chunk_size, storage=default_storage):
+    """
+    Yield the bytes of a ZIP archive of (archive name, storage name, date_time)
+    entries. Archived originals are restored from cold storage, other files
+    missing from storage are skipped.
+    """
+    sink = ZipSink()
+    with zipfile.ZipFile(sink, mode='w', compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for arcname, name, date_time in entries:
+            try:
+                if not storage.exists(name):
+                    rehydrate(name)
+                size = storage.size(name)
+                source = storage.open(name, 'rb')
+            except OSError as e:
+                logging.error(f"An error occurred while adding {name} to an archive: {e}")
+                continue
+            info = zipfile.ZipInfo(arcname, date_time=date_time)
+            # A known size lets ZipFile decide up front whether the entry needs ZIP64.
+            info.file_size = size
+            with source, archive.open(info, mode='w') as target:
+                for chunk in iter(lambda: source.read(chunk_size), b''):
+                    target.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            data = sink.drain()
+            if data:
+                yield data
+    data = sink.drain()
+    if data:
+        yield data
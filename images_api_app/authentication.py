@@ -0,0 +1,131 @@
+import threading
+import uuid
+from datetime import datetime
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+from itsdangerous import URLSafeTimedSerializer, SignatureExpired, BadSignature, BadTimeSignature
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed
+
+
+def get_token_serializer():
+    return URLSafeTimedSerializer(settings.SECRET_KEY, salt='api-token')
+
+
+def issue_token(user):
+    """
+    Return a signed bearer token for the user, valid for API_TOKEN_MAX_AGE seconds.
+    """
+    return get_token_serializer().dumps({'user': user.pk, 'jti': uuid.uuid4().hex})
+
+
+class RevokedTokenCache:
+    """
+    The ids of revoked tokens that have not expired, kept per process so that
+    authenticating needs no query. The RevokedToken table stays the source of
+    truth: a version token in the API_TOKEN_CACHE_ALIAS cache is replaced
+    after every revocation, and a process whose copy has another version
+    reloads it from the table.
+    """
+    version_key = 'revoked_tokens:version'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._jtis = frozenset()
+
+    @property
+    def backend(self):
+        return caches[settings.API_TOKEN_CACHE_ALIAS]
+
+    def _get_version(self):
+        version = self.backend.get(self.version_key)
+        if version is None:
+            self.backend.add(self.version_key, uuid.uuid4().hex, None)
+            version = self.backend.get(self.version_key)
+        return version
+
+    def is_revoked(self, jti):
+        from .models import RevokedToken
+
+        # The version is read before the table, so a revocation committed
+        # after the read leaves this copy outdated and reloaded next time.
+        version = self._get_version()
+        with self._lock:
+            if version == self._version:
+                return jti in self._jtis
+        jtis = frozenset(RevokedToken.objects.filter(
+            expires_at__gte=timezone.now()).values_list('jti', flat=True))
+        with self._lock:
+            self._version, self._jtis = version, jtis
+        return jti in jtis
+
+    def invalidate(self):
+        self.backend.set(self.version_key, uuid.uuid4().hex, None)
+
+    def clear(self):
+        with self._lock:
+            self._version = None
+            self._jtis = frozenset()
+
+
+revoked_tokens = RevokedTokenCache()
+
+
+def revoke_token(payload):
+    """
+    Add an authenticated token to the denylist until it would have expired
+    anyway, and drop denylist entries of tokens that have expired since.
+    """
+    from .models import RevokedToken
+
+    expires_at = datetime.fromtimestamp(payload['issued_at'] + settings.API_TOKEN_MAX_AGE + 1, timezone.utc)
+    RevokedToken.objects.filter(expires_at__lt=timezone.now()).delete()
+    RevokedToken.objects.update_or_create(jti=payload['jti'], defaults={'expires_at': expires_at})
+    transaction.on_commit(revoked_tokens.invalidate)
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    """
+    Stateless bearer tokens verified with an HMAC signature.
+
+    Unlike BasicAuthentication this does not run the password hasher on every
+    request; the password is only checked once, when the token is issued.
+    request.auth is set to the token payload, including its issue time.
+    """
+    keyword = b'bearer'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword:
+            return None
+        if len(auth) != 2:
+            raise AuthenticationFailed('Invalid token header.')
+
+        try:
+            payload, issued_at = get_token_serializer().loads(
+                auth[1].decode(), max_age=settings.API_TOKEN_MAX_AGE, return_timestamp=True)
+        except SignatureExpired:
+            raise AuthenticationFailed('Token has expired.')
+        except (BadSignature, BadTimeSignature, UnicodeDecodeError):
+            raise AuthenticationFailed('Invalid token.')
+
+        if revoked_tokens.is_revoked(payload['jti']):
+            raise AuthenticationFailed('Token has been revoked.')
+
+        try:
+            user = User.objects.select_related('userprofile__account_tier').get(pk=payload['user'])
+        except User.DoesNotExist:
+            raise AuthenticationFailed('Invalid token.')
+        if not user.is_active:
+            raise AuthenticationFailed('User inactive or deleted.')
+
+        payload['issued_at'] = issued_at.timestamp()
+        return user, payload
+
+    def authenticate_header(self, request):
+        return 'Bearer'
@@ -0,0 +1,168 @@
+"""
+Benchmarks for the upload, list, thumbnail and serve hot paths.
+
+The functions here run against whatever database and MEDIA_ROOT are active;
+the run_benchmarks management command wraps them in a throwaway database.
+"""
+import random
+import statistics
+import time
+from io import BytesIO
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.urls import reverse
+from PIL import Image as PILImage
+from rest_framework.test import APIClient
+
+from .cache import image_list_cache
+from .models import AccountTier, Image, ImageThumbnail, ThumbnailSize
+
+
+def summarize(durations):
+    durations = sorted(durations)
+    return {
+        'runs': len(durations),
+        'mean_ms': round(statistics.mean(durations) * 1000, 3),
+        'p50_ms': round(durations[len(durations) // 2] * 1000, 3),
+        'p95_ms': round(durations[min(len(durations) - 1, int(len(durations) * 0.95))] * 1000, 3),
+    }
+
+
+def make_image_bytes(width, height, seed, format='JPEG'):
+    """
+    Encode a noisy image, which compresses about as badly as a real photo.
+    """
+    rng = random.Random(seed)
+    image = PILImage.frombytes('RGB', (width, height), rng.randbytes(width * height * 3))
+    image_io = BytesIO()
+    image.save(image_io, format=format, quality=85)
+    return image_io.getvalue()
+
+
+def seed_tiers():
+    sizes = [ThumbnailSize.objects.get_or_create(height=height)[0] for height in (200, 400)]
+    tiers = {}
+    for name in ('Basic', 'Premium', 'Enterprise'):
+        tiers[name], _ = AccountTier.objects.get_or_create(name=name)
+    tiers['Basic'].thumbnail_sizes.add(sizes[0])
+    tiers['Premium'].thumbnail_sizes.add(*sizes)
+    tiers['Enterprise'].thumbnail_sizes.add(*sizes)
+    return tiers
+
+
+def create_user(username, tier):
+    user = User.objects.create(username=username)
+    user.userprofile.account_tier = tier
+    user.userprofile.save()
+    return user
+
+
+def seed_images(user, count, image_bytes):
+    return [
+        Image.objects.create(
+            user=user, image=SimpleUploadedFile(f'seed_{i}.jpg', image_bytes, content_type='image/jpeg'))
+        for i in range(count)
+    ]
+
+
+def api_client(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+def benchmark_upload(tier, image_bytes, uploads):
+    client = api_client(create_user('bench_upload', tier))
+    durations = []
+    for i in range(uploads):
+        upload = SimpleUploadedFile(f'upload_{i}.jpg', image_bytes, content_type='image/jpeg')
+        start = time.perf_counter()
+        response = client.post(reverse('upload_image'), {'image': upload})
+        durations.append(time.perf_counter() - start)
+        assert response.status_code == 201, response.content
+    result = summarize(durations)
+    result['uploads_per_s'] = round(uploads / sum(durations), 2)
+    return result
+
+
+def benchmark_list(tier, image_bytes, library_sizes, repeat):
+    results = {}
+    for library_size in library_sizes:
+        user = create_user(f'bench_list_{library_size}', tier)
+        seed_images(user, library_size, image_bytes)
+        client = api_client(user)
+
+        start = time.perf_counter()
+        client.get(reverse('list_images'))
+        first_request = time.perf_counter() - start
+
+        uncached = []
+        cached = []
+        for _ in range(repeat):
+            image_list_cache.invalidate_user(user.id)
+            start = time.perf_counter()
+            client.get(reverse('list_images'))
+            uncached.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            client.get(reverse('list_images'))
+            cached.append(time.perf_counter() - start)
+
+        results[str(library_size)] = {
+            'first_request_ms': round(first_request * 1000, 3),
+            'uncached': summarize(uncached),
+            'cached': summarize(cached),
+        }
+    return results
+
+
+def benchmark_thumbnail(tier, image_bytes, repeat):
+    image = seed_images(create_user('bench_thumbnail', tier), 1, image_bytes)[0]
+    cold = []
+    warm = []
+    for _ in range(repeat):
+        ImageThumbnail.objects.filter(image=image).delete()
+        start = time.perf_counter()
+        image.get_thumbnail(200)
+        cold.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        image.get_thumbnail(200)
+        warm.append(time.perf_counter() - start)
+    return {'cold': summarize(cold), 'warm': summarize(warm)}
+
+
+def benchmark_serve(tier, image_bytes, requests):
+    image = seed_images(create_user('bench_serve', tier), 1, image_bytes)[0]
+    client = APIClient()
+    url = reverse('serve_image', args=[image.expiring_image_link])
+    durations = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = client.get(url)
+        b''.join(response.streaming_content)
+        durations.append(time.perf_counter() - start)
+        assert response.status_code == 200
+    result = summarize(durations)
+    result['requests_per_s'] = round(requests / sum(durations), 2)
+    result['mb_per_s'] = round(requests * len(image_bytes) / sum(durations) / 1e6, 2)
+    return result
+
+
+def run_all(width=1920, height=1080, uploads=20, library_sizes=(10, 100), repeat=5, serve_requests=50, seed=0):
+    tiers = seed_tiers()
+    tier = tiers['Enterprise']
+    image_bytes = make_image_bytes(width, height, seed)
+    return {
+        'parameters': {
+            'image': {'width': width, 'height': height, 'bytes': len(image_bytes)},
+            'uploads': uploads,
+            'library_sizes': list(library_sizes),
+            'repeat': repeat,
+            'serve_requests': serve_requests,
+            'seed': seed,
+        },
+        'upload': benchmark_upload(tier, image_bytes, uploads),
+        'list': benchmark_list(tier, image_bytes, library_sizes, repeat),
+        'thumbnail': benchmark_thumbnail(tier, image_bytes, repeat),
+        'serve': benchmark_serve(tier, image_bytes, serve_requests),
+    }
@@ -0,0 +1,158 @@
+import hashlib
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+
+from .metrics import registry
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+@contextmanager
+def file_lock(directory, key):
+    """
+    Hold an fcntl lock on a file named after key in directory, which the
+    kernel releases if its holder dies. Yields whether it was taken within
+    THROTTLE_LOCK_WAIT.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{hashlib.md5(key.encode()).hexdigest()}.lock')
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        deadline = time.monotonic() + settings.THROTTLE_LOCK_WAIT
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    yield False
+                    return
+                time.sleep(0.005)
+        try:
+            yield True
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def cache_lock(cache, key):
+    """
+    Hold a lock on key for a read-modify-write of cache entries. The lock is
+    an entry taken with add, which is atomic in the database, memory and
+    memcached backends, and expires after THROTTLE_LOCK_TIMEOUT seconds in
+    case its holder dies. Yields whether it was taken within THROTTLE_LOCK_WAIT.
+
+    The file-based backend's add is not atomic, so for it the lock is a
+    file_lock in the cache directory, shared by the processes on the host.
+    """
+    if fcntl and isinstance(cache, FileBasedCache):
+        with file_lock(cache._dir, key) as locked:
+            yield locked
+        return
+    lock_key = f'{key}:lock'
+    deadline = time.monotonic() + settings.THROTTLE_LOCK_WAIT
+    while not cache.add(lock_key, True, settings.THROTTLE_LOCK_TIMEOUT):
+        if time.monotonic() >= deadline:
+            yield False
+            return
+        time.sleep(0.005)
+    try:
+        yield True
+    finally:
+        cache.delete(lock_key)
+
+
+class ImageListCache:
+    """
+    Versioned cache of serialized image list pages.
+
+    Every user has a version token and all users share a global one. Both are
+    part of the page key, so bumping a token makes every page cached under the
+    old token unreachable without having to know or delete those keys.
+    """
+    global_version_key = 'image_list:version:global'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def backend(self):
+        return caches[settings.IMAGE_LIST_CACHE_ALIAS]
+
+    def user_version_key(self, user_id):
+        return f'image_list:version:user:{user_id}'
+
+    def _get_version(self, key):
+        version = self.backend.get(key)
+        if version is None:
+            # A missing token (never set or evicted) always starts a fresh
+            # namespace so pages cached under an earlier token are never reused.
+            self.backend.add(key, uuid.uuid4().hex, None)
+            version = self.backend.get(key)
+        return version
+
+    def page_key(self, user_id, page):
+        user_version = self._get_version(self.user_version_key(user_id))
+        global_version = self._get_version(self.global_version_key)
+        page_hash = hashlib.md5(page.encode()).hexdigest()
+        return f'image_list:page:{user_id}:{user_version}:{global_version}:{page_hash}'
+
+    def get(self, key):
+        data = self.backend.get(key)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return data
+
+    def set(self, key, data):
+        self.backend.set(key, data, settings.IMAGE_LIST_CACHE_TIMEOUT)
+
+    def invalidate_user(self, user_id):
+        self.backend.set(self.user_version_key(user_id), uuid.uuid4().hex, None)
+
+    def invalidate_all(self):
+        self.backend.set(self.global_version_key, uuid.uuid4().hex, None)
+
+    def stats(self):
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': hits / total if total else 0.0,
+        }
+
+    def collect_metrics(self):
+        stats = self.stats()
+        return [
+            '# HELP image_api_list_cache_requests_total Image list cache lookups by result.',
+            '# TYPE image_api_list_cache_requests_total counter',
+            f'image_api_list_cache_requests_total{{result="hit"}} {stats["hits"]}',
+            f'image_api_list_cache_requests_total{{result="miss"}} {stats["misses"]}',
+        ]
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+
+image_list_cache = ImageListCache()
+registry.extra_collectors.append(image_list_cache.collect_metrics)
@@ -0,0 +1,138 @@
+"""
+Cold storage tier for originals that are rarely requested.
+
+The archive_cold_images command moves originals out of MEDIA_ROOT into
+IMAGE_COLD_STORAGE_ROOT, gzip-compressed with IMAGE_COLD_STORAGE_COMPRESS,
+and sets Image.archived_at. Thumbnails are never moved. Anything that needs
+an archived original calls rehydrate(), which restores the file to its
+original name, so storage names and signed links stay valid throughout.
+Originals are served through open_original(), which also covers a hot copy
+removed by the archiver while it is being opened.
+"""
+import gzip
+import logging
+import os
+import shutil
+import uuid
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.utils import timezone
+from django.utils._os import safe_join
+
+from .metrics import record_bytes, timed
+
+GZIP_SUFFIX = '.gz'
+
+
+def hot_path(name):
+    return safe_join(settings.MEDIA_ROOT, name)
+
+
+def cold_paths(name):
+    """
+    Return the possible cold paths of a storage name, the configured format first.
+    """
+    path = safe_join(settings.IMAGE_COLD_STORAGE_ROOT, name)
+    if settings.IMAGE_COLD_STORAGE_COMPRESS:
+        return [path + GZIP_SUFFIX, path]
+    return [path, path + GZIP_SUFFIX]
+
+
+def copy_file(source_path, target_path, compress_source=False, compress_target=False):
+    """
+    Copy a file via a temporary file in the target directory, so that the
+    target only ever appears complete.
+    """
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    temp_path = f'{target_path}.{uuid.uuid4().hex}.tmp'
+    try:
+        source = gzip.open(source_path, 'rb') if compress_source else open(source_path, 'rb')
+        with source, open(temp_path, 'wb') as target:
+            if compress_target:
+                with gzip.GzipFile(fileobj=target, mode='wb') as compressed:
+                    shutil.copyfileobj(source, compressed)
+            else:
+                shutil.copyfileobj(source, target)
+            target.flush()
+            os.fsync(target.fileno())
+        os.replace(temp_path, target_path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def archive_file(name):
+    """
+    Copy an original to the cold tier, leaving the hot copy in place. Returns the cold path.
+    """
+    target_path = cold_paths(name)[0]
+    copy_file(hot_path(name), target_path, compress_target=target_path.endswith(GZIP_SUFFIX))
+    return target_path
+
+
+def rehydrate(name):
+    """
+    Restore an archived original to MEDIA_ROOT. Returns whether the hot copy
+    exists afterwards. Concurrent calls for the same name are safe.
+    """
+    from .models import Image, ImageAccessStats
+    from .usage import upsert
+
+    try:
+        path = hot_path(name)
+    except SuspiciousFileOperation:
+        return False
+    if os.path.exists(path):
+        return True
+    for cold_path in cold_paths(name):
+        try:
+            with timed('storage_rehydrate'):
+                copy_file(cold_path, path, compress_source=cold_path.endswith(GZIP_SUFFIX))
+        except FileNotFoundError:
+            continue
+        record_bytes('storage_rehydrate', os.path.getsize(path))
+        image_ids = list(Image.objects.filter(image=name).values_list('pk', flat=True))
+        Image.objects.filter(pk__in=image_ids).update(archived_at=None)
+        # Count the access now rather than at the next counter flush, so the
+        # original is not archived again straight away.
+        now = timezone.now()
+        upsert(ImageAccessStats, 'image_id', ['original_views', 'thumbnail_views', 'egress_bytes'],
+               [(image_id, 0, 0, 0, now, now) for image_id in image_ids],
+               timestamps=['last_accessed', 'original_last_accessed'])
+        delete_archived(name)
+        return True
+    return os.path.exists(path)
+
+
+def open_original(name):
+    """
+    Open an original for reading, restoring it from cold storage when it has
+    been archived. The archiver may remove the hot copy between the check
+    and the open, in which case the original is restored and opened again.
+    Raises FileNotFoundError when it is in neither tier.
+    """
+    for _ in range(2):
+        if not rehydrate(name):
+            break
+        try:
+            return open(hot_path(name), 'rb')
+        except FileNotFoundError:
+            continue
+    raise FileNotFoundError(f'Original {name} not found.')
+
+
+def delete_archived(name):
+    """
+    Delete the cold copies of a storage name.
+    """
+    for cold_path in cold_paths(name):
+        try:
+            os.remove(cold_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.error(f"An error occurred while deleting {cold_path}: {e}")
@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.db import connections, router
+
+
+def configure_sqlite_connection(sender, connection, **kwargs):
+    """
+    Apply the SQLITE_PRAGMAS setting to every new SQLite connection.
+
+    WAL lets readers proceed while a writer holds the lock and busy_timeout
+    makes writers wait for each other instead of failing with
+    "database is locked", which is what several gunicorn workers sharing
+    one database file need.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {pragma} = {value}')
+
+
+def estimate_row_count(model):
+    """
+    Return a cheap estimate of the number of rows in a model's table, or None
+    when the database offers none. On PostgreSQL this is the planner's
+    statistic; on SQLite it is the largest primary key, which overcounts by
+    the number of deleted rows.
+    """
+    connection = connections[router.db_for_read(model)]
+    table = connection.ops.quote_name(model._meta.db_table)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [model._meta.db_table])
+        elif connection.vendor == 'sqlite' and model._meta.pk.get_internal_type() in ('AutoField', 'BigAutoField'):
+            cursor.execute(f'SELECT MAX({connection.ops.quote_name(model._meta.pk.column)}) FROM {table}')
+        else:
+            return None
+        row = cursor.fetchone()
+    if not row or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
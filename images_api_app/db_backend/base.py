@@ -0,0 +1,16 @@
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    SQLite backend that starts atomic blocks with BEGIN IMMEDIATE.
+
+    A deferred BEGIN only takes the write lock on the first write, and in WAL
+    mode that upgrade fails at once with "database is locked" when another
+    worker committed since the transaction's first read; the busy timeout
+    does not apply to it. Taking the write lock up front makes concurrent
+    writers queue on busy_timeout instead.
+    """
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE')
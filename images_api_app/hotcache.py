@@ -0,0 +1,251 @@
+"""
+In-memory cache of small rendition files, in front of thumbnail serving.
+
+By default every worker keeps its own LRU, bounded by total bytes, whose
+entries expire after IMAGE_HOT_CACHE_TIMEOUT so that a thumbnail re-rendered
+by another worker is not served stale for long. With
+IMAGE_HOT_CACHE_ARENA_PATH set the entries live in a memory-mapped file
+shared by all workers on the host instead, where an invalidation is seen by
+every worker at once.
+"""
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from .metrics import registry
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class LRUStore:
+    """
+    Per-process LRU of name -> bytes, bounded by the total size of the values.
+    """
+
+    def __init__(self, max_bytes, timeout):
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.size = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                return None
+            data, expires = entry
+            if expires < time.monotonic():
+                self._remove(name)
+                return None
+            self._entries.move_to_end(name)
+            return data
+
+    def set(self, name, data):
+        with self._lock:
+            self._remove(name)
+            self._entries[name] = (data, time.monotonic() + self.timeout)
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def delete(self, name):
+        with self._lock:
+            self._remove(name)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _remove(self, name):
+        entry = self._entries.pop(name, None)
+        if entry:
+            self.size -= len(entry[0])
+
+
+class MmapArena:
+    """
+    Direct-mapped slots in a memory-mapped file shared between processes.
+
+    A name maps to one slot, which holds the digest of the name, the data
+    length and the data. A new entry simply replaces whatever the slot held.
+    Writers take an fcntl lock on the slot and bump a sequence number to an
+    odd value while writing; readers need no lock and discard a read whose
+    sequence number was odd or changed underneath them.
+    """
+    header = struct.Struct('<Q16sI')
+
+    def __init__(self, path, slots, slot_size):
+        self.slots = slots
+        self.slot_size = slot_size
+        self.stride = self.header.size + slot_size
+        self.evictions = 0
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        length = slots * self.stride
+        if os.fstat(self.fd).st_size < length:
+            os.ftruncate(self.fd, length)
+        self.map = mmap.mmap(self.fd, length)
+
+    def _locate(self, name):
+        digest = hashlib.md5(name.encode()).digest()
+        return digest, (int.from_bytes(digest[:8], 'little') % self.slots) * self.stride
+
+    @contextmanager
+    def _locked(self, offset):
+        if fcntl:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX, self.stride, offset)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN, self.stride, offset)
+
+    def get(self, name):
+        digest, offset = self._locate(name)
+        sequence, slot_digest, length = self.header.unpack_from(self.map, offset)
+        if sequence & 1 or slot_digest != digest or length > self.slot_size:
+            return None
+        start = offset + self.header.size
+        data = self.map[start:start + length]
+        if self.header.unpack_from(self.map, offset)[0] != sequence:
+            return None
+        return data
+
+    def set(self, name, data):
+        digest, offset = self._locate(name)
+        with self._locked(offset):
+            sequence, slot_digest, length = self.header.unpack_from(self.map, offset)
+            if length and slot_digest != digest:
+                self.evictions += 1
+            self.header.pack_into(self.map, offset, sequence + 1, slot_digest, length)
+            start = offset + self.header.size
+            self.map[start:start + len(data)] = data
+            self.header.pack_into(self.map, offset, sequence + 2, digest, len(data))
+
+    def delete(self, name):
+        digest, offset = self._locate(name)
+        with self._locked(offset):
+            sequence, slot_digest, _ = self.header.unpack_from(self.map, offset)
+            if slot_digest == digest:
+                self.header.pack_into(self.map, offset, sequence + 2, bytes(16), 0)
+
+    def clear(self):
+        for index in range(self.slots):
+            offset = index * self.stride
+            with self._locked(offset):
+                sequence = self.header.unpack_from(self.map, offset)[0]
+                self.header.pack_into(self.map, offset, sequence + 2, bytes(16), 0)
+
+
+class RenditionCache:
+    """
+    Cache of rendition bytes keyed by storage name, with hit ratio statistics.
+    Files larger than IMAGE_HOT_CACHE_MAX_ITEM_BYTES are never cached.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._store = None
+        self._store_settings = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def store(self):
+        store_settings = (
+            settings.IMAGE_HOT_CACHE_MAX_BYTES, settings.IMAGE_HOT_CACHE_MAX_ITEM_BYTES,
+            settings.IMAGE_HOT_CACHE_TIMEOUT, settings.IMAGE_HOT_CACHE_ARENA_PATH,
+            settings.IMAGE_HOT_CACHE_ARENA_SLOTS,
+        )
+        with self._lock:
+            if self._store is None or self._store_settings != store_settings:
+                if settings.IMAGE_HOT_CACHE_ARENA_PATH:
+                    self._store = MmapArena(
+                        settings.IMAGE_HOT_CACHE_ARENA_PATH, settings.IMAGE_HOT_CACHE_ARENA_SLOTS,
+                        settings.IMAGE_HOT_CACHE_MAX_ITEM_BYTES)
+                else:
+                    self._store = LRUStore(settings.IMAGE_HOT_CACHE_MAX_BYTES, settings.IMAGE_HOT_CACHE_TIMEOUT)
+                self._store_settings = store_settings
+            return self._store
+
+    @property
+    def enabled(self):
+        return settings.IMAGE_HOT_CACHE_MAX_BYTES > 0
+
+    def cacheable(self, size):
+        return self.enabled and size <= settings.IMAGE_HOT_CACHE_MAX_ITEM_BYTES
+
+    def get(self, name):
+        data = self.store.get(name) if self.enabled else None
+        with self._lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return data
+
+    def set(self, name, data):
+        if self.cacheable(len(data)):
+            self.store.set(name, data)
+
+    def invalidate(self, name):
+        if name and self.enabled:
+            self.store.delete(name)
+
+    def clear(self):
+        self.store.clear()
+
+    def stats(self):
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        store = self.store
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': hits / total if total else 0.0,
+            'evictions': store.evictions,
+            'bytes': getattr(store, 'size', None),
+        }
+
+    def collect_metrics(self):
+        stats = self.stats()
+        lines = [
+            '# HELP image_api_rendition_cache_requests_total Rendition cache lookups by result.',
+            '# TYPE image_api_rendition_cache_requests_total counter',
+            f'image_api_rendition_cache_requests_total{{result="hit"}} {stats["hits"]}',
+            f'image_api_rendition_cache_requests_total{{result="miss"}} {stats["misses"]}',
+            '# HELP image_api_rendition_cache_evictions_total Rendition cache entries evicted for space.',
+            '# TYPE image_api_rendition_cache_evictions_total counter',
+            f'image_api_rendition_cache_evictions_total {stats["evictions"]}',
+        ]
+        if stats['bytes'] is not None:
+            lines += [
+                '# HELP image_api_rendition_cache_bytes Bytes held by the rendition cache.',
+                '# TYPE image_api_rendition_cache_bytes gauge',
+                f'image_api_rendition_cache_bytes {stats["bytes"]}',
+            ]
+        return lines
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+
+rendition_cache = RenditionCache()
+registry.extra_collectors.append(rendition_cache.collect_metrics)
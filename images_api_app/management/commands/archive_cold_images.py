@@ -0,0 +1,95 @@
+import logging
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from images_api_app.coldstorage import archive_file, delete_archived, hot_path
+from images_api_app.models import Image
+
+
+class Command(BaseCommand):
+    help = (
+        'Move originals that have not been requested for a number of days to '
+        'IMAGE_COLD_STORAGE_ROOT. Thumbnails stay in MEDIA_ROOT.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.IMAGE_COLD_STORAGE_AFTER_DAYS,
+            help='Archive originals neither uploaded nor requested within this many days.')
+        parser.add_argument('--batch-size', type=int, default=settings.IMAGE_RECLAIM_BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help='Only report the originals to archive.')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timezone.timedelta(days=options['days'])
+        images = self.cold_images(cutoff).order_by('pk').values_list('pk', 'image', 'file_size')
+
+        archived = 0
+        archived_bytes = 0
+        batch = []
+        for row in images.iterator(chunk_size=options['batch_size']):
+            if options['dry_run']:
+                archived += 1
+                archived_bytes += row[2]
+                continue
+            batch.append(row)
+            if len(batch) >= options['batch_size']:
+                count, size = self.archive_batch(batch, cutoff)
+                archived += count
+                archived_bytes += size
+                batch = []
+        if batch:
+            count, size = self.archive_batch(batch, cutoff)
+            archived += count
+            archived_bytes += size
+
+        action = 'Would archive' if options['dry_run'] else 'Archived'
+        self.stdout.write(f'{action} {archived} originals ({archived_bytes} bytes).')
+
+    def cold_images(self, cutoff):
+        # Images without access stats, or whose original has no access time,
+        # have not had their original served since the stats were added.
+        # Thumbnail requests do not keep an original hot.
+        return Image.objects.filter(archived_at__isnull=True, uploaded_at__lt=cutoff).filter(
+            Q(access_stats__isnull=True)
+            | Q(access_stats__original_last_accessed__isnull=True)
+            | Q(access_stats__original_last_accessed__lt=cutoff))
+
+    def archive_batch(self, batch, cutoff):
+        """
+        Copy the originals to cold storage, mark them archived in one update
+        and only remove the hot copies once that is committed, so a request
+        that finds a hot copy missing also finds the image archived. The
+        update re-checks the selection, so images deleted, or recorded as
+        served, since they were selected keep their hot copy.
+        """
+        copied = {}
+        for pk, name, size in batch:
+            try:
+                archive_file(name)
+            except OSError as e:
+                logging.error(f"An error occurred while archiving {name}: {e}")
+                continue
+            copied[pk] = (name, size)
+
+        archived_at = timezone.now()
+        with transaction.atomic():
+            self.cold_images(cutoff).filter(pk__in=list(copied)).update(archived_at=archived_at)
+            marked = set(
+                Image.objects.filter(pk__in=list(copied), archived_at=archived_at).values_list('pk', flat=True))
+
+        archived_bytes = 0
+        for pk, (name, size) in copied.items():
+            if pk not in marked:
+                delete_archived(name)
+                continue
+            try:
+                os.remove(hot_path(name))
+            except OSError as e:
+                logging.error(f"An error occurred while removing {name} after archiving it: {e}")
+            archived_bytes += size
+        return len(marked), archived_bytes
@@ -0,0 +1,99 @@
+import json
+import multiprocessing
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+def run_worker(path, pragmas, begin, operations, timeout):
+    """
+    Run a mixed read/write workload shaped like a list request followed by
+    an upload: read the user's images, then insert one inside a transaction.
+    """
+    connection = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+    for pragma, value in pragmas.items():
+        connection.execute(f'PRAGMA {pragma} = {value}')
+
+    latencies = []
+    lock_errors = 0
+    for i in range(operations):
+        start = time.perf_counter()
+        try:
+            connection.execute(begin)
+            connection.execute(
+                'SELECT id, name FROM image WHERE user_id = ? ORDER BY uploaded_at', (i % 10,)
+            ).fetchall()
+            connection.execute(
+                'INSERT INTO image (user_id, name, uploaded_at) VALUES (?, ?, ?)',
+                (i % 10, f'images/{os.getpid()}_{i}.png', time.time()))
+            connection.execute('COMMIT')
+        except sqlite3.OperationalError as e:
+            if 'locked' not in str(e) and 'busy' not in str(e):
+                raise
+            lock_errors += 1
+            if connection.in_transaction:
+                connection.execute('ROLLBACK')
+        latencies.append(time.perf_counter() - start)
+    connection.close()
+    return latencies, lock_errors
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare SQLite lock errors and latency of the default configuration and the tuned '
+        'one (SQLITE_PRAGMAS and BEGIN IMMEDIATE) under concurrent writers.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--operations', type=int, default=200)
+        parser.add_argument(
+            '--timeout', type=float, default=5.0,
+            help='sqlite3 connect timeout in seconds, 5 is the Django default.')
+
+    def handle(self, *args, **options):
+        results = {
+            'workers': options['workers'],
+            'operations_per_worker': options['operations'],
+            'runs': {
+                'default': self.run(options, {}, 'BEGIN'),
+                'tuned': self.run(options, settings.SQLITE_PRAGMAS, 'BEGIN IMMEDIATE'),
+            },
+        }
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def run(self, options, pragmas, begin):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'benchmark.sqlite3')
+            connection = sqlite3.connect(path)
+            connection.execute(
+                'CREATE TABLE image (id INTEGER PRIMARY KEY, user_id INTEGER, '
+                'name TEXT, uploaded_at REAL)')
+            connection.execute('CREATE INDEX image_user_uploaded ON image (user_id, uploaded_at)')
+            connection.commit()
+            connection.close()
+
+            args = [(path, pragmas, begin, options['operations'], options['timeout'])] * options['workers']
+            start = time.perf_counter()
+            with multiprocessing.Pool(options['workers']) as pool:
+                worker_results = pool.starmap(run_worker, args)
+            elapsed = time.perf_counter() - start
+
+        latencies = sorted(latency for result in worker_results for latency in result[0])
+        return {
+            'pragmas': pragmas,
+            'begin': begin,
+            'lock_errors': sum(result[1] for result in worker_results),
+            'elapsed_s': round(elapsed, 4),
+            'latency_ms': {
+                'mean': round(statistics.mean(latencies) * 1000, 3),
+                'p50': round(latencies[len(latencies) // 2] * 1000, 3),
+                'p95': round(latencies[int(len(latencies) * 0.95)] * 1000, 3),
+                'max': round(latencies[-1] * 1000, 3),
+            },
+        }
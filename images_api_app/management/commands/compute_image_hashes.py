@@ -0,0 +1,47 @@
+import logging
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from images_api_app.models import Image
+from images_api_app.similarity import dhash_file, similarity_indexes, to_signed
+
+
+class Command(BaseCommand):
+    help = (
+        'Compute the perceptual hash of images stored before hashing was added '
+        'or whose thumbnails have not been rendered yet.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.IMAGE_EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        images = Image.objects.filter(phash__isnull=True).only('pk', 'user_id', 'image').order_by('pk')
+        batch = []
+        users = set()
+        hashed = 0
+        failed = 0
+        for image in images.iterator(chunk_size=options['batch_size']):
+            try:
+                image.phash = to_signed(dhash_file(image.image))
+            except Exception as e:
+                logging.error(f"An error occurred while hashing {image.image.name}: {e}")
+                failed += 1
+                continue
+            batch.append(image)
+            users.add(image.user_id)
+            if len(batch) >= options['batch_size']:
+                hashed += self.flush(batch)
+        hashed += self.flush(batch)
+
+        for user_id in users:
+            similarity_indexes.invalidate_user(user_id)
+        self.stdout.write(f'Hashed {hashed} images, {failed} failed.')
+
+    def flush(self, batch):
+        count = len(batch)
+        if batch:
+            Image.objects.bulk_update(batch, ['phash'])
+            batch.clear()
+        return count
@@ -0,0 +1,101 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a fresh interpreter: times Django set-up and preload() separately,
+# then forks a stand-in worker that runs a full collection, as a worker
+# eventually will, and reports how much memory the fork stopped sharing.
+CHILD = '''
+import gc, json, os, sys, time
+
+def rss():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+def private_dirty(pid):
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                if line.startswith('Private_Dirty:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+
+start = time.perf_counter()
+gc.disable()
+from django.core.wsgi import get_wsgi_application
+get_wsgi_application()
+setup = time.perf_counter()
+result = {'setup': setup - start, 'setup_rss': rss(),
+          'imaging_at_setup': any(name in sys.modules for name in ('PIL.Image', 'numpy'))}
+from images_api_app.startup import preload
+preload()
+result.update(preload=time.perf_counter() - setup, preload_rss=rss())
+
+read_fd, write_fd = os.pipe()
+pid = os.fork()
+if pid == 0:
+    os.close(read_fd)
+    gc.collect()
+    os.write(write_fd, b'1')
+    time.sleep(60)
+    os._exit(0)
+os.close(write_fd)
+os.read(read_fd, 1)
+result['worker_private'] = private_dirty(pid)
+os.kill(pid, 9)
+os.waitpid(pid, 0)
+print(json.dumps(result))
+'''
+
+METRICS = [
+    ('setup', 'Django set-up', 's'),
+    ('preload', 'preload()', 's'),
+    ('setup_rss', 'RSS after set-up', 'MB'),
+    ('preload_rss', 'RSS after preload()', 'MB'),
+    ('worker_private', 'Private memory of a forked worker after gc', 'MB'),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure start-up time and memory of a WSGI process in fresh interpreters, '
+        'as imported by gunicorn --preload.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5, help='Number of interpreters to start.')
+        parser.add_argument('--json', action='store_true', help='Print the raw measurements as JSON.')
+
+    def handle(self, *args, **options):
+        if not os.path.exists('/proc/self/statm'):
+            raise CommandError('Memory is read from /proc, which this platform does not have.')
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get(
+            'DJANGO_SETTINGS_MODULE', 'image_hosting_api.settings'))
+        runs = []
+        for _ in range(options['repeat']):
+            completed = subprocess.run(
+                [sys.executable, '-c', CHILD], cwd=settings.BASE_DIR, env=env,
+                capture_output=True, text=True)
+            if completed.returncode:
+                raise CommandError(f'Start-up failed:\n{completed.stderr}')
+            runs.append(json.loads(completed.stdout.splitlines()[-1]))
+
+        if options['json']:
+            self.stdout.write(json.dumps(runs))
+            return
+        self.stdout.write(f'Median of {len(runs)} runs, IMAGE_PRELOAD_IMAGING={settings.IMAGE_PRELOAD_IMAGING}')
+        for key, label, unit in METRICS:
+            values = [run[key] for run in runs if run[key] is not None]
+            if not values:
+                continue
+            value = statistics.median(values)
+            formatted = f'{value:.3f} s' if unit == 's' else f'{value / 1024 / 1024:.1f} MB'
+            self.stdout.write(f'{label}: {formatted}')
+        imaging = any(run['imaging_at_setup'] for run in runs)
+        self.stdout.write(f'PIL or NumPy imported during set-up: {"yes" if imaging else "no"}')
@@ -0,0 +1,99 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from images_api_app.models import Image, ImageThumbnail, StorageUsage
+
+
+def stat_file(name):
+    try:
+        return default_storage.size(name)
+    except OSError as e:
+        logging.error(f"An error occurred while reading the size of {name}: {e}")
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Correct stored file sizes from storage and rebuild the per-user storage '
+        'usage counters from them.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Number of threads reading file sizes.')
+        parser.add_argument('--chunk-size', type=int, default=settings.IMAGE_EXPORT_CHUNK_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without correcting it.')
+
+    def handle(self, *args, **options):
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            images = self.fix_file_sizes(
+                executor, Image.objects.filter(archived_at__isnull=True).only('pk', 'image', 'file_size'),
+                'image', options)
+            thumbnails = self.fix_file_sizes(
+                executor, ImageThumbnail.objects.exclude(thumbnail='').only('pk', 'thumbnail', 'file_size'),
+                'thumbnail', options)
+        users = self.fix_totals(options['dry_run'])
+
+        action = 'Found' if options['dry_run'] else 'Corrected'
+        self.stdout.write(
+            f'{action} {images} image sizes, {thumbnails} thumbnail sizes and {users} user totals.')
+
+    def fix_file_sizes(self, executor, queryset, field, options):
+        """
+        Compare file_size with the size in storage, reading sizes in parallel
+        one chunk of rows at a time, and return the number of rows that differ.
+        """
+        drifted = 0
+        chunk = []
+        for row in queryset.order_by('pk').iterator(chunk_size=options['chunk_size']):
+            chunk.append(row)
+            if len(chunk) >= options['chunk_size']:
+                drifted += self.fix_chunk(executor, chunk, field, options['dry_run'])
+                chunk = []
+        if chunk:
+            drifted += self.fix_chunk(executor, chunk, field, options['dry_run'])
+        return drifted
+
+    def fix_chunk(self, executor, rows, field, dry_run):
+        names = [getattr(row, field).name for row in rows]
+        changed = []
+        for row, size in zip(rows, executor.map(stat_file, names)):
+            if size is not None and size != row.file_size:
+                row.file_size = size
+                changed.append(row)
+        if changed and not dry_run:
+            type(rows[0]).objects.bulk_update(changed, ['file_size'])
+        return len(changed)
+
+    def fix_totals(self, dry_run):
+        """
+        Recompute every user's usage from the stored file sizes and return the
+        number of users whose counters were wrong. Runs in one transaction so
+        uploads committed meanwhile are not counted twice or lost.
+        """
+        with transaction.atomic():
+            totals = {}
+            for user_id, size, files in Image.objects.values_list('user_id').annotate(
+                    Sum('file_size'), Count('pk')).order_by():
+                totals[user_id] = [size or 0, files]
+            thumbnails = ImageThumbnail.objects.exclude(thumbnail='').exclude(thumbnail__isnull=True)
+            for user_id, size, files in thumbnails.values_list('image__user_id').annotate(
+                    Sum('file_size'), Count('pk')).order_by():
+                total = totals.setdefault(user_id, [0, 0])
+                total[0] += size or 0
+                total[1] += files
+
+            current = {user_id: [size, files] for user_id, size, files in
+                       StorageUsage.objects.values_list('user_id', 'bytes', 'files')}
+            wrong = {user_id for user_id in totals.keys() | current.keys()
+                     if totals.get(user_id, [0, 0]) != current.get(user_id, [0, 0])}
+            if wrong and not dry_run:
+                for user_id in wrong:
+                    size, files = totals.get(user_id, [0, 0])
+                    StorageUsage.objects.update_or_create(user_id=user_id, defaults={'bytes': size, 'files': files})
+        return len(wrong)
@@ -0,0 +1,83 @@
+import json
+import platform
+import shutil
+import subprocess
+import tempfile
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from images_api_app.benchmarks import run_all
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark_caches():
+    """
+    Per-process memory caches in place of every configured cache, so a run
+    neither reads nor fills the caches the workers share.
+    """
+    return {
+        alias: {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': f'benchmarks-{alias}',
+            'OPTIONS': config.get('OPTIONS', {}),
+        }
+        for alias, config in settings.CACHES.items()
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark upload, list, thumbnail and serve hot paths against a throwaway database, '
+        'media directory and caches, and print the results as JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--width', type=int, default=1920)
+        parser.add_argument('--height', type=int, default=1080)
+        parser.add_argument('--uploads', type=int, default=20)
+        parser.add_argument('--library-sizes', type=int, nargs='+', default=[10, 100])
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--serve-requests', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the JSON results to this file instead of stdout.')
+
+    def handle(self, *args, **options):
+        media_root = tempfile.mkdtemp()
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, serialize=False)
+        try:
+            with override_settings(
+                    MEDIA_ROOT=media_root, IMAGE_TASKS_EAGER=True, CACHES=benchmark_caches(),
+                    IMAGE_HOT_CACHE_ARENA_PATH=None):
+                results = run_all(
+                    width=options['width'], height=options['height'], uploads=options['uploads'],
+                    library_sizes=options['library_sizes'], repeat=options['repeat'],
+                    serve_requests=options['serve_requests'], seed=options['seed'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            shutil.rmtree(media_root, ignore_errors=True)
+
+        results['environment'] = {
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'platform': platform.platform(),
+        }
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
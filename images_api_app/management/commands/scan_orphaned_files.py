@@ -0,0 +1,73 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from images_api_app.models import Image, ImageThumbnail
+from images_api_app.tasks import reclaim_files
+
+
+def iter_media_files(root):
+    """
+    Yield (relative name, entry) for every file under root, using os.scandir so
+    that file type and stat information come from the directory listing.
+    """
+    stack = ['']
+    while stack:
+        relative_dir = stack.pop()
+        with os.scandir(os.path.join(root, relative_dir)) as entries:
+            for entry in entries:
+                name = f'{relative_dir}/{entry.name}' if relative_dir else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(name)
+                elif entry.is_file(follow_symlinks=False):
+                    yield name, entry
+
+
+class Command(BaseCommand):
+    help = (
+        'Find files under MEDIA_ROOT, other than sprite sheets, that no image or thumbnail references, '
+        'and optionally delete them.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delete', action='store_true', help='Delete the orphaned files.')
+        parser.add_argument(
+            '--min-age', type=int, default=3600,
+            help='Ignore files modified less than this many seconds ago, e.g. uploads in progress.')
+        parser.add_argument('--batch-size', type=int, default=settings.IMAGE_RECLAIM_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        referenced = set(Image.objects.values_list('image', flat=True).iterator())
+        referenced.update(ImageThumbnail.objects.values_list('thumbnail', flat=True).iterator())
+
+        if not os.path.isdir(settings.MEDIA_ROOT):
+            self.stdout.write('MEDIA_ROOT does not exist, nothing to scan.')
+            return
+
+        # Sprite sheets are referenced from the cache, and deleted with their versions and users.
+        sprite_prefix = f'{settings.IMAGE_SPRITE_DIRECTORY}/'
+        cutoff = time.time() - options['min_age']
+        batch = []
+        orphaned_files = 0
+        orphaned_bytes = 0
+        for name, entry in iter_media_files(settings.MEDIA_ROOT):
+            if name in referenced or name.startswith(sprite_prefix):
+                continue
+            stat = entry.stat(follow_symlinks=False)
+            if stat.st_mtime > cutoff:
+                continue
+            orphaned_files += 1
+            orphaned_bytes += stat.st_size
+            if options['verbosity'] > 1:
+                self.stdout.write(name)
+            if options['delete']:
+                batch.append(name)
+                if len(batch) >= options['batch_size']:
+                    reclaim_files(batch)
+                    batch = []
+        if batch:
+            reclaim_files(batch)
+
+        action = 'Deleted' if options['delete'] else 'Found'
+        self.stdout.write(f'{action} {orphaned_files} orphaned files ({orphaned_bytes} bytes).')
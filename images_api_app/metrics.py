@@ -0,0 +1,227 @@
+import bisect
+import contextvars
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections
+
+
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250)
+
+_current_timings = contextvars.ContextVar('request_timings', default=None)
+_collected_timings = contextvars.ContextVar('collected_timings', default=None)
+
+
+class Histogram:
+
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series['buckets'][index] += 1
+        series['sum'] += value
+        series['count'] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for key, series in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series['buckets']):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{format_labels(key + (("le", bound),))} {cumulative}')
+            lines.append(f'{self.name}_bucket{format_labels(key + (("le", "+Inf"),))} {series["count"]}')
+            lines.append(f'{self.name}_sum{format_labels(key)} {series["sum"]}')
+            lines.append(f'{self.name}_count{format_labels(key)} {series["count"]}')
+        return lines
+
+
+class Counter:
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self.series = defaultdict(float)
+
+    def inc(self, value=1, **labels):
+        self.series[tuple(sorted(labels.items()))] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        for key, value in sorted(self.series.items()):
+            lines.append(f'{self.name}{format_labels(key)} {value}')
+        return lines
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels) + '}'
+
+
+def add_process_label(line, pid):
+    """
+    Add a pid label to a sample line of the text exposition format.
+    """
+    if line.startswith('#'):
+        return line
+    series, _, value = line.rpartition(' ')
+    if series.endswith('}'):
+        return f'{series[:-1]},pid="{pid}"}} {value}'
+    return f'{series}{{pid="{pid}"}} {value}'
+
+
+class Registry:
+    """
+    Process-wide metrics, rendered in the Prometheus text exposition format.
+    Every worker process keeps its own, so each sample is labelled with the
+    pid of the worker that rendered it. A scrape reaches a single worker;
+    totals over all workers are sums over the pid label of each worker's
+    latest scrape.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.request_duration = Histogram(
+            'image_api_request_duration_seconds', 'Time spent handling a request.', DURATION_BUCKETS)
+        self.request_queries = Histogram(
+            'image_api_request_db_queries', 'Database queries executed per request.', COUNT_BUCKETS)
+        self.phase_duration = Histogram(
+            'image_api_phase_duration_seconds',
+            'Time spent in a phase (db, pil_decode, pil_encode, storage_read, storage_write, serialize).',
+            DURATION_BUCKETS)
+        self.storage_bytes = Counter('image_api_storage_bytes_total', 'Bytes read from or written to storage.')
+        self.extra_collectors = []
+
+    def render(self):
+        with self.lock:
+            lines = []
+            for metric in (self.request_duration, self.request_queries, self.phase_duration, self.storage_bytes):
+                lines.extend(metric.render())
+        for collector in self.extra_collectors:
+            lines.extend(collector())
+        pid = os.getpid()
+        return '\n'.join(add_process_label(line, pid) for line in lines) + '\n'
+
+
+registry = Registry()
+
+
+class RequestTimings:
+
+    def __init__(self):
+        self.durations = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.bytes = defaultdict(int)
+
+    def server_timing(self, total):
+        entries = []
+        for phase, duration in self.durations.items():
+            description = f'{self.counts[phase]}x'
+            if self.bytes.get(phase):
+                description += f' {self.bytes[phase]}B'
+            entries.append(f'{phase};dur={duration * 1000:.2f};desc="{description}"')
+        entries.append(f'total;dur={total * 1000:.2f}')
+        return ', '.join(entries)
+
+
+def record(phase, duration):
+    collected = _collected_timings.get()
+    if collected is not None:
+        collected.append((phase, duration))
+        return
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.durations[phase] += duration
+        timings.counts[phase] += 1
+    with registry.lock:
+        registry.phase_duration.observe(duration, phase=phase)
+
+
+def record_bytes(phase, size):
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.bytes[phase] += size
+    with registry.lock:
+        registry.storage_bytes.inc(size, direction=phase)
+
+
+@contextmanager
+def timed(phase):
+    """
+    Time the enclosed block as the given phase of the current request.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(phase, time.perf_counter() - start)
+
+
+@contextmanager
+def collect_timings():
+    """
+    Collect the (phase, duration) pairs timed in the enclosed block into the
+    returned list instead of recording them. Used in render processes, where
+    taking the registry lock inherited from the parent could deadlock; the
+    parent records the pairs with record_timings.
+    """
+    collected = []
+    token = _collected_timings.set(collected)
+    try:
+        yield collected
+    finally:
+        _collected_timings.reset(token)
+
+
+def record_timings(collected):
+    for phase, duration in collected:
+        record(phase, duration)
+
+
+def time_query(execute, sql, params, many, context):
+    with timed('db'):
+        return execute(sql, params, many, context)
+
+
+class PerformanceMiddleware:
+    """
+    Record a per-request timing breakdown, returned to the client as a
+    Server-Timing header and aggregated into the metrics endpoint.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = RequestTimings()
+        token = _current_timings.set(timings)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(time_query))
+                response = self.get_response(request)
+        finally:
+            _current_timings.reset(token)
+        total = time.perf_counter() - start
+
+        match = request.resolver_match
+        view = match.url_name if match and match.url_name else 'unmatched'
+        with registry.lock:
+            registry.request_duration.observe(total, view=view)
+            registry.request_queries.observe(timings.counts['db'], view=view)
+        response['Server-Timing'] = timings.server_timing(total)
+        return response
@@ -1,26 +1,41 @@
 import os
 import logging
-from io import BytesIO
+import threading
+from collections import defaultdict
+from functools import wraps
 
-from django.db import models
+from django.db import models, transaction
 from django.core.exceptions import ValidationError
-from django.core.files import File
+from django.core.files.base import ContentFile
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.contrib.auth.models import User
 from django.dispatch import receiver
-from django.db.models.signals import post_save
-from PIL import Image as PILImage
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
 
+from .cache import image_list_cache
+from .coldstorage import rehydrate
+from .hotcache import rendition_cache
+from .quota import adjust_storage_usage
+from .metrics import record_bytes, timed
+from .rendering import check_upload_limits, render_thumbnail
+from .similarity import dhash_bytes, similarity_indexes, to_signed
+from .sprites import sprite_sheets
+from .tasks import enqueue, render_thumbnails, schedule_file_reclamation
 from .utils import generate_signed_url, is_valid_file_extension
 
 
-logging.basicConfig(filename='image_api_app.log', level=logging.ERROR)
-
-
 class ThumbnailSize(models.Model):
+    """
+    Thumbnails fit in a height x height box, or with crop_width are cropped
+    to exactly crop_width x height around the image's most salient part.
+    Existing thumbnails are not re-rendered when crop_width changes.
+    """
     height = models.PositiveIntegerField(unique=True)
+    crop_width = models.PositiveIntegerField(null=True, blank=True, validators=[MinValueValidator(1)])
 
     def __str__(self):
+        if self.crop_width:
+            return f"{self.crop_width}x{self.height}px"
         return f"{self.height}px"
 
 
@@ -29,6 +44,12 @@ class AccountTier(models.Model):
     thumbnail_sizes = models.ManyToManyField(ThumbnailSize, blank=True)
     allow_original_link = models.BooleanField(default=False)
     allow_expiring_link = models.BooleanField(default=False)
+    requests_per_second = models.PositiveIntegerField(null=True, blank=True)
+    concurrent_uploads = models.PositiveIntegerField(null=True, blank=True)
+    upload_bytes_per_day = models.PositiveBigIntegerField(null=True, blank=True)
+    renders_per_minute = models.PositiveIntegerField(null=True, blank=True)
+    retain_metadata = models.BooleanField(default=False)
+    storage_quota_bytes = models.PositiveBigIntegerField(null=True, blank=True)
 
     def __str__(self):
         return self.name
@@ -56,40 +77,92 @@ def validate_file_extension(value):
         raise ValidationError('Unsupported file extension.')
 
 
+def validate_image_limits(value):
+    if not value._committed:
+        check_upload_limits(value.file)
+
+
 class Image(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
-    image = models.ImageField(upload_to='images/', validators=[validate_file_extension])
+    # Indexed for the lookups by storage name in usage flushes, rehydration and file reclamation.
+    image = models.ImageField(
+        upload_to='images/', validators=[validate_file_extension, validate_image_limits], db_index=True)
     thumbnails = models.ManyToManyField(ThumbnailSize, through='ImageThumbnail')
     expiring_image_link = models.CharField(max_length=2000, null=True, blank=True)
     expiry_time = models.IntegerField(
         default=300, validators=[MinValueValidator(300), MaxValueValidator(30000)])
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    ingest_saved_bytes = models.PositiveBigIntegerField(default=0)
+    phash = models.BigIntegerField(null=True, blank=True, editable=False)
+    file_size = models.PositiveBigIntegerField(default=0, editable=False)
+    archived_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'uploaded_at']),
+            models.Index(fields=['uploaded_at']),
+        ]
 
     def save(self, *args, **kwargs):
         if kwargs.get('update_fields') is None or 'expiring_image_link' not in kwargs['update_fields']:
             self.full_clean()
-        super().save(*args, **kwargs)
+        if self._state.adding and not self.file_size and self.image:
+            self.file_size = self.image.size
+        # The post_save receivers, including storage accounting, run in the same transaction.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
-    def get_thumbnail(self, thumbnail_size):
+    def get_thumbnail(self, thumbnail_size, before_render=None):
+        """
+        Return the URL of the thumbnail, rendering it when missing. When
+        before_render returns False the render is queued in the background
+        instead and None is returned.
+        """
+        thumbnail, _ = self.ensure_thumbnail(thumbnail_size, before_render)
+        return thumbnail.thumbnail.url if thumbnail and thumbnail.thumbnail else None
+
+    def ensure_thumbnail(self, thumbnail_size, before_render=None):
+        """
+        Render the thumbnail when it is missing, see get_thumbnail. Return the
+        ImageThumbnail, or None when rendering failed, and whether a new
+        thumbnail file was stored.
+        """
         thumbnail_size_instance, _ = ThumbnailSize.objects.get_or_create(height=thumbnail_size)
         thumbnail, created = ImageThumbnail.objects.get_or_create(
             image=self, thumbnail_size=thumbnail_size_instance)
 
         if created or not thumbnail.thumbnail:
+            if before_render and not before_render():
+                enqueue(render_thumbnails, [self.pk], [thumbnail_size])
+                return thumbnail, False
             try:
-                with PILImage.open(self.image.file) as image:
-                    size = thumbnail_size
-                    image.thumbnail((size, size))
-                    thumb_io = BytesIO()
-                    image.save(thumb_io, format=image.format)
-                    thumb_filename = f'{os.path.splitext(self.image.name)[0]}_{size}.png'
+                if self.archived_at and not rehydrate(self.image.name):
+                    raise FileNotFoundError(f'Archived original {self.image.name} is missing.')
+                thumb_data = render_thumbnail(self.image, thumbnail_size, thumbnail_size_instance.crop_width)
+                thumb_filename = f'{os.path.splitext(self.image.name)[0]}_{thumbnail_size}.png'
+                record_bytes('storage_write', len(thumb_data))
+                with timed('storage_write'), transaction.atomic():
+                    thumbnail.file_size = len(thumb_data)
                     thumbnail.thumbnail.save(
-                        thumb_filename, File(thumb_io), save=True)
+                        thumb_filename, ContentFile(thumb_data), save=True)
+                    adjust_storage_usage(self.user_id, len(thumb_data), 1)
+                # A crop hashes differently from the whole image, which the duplicate search compares.
+                if self.phash is None and not thumbnail_size_instance.crop_width:
+                    self.set_phash(dhash_bytes(thumb_data))
             except Exception as e:
                 logging.error(f"An error occurred while opening the image: {e}")
-                return None
+                return None, False
+            return thumbnail, True
 
-        return thumbnail.thumbnail.url if thumbnail and thumbnail.thumbnail else None
+        return thumbnail, False
+
+    def set_phash(self, value):
+        """
+        Store the unsigned perceptual hash without running the save signals.
+        """
+        self.phash = to_signed(value)
+        Image.objects.filter(pk=self.pk).update(phash=self.phash)
+        similarity_indexes.add(self.user_id, self.pk, self.phash)
 
     def create_expiring_link(self):
         signed_url = generate_signed_url(self.image.url, self.expiry_time)
@@ -112,4 +185,280 @@ def get_thumbnail_upload_path(instance, filename):
 class ImageThumbnail(models.Model):
     image = models.ForeignKey(Image, on_delete=models.CASCADE, related_name='image_thumbnails')
     thumbnail_size = models.ForeignKey(ThumbnailSize, on_delete=models.CASCADE)
-    thumbnail = models.ImageField(upload_to=get_thumbnail_upload_path, null=True, blank=True)
+    thumbnail = models.ImageField(upload_to=get_thumbnail_upload_path, null=True, blank=True, db_index=True)
+    file_size = models.PositiveBigIntegerField(default=0, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['image', 'thumbnail_size'], name='unique_image_thumbnail_size'),
+        ]
+
+
+class ImageChange(models.Model):
+    """
+    Append-only log of changes to a user's images. The primary key is the
+    cursor clients pass to the changes feed. image_id is not a foreign key so
+    that deletions stay in the log after the image row is gone.
+
+    Thumbnails rendered lazily while serializing are not logged, since the
+    response that triggered them already contains them; background renders
+    that store a new thumbnail file are.
+    """
+    CREATED = 'created'
+    DELETED = 'deleted'
+    RENDERED = 'rendered'
+    ACTION_CHOICES = [(CREATED, 'Created'), (DELETED, 'Deleted'), (RENDERED, 'Rendered')]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='image_changes')
+    image_id = models.BigIntegerField()
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id']),
+        ]
+
+
+class ImageAccessStats(models.Model):
+    """
+    Requests served for an image's original and thumbnails, written in bulk
+    by images_api_app.usage rather than on every request. Originals are
+    archived by original_last_accessed, which thumbnail requests leave alone.
+    """
+    image = models.OneToOneField(Image, on_delete=models.CASCADE, primary_key=True, related_name='access_stats')
+    original_views = models.PositiveBigIntegerField(default=0)
+    thumbnail_views = models.PositiveBigIntegerField(default=0)
+    egress_bytes = models.PositiveBigIntegerField(default=0)
+    last_accessed = models.DateTimeField(null=True, blank=True, db_index=True)
+    original_last_accessed = models.DateTimeField(null=True, blank=True, db_index=True)
+
+
+class UserUsageStats(models.Model):
+    """
+    Requests served for, and bytes sent of, all files of a user's images.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='usage_stats')
+    requests = models.PositiveBigIntegerField(default=0)
+    egress_bytes = models.PositiveBigIntegerField(default=0)
+    last_accessed = models.DateTimeField(null=True, blank=True)
+
+
+class StorageUsage(models.Model):
+    """
+    Bytes and number of files (originals and thumbnails) a user has stored,
+    maintained by images_api_app.quota.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='storage_usage')
+    bytes = models.BigIntegerField(default=0)
+    files = models.BigIntegerField(default=0)
+
+
+class RevokedToken(models.Model):
+    """
+    Bearer tokens revoked before they expire, by token id, see
+    images_api_app.authentication. Rows are kept until expires_at.
+    """
+    jti = models.CharField(max_length=32, primary_key=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+
+_bulk_deletion = threading.local()
+
+
+def skip_in_bulk_deletion(func):
+    """
+    Skip a post_delete receiver while delete_images() deletes a batch, which
+    does the receiver's work once for the whole batch instead.
+    """
+    @wraps(func)
+    def wrapper(sender, instance, **kwargs):
+        if kwargs.get('signal') is post_delete and getattr(_bulk_deletion, 'active', False):
+            return
+        return func(sender, instance, **kwargs)
+    return wrapper
+
+
+def delete_images(images):
+    """
+    Delete a queryset of images and their thumbnails. The change log, storage
+    usage, caches and file reclamation are updated once per batch rather than
+    by the per-instance receivers. Returns the ids of the deleted images.
+    """
+    rows = list(images.values_list('pk', 'user_id', 'image', 'file_size'))
+    if not rows:
+        return set()
+    ids = {pk for pk, _, _, _ in rows}
+    thumbnails = list(ImageThumbnail.objects.filter(image_id__in=ids).values_list(
+        'image__user_id', 'thumbnail', 'file_size'))
+
+    _bulk_deletion.active = True
+    try:
+        with transaction.atomic():
+            Image.objects.filter(pk__in=ids).delete()
+            ImageChange.objects.bulk_create([
+                ImageChange(user_id=user_id, image_id=pk, action=ImageChange.DELETED)
+                for pk, user_id, _, _ in rows
+            ])
+            usage = defaultdict(lambda: [0, 0])
+            for _, user_id, _, size in rows:
+                usage[user_id][0] -= size
+                usage[user_id][1] -= 1
+            for user_id, name, size in thumbnails:
+                if name:
+                    usage[user_id][0] -= size
+                    usage[user_id][1] -= 1
+            for user_id, (size, files) in usage.items():
+                adjust_storage_usage(user_id, size, files)
+            schedule_file_reclamation(
+                [name for _, _, name, _ in rows] + [name for _, name, _ in thumbnails])
+    finally:
+        _bulk_deletion.active = False
+
+    for user_id in usage:
+        image_list_cache.invalidate_user(user_id)
+        similarity_indexes.invalidate_user(user_id)
+        sprite_sheets.invalidate_user(user_id)
+    for _, name, _ in thumbnails:
+        rendition_cache.invalidate(name)
+    return ids
+
+
+_deleting_users = threading.local()
+
+
+def is_user_being_deleted(user_id):
+    """
+    Return whether the user is being deleted in this thread. The user's rows
+    in other tables may already be gone, so receivers must not recreate them.
+    """
+    return user_id in getattr(_deleting_users, 'ids', ())
+
+
+@receiver(pre_delete, sender=User)
+def mark_user_deleting(sender, instance, **kwargs):
+    _deleting_users.ids = getattr(_deleting_users, 'ids', frozenset()) | {instance.pk}
+
+
+@receiver(post_delete, sender=User)
+def unmark_user_deleting(sender, instance, **kwargs):
+    _deleting_users.ids = getattr(_deleting_users, 'ids', frozenset()) - {instance.pk}
+
+
+@receiver(post_save, sender=Image)
+def log_image_created(sender, instance, created, **kwargs):
+    if created:
+        ImageChange.objects.create(user_id=instance.user_id, image_id=instance.pk, action=ImageChange.CREATED)
+
+
+@receiver(post_delete, sender=Image)
+@skip_in_bulk_deletion
+def log_image_deleted(sender, instance, **kwargs):
+    if is_user_being_deleted(instance.user_id):
+        return
+    ImageChange.objects.create(user_id=instance.user_id, image_id=instance.pk, action=ImageChange.DELETED)
+
+
+@receiver(post_save, sender=Image)
+@receiver(post_delete, sender=Image)
+@skip_in_bulk_deletion
+def invalidate_image_list_for_image(sender, instance, **kwargs):
+    image_list_cache.invalidate_user(instance.user_id)
+
+
+@receiver(post_delete, sender=Image)
+@skip_in_bulk_deletion
+def invalidate_similarity_index(sender, instance, **kwargs):
+    # New images have no hash yet, set_phash adds them to the index once they do.
+    similarity_indexes.invalidate_user(instance.user_id)
+
+
+@receiver(post_save, sender=ImageThumbnail)
+@receiver(post_delete, sender=ImageThumbnail)
+@skip_in_bulk_deletion
+def invalidate_image_list_for_thumbnail(sender, instance, **kwargs):
+    # Pages listing a deferred render as missing are cached until its file is stored.
+    if kwargs['signal'] is post_save and not instance.thumbnail:
+        return
+    user_id = Image.objects.filter(pk=instance.image_id).values_list('user_id', flat=True).first()
+    if user_id is not None:
+        image_list_cache.invalidate_user(user_id)
+
+
+@receiver(post_save, sender=Image)
+@receiver(post_delete, sender=Image)
+@skip_in_bulk_deletion
+def invalidate_sprite_sheets_for_image(sender, instance, created=False, **kwargs):
+    # Saving only the expiring link leaves the thumbnails unchanged.
+    if created or kwargs['signal'] is post_delete:
+        sprite_sheets.invalidate_user(instance.user_id)
+
+
+@receiver(post_save, sender=ImageThumbnail)
+@receiver(post_delete, sender=ImageThumbnail)
+@skip_in_bulk_deletion
+def invalidate_sprite_sheets_for_thumbnail(sender, instance, **kwargs):
+    user_id = Image.objects.filter(pk=instance.image_id).values_list('user_id', flat=True).first()
+    if user_id is not None:
+        sprite_sheets.invalidate_user(user_id)
+
+
+@receiver(post_delete, sender=User)
+def delete_sprite_sheets_for_user(sender, instance, **kwargs):
+    sprite_sheets.delete_user(instance.pk)
+
+
+@receiver(post_save, sender=ImageThumbnail)
+@receiver(post_delete, sender=ImageThumbnail)
+@skip_in_bulk_deletion
+def invalidate_rendition_cache(sender, instance, **kwargs):
+    rendition_cache.invalidate(instance.thumbnail.name)
+
+
+@receiver(post_save, sender=Image)
+def count_image_storage(sender, instance, created, **kwargs):
+    if created:
+        adjust_storage_usage(instance.user_id, instance.file_size, 1)
+
+
+@receiver(post_delete, sender=Image)
+@skip_in_bulk_deletion
+def uncount_image_storage(sender, instance, **kwargs):
+    if not is_user_being_deleted(instance.user_id):
+        adjust_storage_usage(instance.user_id, -instance.file_size, -1)
+
+
+@receiver(post_delete, sender=ImageThumbnail)
+@skip_in_bulk_deletion
+def uncount_thumbnail_storage(sender, instance, **kwargs):
+    if instance.thumbnail:
+        user_id = Image.objects.filter(pk=instance.image_id).values_list('user_id', flat=True).first()
+        if user_id is not None and not is_user_being_deleted(user_id):
+            adjust_storage_usage(user_id, -instance.file_size, -1)
+
+
+@receiver(post_delete, sender=Image)
+@skip_in_bulk_deletion
+def reclaim_image_file(sender, instance, **kwargs):
+    schedule_file_reclamation([instance.image.name])
+
+
+@receiver(post_delete, sender=ImageThumbnail)
+@skip_in_bulk_deletion
+def reclaim_thumbnail_file(sender, instance, **kwargs):
+    schedule_file_reclamation([instance.thumbnail.name])
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def invalidate_image_list_for_profile(sender, instance, **kwargs):
+    image_list_cache.invalidate_user(instance.user_id)
+
+
+@receiver(post_save, sender=AccountTier)
+@receiver(post_delete, sender=AccountTier)
+@receiver(m2m_changed, sender=AccountTier.thumbnail_sizes.through)
+@receiver(post_save, sender=ThumbnailSize)
+@receiver(post_delete, sender=ThumbnailSize)
+def invalidate_image_list_for_tiers(sender, **kwargs):
+    image_list_cache.invalidate_all()
@@ -0,0 +1,118 @@
+"""
+Ingest pipeline run once on every upload, before the original is stored.
+
+Each stage inspects or transforms an IngestState. The file is only re-encoded
+when a stage asks for it, and optional re-encodes are kept only when the
+result is smaller than the upload. PIL is imported on first use.
+"""
+import logging
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+from .metrics import timed
+from .rendering import check_image_limits
+
+
+EXIF_ORIENTATION = 0x0112
+
+STAGES = {}
+
+
+def stage(func):
+    STAGES[func.__name__] = func
+    return func
+
+
+class IngestState:
+
+    def __init__(self, image, size, account_tier):
+        self.image = image
+        self.format = image.format
+        self.size = size
+        self.account_tier = account_tier
+        self.quality = settings.IMAGE_INGEST_JPEG_QUALITY
+        self.required = False
+        self.optional = False
+
+    def save_options(self):
+        options = {}
+        if self.format == 'JPEG':
+            options['quality'] = self.quality
+            for key in ('exif', 'icc_profile'):
+                if self.image.info.get(key):
+                    options[key] = self.image.info[key]
+        elif self.format == 'PNG':
+            options['optimize'] = True
+        return options
+
+
+@stage
+def auto_orient(state):
+    """
+    Apply the EXIF orientation to the pixels so every consumer sees the image upright.
+    """
+    from PIL import ImageOps
+
+    if state.image.getexif().get(EXIF_ORIENTATION, 1) != 1:
+        state.image = ImageOps.exif_transpose(state.image)
+        state.required = True
+
+
+@stage
+def strip_metadata(state):
+    """
+    Drop EXIF (and, with IMAGE_INGEST_STRIP_ICC, the ICC profile) unless the
+    account tier retains metadata.
+    """
+    if state.account_tier and state.account_tier.retain_metadata:
+        return
+    keys = ['exif', 'icc_profile'] if settings.IMAGE_INGEST_STRIP_ICC else ['exif']
+    for key in keys:
+        if state.image.info.pop(key, None):
+            state.optional = True
+
+
+@stage
+def recompress(state):
+    """
+    Re-encode originals larger than IMAGE_INGEST_MAX_BYTES at IMAGE_INGEST_RECOMPRESS_QUALITY.
+    """
+    if state.size > settings.IMAGE_INGEST_MAX_BYTES:
+        state.quality = settings.IMAGE_INGEST_RECOMPRESS_QUALITY
+        state.optional = True
+
+
+def ingest_upload(uploaded_file, account_tier=None):
+    """
+    Run the IMAGE_INGEST_STAGES on an uploaded image.
+
+    Return the file to store, which is the upload itself when nothing changed,
+    and the number of bytes saved compared to the upload.
+    """
+    from PIL import Image as PILImage
+
+    with timed('ingest'):
+        data = uploaded_file.read()
+        uploaded_file.seek(0)
+        try:
+            image = PILImage.open(BytesIO(data))
+            check_image_limits(image)
+            if getattr(image, 'is_animated', False):
+                return uploaded_file, 0
+            state = IngestState(image, len(data), account_tier)
+            for name in settings.IMAGE_INGEST_STAGES:
+                STAGES[name](state)
+            if not state.required and not state.optional:
+                return uploaded_file, 0
+
+            output = BytesIO()
+            state.image.save(output, format=state.format, **state.save_options())
+        except Exception as e:
+            logging.error(f"An error occurred while ingesting {uploaded_file.name}: {e}")
+            return uploaded_file, 0
+
+        if not state.required and output.tell() >= len(data):
+            return uploaded_file, 0
+        return ContentFile(output.getvalue(), name=uploaded_file.name), max(0, len(data) - output.tell())
@@ -0,0 +1,73 @@
+"""
+Per-user storage accounting and tier storage quotas.
+
+StorageUsage holds the bytes and number of files (originals and thumbnails)
+each user has stored. The counters are adjusted in the same transaction that
+creates or deletes a file's row, so they never need a scan of storage; the
+reconcile_storage_usage command repairs any drift.
+"""
+from django.db.models import F
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .throttling import get_account_tier
+
+
+class StorageQuotaExceeded(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Storage quota exceeded.'
+    default_code = 'storage_quota_exceeded'
+
+
+def adjust_storage_usage(user_id, size, files):
+    """
+    Add size bytes and files files (negative to subtract) to a user's usage.
+    """
+    from .models import StorageUsage
+
+    if not size and not files:
+        return
+    updated = StorageUsage.objects.filter(user_id=user_id).update(
+        bytes=F('bytes') + size, files=F('files') + files)
+    if not updated:
+        StorageUsage.objects.get_or_create(user_id=user_id)
+        StorageUsage.objects.filter(user_id=user_id).update(bytes=F('bytes') + size, files=F('files') + files)
+
+
+def get_storage_usage(user_id):
+    """
+    Return (bytes, files) stored by a user.
+    """
+    from .models import StorageUsage
+
+    usage = StorageUsage.objects.filter(user_id=user_id).values_list('bytes', 'files').first()
+    return usage or (0, 0)
+
+
+def check_storage_quota(user, size):
+    """
+    Raise StorageQuotaExceeded when storing size more bytes would take the
+    user over the tier's storage quota. Staff and tiers without a quota are
+    not limited.
+    """
+    tier = get_account_tier(user)
+    if not tier or tier.storage_quota_bytes is None:
+        return
+    used_bytes, _ = get_storage_usage(user.pk)
+    if used_bytes + size > tier.storage_quota_bytes:
+        raise StorageQuotaExceeded(
+            f'Storage quota exceeded: {used_bytes} of {tier.storage_quota_bytes} bytes used.')
+
+
+class StorageQuotaMixin:
+    """
+    Refuse uploads that would exceed the tier's storage quota, judged by the
+    request's Content-Length, before the request body is read.
+    """
+
+    def get_incoming_bytes(self, request):
+        return int(request.META.get('CONTENT_LENGTH') or 0)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        check_storage_quota(request.user, self.get_incoming_bytes(request))
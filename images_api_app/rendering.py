@@ -0,0 +1,292 @@
+"""
+Thumbnail rendering with guards against decompression bombs.
+
+Image headers are checked against IMAGE_MAX_PIXELS and IMAGE_MAX_DECODE_BYTES
+before any pixel data is decoded. With IMAGE_RENDER_IN_SUBPROCESS rendering
+runs in a child process with an address space limit and a timeout, so a
+runaway decode is killed without taking the web worker down with it. The
+child sends its phase timings back with the thumbnail, and the worker
+records them. Children are forked from a forkserver by default, not from
+the multithreaded worker, whose locks they could inherit in a held state.
+
+Thumbnail sizes with a crop width are rendered at exactly that width and
+their height, cropped around the most salient part of the image, see
+images_api_app.smartcrop.
+
+PIL is imported by the functions that decode images, so web workers only
+load it once they render or validate an image.
+"""
+import math
+import multiprocessing
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+
+from .metrics import collect_timings, record_timings, timed
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# Imported once by the forkserver, so that render processes forked from it start with them loaded.
+RENDER_PRELOAD_MODULES = ['images_api_app.rendering', 'images_api_app.smartcrop', 'PIL.Image', 'PIL.ImageOps']
+
+
+class RenderError(Exception):
+    pass
+
+
+def check_image_limits(image, max_pixels=None, max_decode_bytes=None):
+    """
+    Raise ValidationError when an opened (not yet decoded) image is too large.
+    """
+    max_pixels = max_pixels or settings.IMAGE_MAX_PIXELS
+    max_decode_bytes = max_decode_bytes or settings.IMAGE_MAX_DECODE_BYTES
+    width, height = image.size
+    pixels = width * height
+    if pixels > max_pixels:
+        raise ValidationError(f'Image is too large ({width}x{height} pixels).')
+    # Pillow stores multi-band and 32-bit modes with four bytes per pixel.
+    bytes_per_pixel = 1 if image.mode in ('1', 'L', 'P') else 4
+    if pixels * bytes_per_pixel > max_decode_bytes:
+        raise ValidationError(f'Image is too large to decode ({width}x{height} {image.mode}).')
+
+
+def check_upload_limits(uploaded_file, require_image=False):
+    """
+    Check an uploaded file's image header against the limits. Files that are
+    not images are left to the other validators, unless require_image is set.
+    """
+    from PIL import Image as PILImage, UnidentifiedImageError
+
+    uploaded_file.seek(0)
+    try:
+        with PILImage.open(uploaded_file) as image:
+            check_image_limits(image)
+    except PILImage.DecompressionBombError as e:
+        raise ValidationError(str(e))
+    except UnidentifiedImageError:
+        if require_image:
+            raise ValidationError('Upload a valid image.')
+    finally:
+        uploaded_file.seek(0)
+
+
+def get_render_options():
+    """
+    Collect the settings the renderer needs, so that they can be passed to a child process.
+    """
+    return {
+        'max_pixels': settings.IMAGE_MAX_PIXELS,
+        'max_decode_bytes': settings.IMAGE_MAX_DECODE_BYTES,
+        'frame': settings.IMAGE_THUMBNAIL_FRAME,
+        'animated': settings.IMAGE_ANIMATED_THUMBNAILS,
+        'animated_max_frames': settings.IMAGE_ANIMATED_MAX_FRAMES,
+        'animated_max_pixels': settings.IMAGE_ANIMATED_MAX_PIXELS,
+        'crop_proxy_size': settings.IMAGE_SMART_CROP_PROXY_SIZE,
+    }
+
+
+def select_frame(image, frame):
+    """
+    Seek a multi-frame image to the thumbnail frame, falling back to the first
+    frame when the image has fewer frames. Frame 0 needs no seeking at all, so
+    the other frames are never decoded.
+    """
+    if not frame or not getattr(image, 'is_animated', False):
+        return
+    try:
+        image.seek(frame)
+    except EOFError:
+        image.seek(0)
+
+
+def convert_palette(image):
+    if image.mode == 'P':
+        # Resizing palette images falls back to nearest neighbour sampling.
+        return image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+    return image
+
+
+def render_frame(image, size):
+    from PIL import ImageOps
+
+    image = convert_palette(image)
+    with timed('pil_decode'):
+        image.thumbnail((size, size))
+        # Originals stored before the ingest pipeline may still rely on EXIF orientation.
+        return ImageOps.exif_transpose(image)
+
+
+def draft_for_crop(image, width, height):
+    """
+    Let JPEG images decode at a reduced scale, as Image.thumbnail does, while
+    the widest possible crop of the width / height aspect still covers
+    width x height pixels. Must be called before the image is loaded.
+    """
+    if image.getexif().get(0x0112) in (5, 6, 7, 8):
+        # The crop is chosen after transposing, so swap the aspect of the stored pixels.
+        width, height = height, width
+    # A crop spans the image along at least one side.
+    crop_width = min(image.width, image.height * width / height)
+    scale = width / crop_width
+    if scale < 1:
+        image.draft(image.mode, (math.ceil(image.width * scale), math.ceil(image.height * scale)))
+
+
+def render_cropped(image, width, height, proxy_size):
+    """
+    Crop the image to the width / height aspect around its most salient part
+    and scale the crop down to width x height. Smaller crops are not enlarged.
+    """
+    from PIL import Image as PILImage, ImageOps
+
+    from .smartcrop import smart_crop_box
+
+    draft_for_crop(image, width, height)
+    image = convert_palette(image)
+    with timed('pil_decode'):
+        # The crop window depends on orientation, so transpose before choosing it.
+        if image.getexif().get(0x0112):
+            image = ImageOps.exif_transpose(image)
+        box = smart_crop_box(image, width / height, proxy_size)
+        cropped = image.crop(box)
+        if cropped.width > width:
+            cropped = cropped.resize((width, height), PILImage.LANCZOS, reducing_gap=3.0)
+        return cropped
+
+
+def render_animated(image, size, image_format, options):
+    """
+    Render up to animated_max_frames frames, stopping early once the decoded
+    pixels would exceed animated_max_pixels. Returns None for still images.
+    """
+    from PIL import ImageSequence
+
+    frame_pixels = image.size[0] * image.size[1]
+    frames = []
+    durations = []
+    for index, frame in enumerate(ImageSequence.Iterator(image)):
+        if index >= options['animated_max_frames'] or (index + 1) * frame_pixels > options['animated_max_pixels']:
+            break
+        durations.append(frame.info.get('duration', 100))
+        frames.append(render_frame(frame.convert('RGBA'), size))
+    if len(frames) < 2:
+        return None
+    output = BytesIO()
+    with timed('pil_encode'):
+        frames[0].save(
+            output, format=image_format, save_all=True, append_images=frames[1:], duration=durations,
+            loop=image.info.get('loop', 0), disposal=2)
+    return output.getvalue()
+
+
+def render_thumbnail_bytes(source, size, options=None, crop_width=None):
+    """
+    Render an image file path or bytes into a thumbnail fitting size x size,
+    or smart-cropped to crop_width x size, encoded in the source format.
+    Multi-frame images are rendered from the IMAGE_THUMBNAIL_FRAME frame, or
+    as an animation with IMAGE_ANIMATED_THUMBNAILS unless cropped.
+    """
+    from PIL import Image as PILImage
+
+    options = options or get_render_options()
+    if isinstance(source, bytes):
+        source = BytesIO(source)
+    with PILImage.open(source) as image:
+        check_image_limits(image, options['max_pixels'], options['max_decode_bytes'])
+        image_format = image.format
+        if options['animated'] and not crop_width and getattr(image, 'is_animated', False):
+            animated = render_animated(image, size, image_format, options)
+            if animated:
+                return animated
+            image.seek(0)
+        select_frame(image, options['frame'])
+        if crop_width:
+            thumbnail = render_cropped(image, crop_width, size, options['crop_proxy_size'])
+        else:
+            thumbnail = render_frame(image, size)
+        output = BytesIO()
+        with timed('pil_encode'):
+            thumbnail.save(output, format=image_format)
+        return output.getvalue()
+
+
+def current_address_space():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+def render_child(connection, source, size, options, memory_limit, crop_width=None):
+    """
+    Render in a child process and send back the result with the phase timings,
+    which are collected rather than recorded, see collect_timings.
+    """
+    with collect_timings() as timings:
+        try:
+            address_space = current_address_space()
+            if resource and memory_limit and address_space:
+                limit = address_space + memory_limit
+                resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+            result = ('ok', render_thumbnail_bytes(source, size, options, crop_width))
+        except BaseException as e:
+            result = ('error', f'{type(e).__name__}: {e}')
+    try:
+        connection.send(result + (timings,))
+    finally:
+        connection.close()
+
+
+def get_render_context():
+    context = multiprocessing.get_context(settings.IMAGE_RENDER_START_METHOD)
+    if settings.IMAGE_RENDER_START_METHOD == 'forkserver':
+        # Takes effect when the server starts, on the first render of the process.
+        context.set_forkserver_preload(RENDER_PRELOAD_MODULES)
+    return context
+
+
+def render_in_subprocess(source, size, crop_width=None):
+    context = get_render_context()
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=render_child, args=(
+        sender, source, size, get_render_options(), settings.IMAGE_RENDER_MEMORY_LIMIT, crop_width))
+    process.start()
+    sender.close()
+    try:
+        if not receiver.poll(settings.IMAGE_RENDER_TIMEOUT):
+            raise RenderError(f'Rendering took longer than {settings.IMAGE_RENDER_TIMEOUT} seconds.')
+        status, result, timings = receiver.recv()
+    except EOFError:
+        raise RenderError('Renderer process exited without a result.')
+    finally:
+        receiver.close()
+        if process.is_alive():
+            process.kill()
+        process.join()
+    record_timings(timings)
+    if status != 'ok':
+        raise RenderError(result)
+    return result
+
+
+def render_thumbnail(image_file, size, crop_width=None):
+    """
+    Render a thumbnail of a stored image file, in a resource-limited
+    subprocess when IMAGE_RENDER_IN_SUBPROCESS is set.
+    """
+    try:
+        source = image_file.path
+    except NotImplementedError:
+        image_file.open('rb')
+        source = image_file.read()
+    if settings.IMAGE_RENDER_IN_SUBPROCESS:
+        with timed('render_subprocess'):
+            return render_in_subprocess(source, size, crop_width)
+    return render_thumbnail_bytes(source, size, crop_width=crop_width)
@@ -1,9 +1,48 @@
+from functools import partial
+
+from django.urls import reverse
 from rest_framework import serializers, fields
 
+from .metrics import timed
 from .models import AccountTier, Image, ThumbnailSize, UserProfile
+from .throttling import take_render_quota
 from .utils import get_expiring_image_link
 
 
+def get_allowed_thumbnail_sizes(user):
+    """
+    Return the thumbnail heights available to the user, or None when the user
+    has no account tier assigned.
+    """
+    if user.is_staff:
+        return list(ThumbnailSize.objects.values_list('height', flat=True))
+    if hasattr(user, 'userprofile') and user.userprofile.account_tier:
+        if user.userprofile.account_tier.name == 'Basic':
+            return [200]
+        if user.userprofile.account_tier.name in ['Premium', 'Enterprise']:
+            return [200, 400]
+        return []
+    return None
+
+
+def is_original_allowed(user):
+    """
+    Return whether the user may access original images.
+    """
+    if user and hasattr(user, 'userprofile') and user.userprofile.account_tier:
+        return user.userprofile.account_tier.name in ['Premium', 'Enterprise']
+    return False
+
+
+def get_render_check(request):
+    """
+    Return a callable taking a render from the requesting user's quota, to be
+    run before a missing thumbnail is rendered.
+    """
+    user = request.user if request else None
+    return partial(take_render_quota, user) if user else None
+
+
 class AccountTierSerializer(serializers.ModelSerializer):
     class Meta:
         model = AccountTier
@@ -28,9 +67,7 @@ class ThumbnailField(fields.Field):
     """
     def to_representation(self, value):
         size = int(self.field_name.split('_')[-1])
-        request = self.context.get('request')
-        image_url = value.get_thumbnail(size)
-        return request.build_absolute_uri(image_url) if request and image_url else image_url
+        return self.parent.get_thumbnail_url(value, size)
 
 
 class ImageSerializer(serializers.ModelSerializer):
@@ -49,17 +86,11 @@ class ImageSerializer(serializers.ModelSerializer):
     class Meta:
         model = Image
         fields = '__all__'
+        read_only_fields = ['ingest_saved_bytes', 'phash']
 
     def handle_user(self, user):
-        allowed_sizes = []
-        if user.is_staff:
-            allowed_sizes = ThumbnailSize.objects.values_list('height', flat=True)
-        elif hasattr(user, 'userprofile') and user.userprofile.account_tier:
-            if user.userprofile.account_tier.name == 'Basic':
-                allowed_sizes = [200]
-            elif user.userprofile.account_tier.name in ['Premium', 'Enterprise']:
-                allowed_sizes = [200, 400]
-        else:
+        allowed_sizes = get_allowed_thumbnail_sizes(user)
+        if allowed_sizes is None:
             raise serializers.ValidationError("Account tier not assigned to user.")
 
         if not ThumbnailSize.objects.filter(height__in=allowed_sizes).exists():
@@ -71,18 +102,28 @@ class ImageSerializer(serializers.ModelSerializer):
             self.fields[f'thumbnail_{size}'] = ThumbnailField(read_only=True, source='*')
 
     def get_thumbnail_url(self, obj, size):
+        """
+        Return the absolute thumbnail URL, rendering a missing thumbnail unless
+        the 'render' context flag is False, in which case only thumbnails
+        among obj.image_thumbnails are returned.
+        """
         request = self.context.get('request')
-        thumbnail_url = obj.get_thumbnail(size)
+        if self.context.get('render', True):
+            thumbnail_url = obj.get_thumbnail(size, before_render=get_render_check(request))
+        else:
+            thumbnail_url = next((
+                thumbnail.thumbnail.url for thumbnail in obj.image_thumbnails.all()
+                if thumbnail.thumbnail_size.height == size and thumbnail.thumbnail
+            ), None)
         return request.build_absolute_uri(thumbnail_url) if request and thumbnail_url else thumbnail_url
 
     def get_image(self, obj):
         request = self.context.get('request')
         user = request.user if request else None
-        if user and hasattr(user, 'userprofile') and user.userprofile.account_tier:
-            account_tier_name = user.userprofile.account_tier.name
-            if account_tier_name in ['Premium', 'Enterprise']:
-                image_url = obj.image.url
-                return request.build_absolute_uri(image_url) if request else image_url
+        if is_original_allowed(user):
+            # Originals may be in cold storage, which the media URL does not reach.
+            image_url = reverse('original_image', args=[obj.pk])
+            return request.build_absolute_uri(image_url) if request else image_url
         return None
 
     def get_expiring_image_link(self, obj):
@@ -90,19 +131,12 @@ class ImageSerializer(serializers.ModelSerializer):
         return get_expiring_image_link(request, obj)
 
     def to_representation(self, instance):
-        rep = super().to_representation(instance)
-        request = self.context.get('request')
-        user = request.user if request else None
-        account_tier = 'Basic'
-        if user and hasattr(user, 'userprofile') and user.userprofile.account_tier:
-            account_tier = user.userprofile.account_tier.name
-
-        if account_tier in ['Basic', 'Premium', 'Enterprise']:
-            rep['thumbnail_200'] = self.get_thumbnail_url(instance, 200)
-
-        if account_tier in ['Premium', 'Enterprise']:
-            rep['thumbnail_400'] = self.get_thumbnail_url(instance, 400)
+        with timed('serialize'):
+            return self.build_representation(instance)
 
+    def build_representation(self, instance):
+        # The thumbnail_<size> fields added by handle_user render any missing thumbnails.
+        rep = super().to_representation(instance)
         thumbnails = instance.image_thumbnails.all()
         rep['thumbnails'] = [thumbnail.thumbnail_size.height for thumbnail in thumbnails]
         return rep
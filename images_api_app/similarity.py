@@ -0,0 +1,269 @@
+"""
+Perceptual hashes and a per-user index for finding near-duplicate images.
+
+Every image gets a 64-bit difference hash (dHash) of its first rendered
+thumbnail. Re-encoded or resized copies of a photo hash to values a few bits
+apart, so similar images are found by Hamming distance. The hashes of a
+user's images are kept in memory as a packed uint64 array and compared in
+one vectorized pass.
+
+NumPy and PIL are imported where they are used, so processes that never
+hash or search do not load them.
+"""
+import threading
+import uuid
+from collections import OrderedDict
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .cache import cache_lock
+from .rendering import check_image_limits
+
+HASH_SIZE = 8
+
+M1 = 0x5555555555555555
+M2 = 0x3333333333333333
+M4 = 0x0f0f0f0f0f0f0f0f
+H01 = 0x0101010101010101
+
+
+def dhash(image):
+    """
+    Return the 64-bit difference hash of a PIL image: one bit per horizontally
+    adjacent pixel pair of a 9x8 grayscale reduction, set when brightness increases.
+    """
+    import numpy as np
+    from PIL import Image as PILImage
+
+    reduced = image.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), PILImage.BOX)
+    pixels = np.asarray(reduced, dtype=np.int16)
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def dhash_bytes(data):
+    from PIL import Image as PILImage
+
+    with PILImage.open(BytesIO(data)) as image:
+        return dhash(image)
+
+
+def dhash_file(image_file):
+    """
+    Hash a stored original. JPEGs are decoded at a reduced scale.
+    """
+    from PIL import Image as PILImage
+
+    image_file.open('rb')
+    try:
+        with PILImage.open(image_file) as image:
+            check_image_limits(image)
+            image.draft('L', (HASH_SIZE * 8, HASH_SIZE * 8))
+            return dhash(image)
+    finally:
+        image_file.close()
+
+
+def to_signed(value):
+    """
+    Map an unsigned 64-bit hash onto the signed range a BigIntegerField stores.
+    """
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def to_unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+def popcount(values):
+    """
+    Count the set bits of every element of a uint64 array.
+    """
+    import numpy as np
+
+    m1, m2, m4, h01 = np.uint64(M1), np.uint64(M2), np.uint64(M4), np.uint64(H01)
+    values = values - ((values >> np.uint64(1)) & m1)
+    values = (values & m2) + ((values >> np.uint64(2)) & m2)
+    values = (values + (values >> np.uint64(4))) & m4
+    return (values * h01) >> np.uint64(56)
+
+
+class SimilarityIndex:
+    """
+    Image ids and their hashes as parallel NumPy arrays.
+    """
+
+    def __init__(self, ids, hashes):
+        import numpy as np
+
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.hashes = np.asarray(hashes, dtype=np.int64).view(np.uint64)
+
+    @classmethod
+    def for_user(cls, user_id):
+        from .models import Image
+
+        rows = Image.objects.filter(user_id=user_id, phash__isnull=False).values_list('pk', 'phash')
+        ids = []
+        hashes = []
+        for pk, phash in rows.iterator(chunk_size=settings.IMAGE_EXPORT_CHUNK_SIZE):
+            ids.append(pk)
+            hashes.append(phash)
+        return cls(ids, hashes)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def with_hashes(self, pairs):
+        """
+        Return a copy of the index with the (image id, signed hash) pairs added,
+        replacing the hashes of ids already present. The copy leaves searches
+        running on this index undisturbed.
+        """
+        import numpy as np
+
+        ids = self.ids.copy()
+        hashes = self.hashes.view(np.int64).copy()
+        added_ids = []
+        added_hashes = []
+        for pk, phash in dict(pairs).items():
+            position = np.flatnonzero(ids == pk)
+            if len(position):
+                hashes[position[0]] = phash
+            else:
+                added_ids.append(pk)
+                added_hashes.append(phash)
+        return SimilarityIndex(np.append(ids, added_ids), np.append(hashes, np.asarray(added_hashes, np.int64)))
+
+    def search(self, phash, max_distance, limit=None, exclude=None):
+        """
+        Return (image id, distance) pairs within max_distance bits of an
+        unsigned hash, closest first.
+        """
+        import numpy as np
+
+        distances = popcount(self.hashes ^ np.uint64(phash))
+        matches = np.flatnonzero(distances <= max_distance)
+        if exclude is not None:
+            matches = matches[self.ids[matches] != exclude]
+        matches = matches[np.argsort(distances[matches], kind='stable')]
+        if limit is not None:
+            matches = matches[:limit]
+        return [(int(self.ids[i]), int(distances[i])) for i in matches]
+
+
+class SimilarityIndexCache:
+    """
+    The most recently used users' indexes, kept per process. Each index is
+    stored with the user's version token from the shared cache, so a deletion
+    in any worker makes the others rebuild the index on their next lookup.
+    Hashes set under a version are numbered entries in the shared cache, which
+    every process adds to its copy of the index instead of rebuilding it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._indexes = OrderedDict()
+
+    @property
+    def backend(self):
+        return caches[settings.IMAGE_LIST_CACHE_ALIAS]
+
+    def version_key(self, user_id):
+        return f'similarity:version:{user_id}'
+
+    def added_key(self, user_id, version, number=None):
+        key = f'similarity:added:{user_id}:{version}'
+        return key if number is None else f'{key}:{number}'
+
+    def _get_version(self, user_id):
+        key = self.version_key(user_id)
+        version = self.backend.get(key)
+        if version is None:
+            self.backend.add(key, uuid.uuid4().hex, None)
+            version = self.backend.get(key)
+        return version
+
+    def _get_added(self, user_id, version, start, end):
+        """
+        Return the hashes numbered start + 1 to end under version, or None when
+        some of them have expired or are not stored yet.
+        """
+        keys = [self.added_key(user_id, version, number) for number in range(start + 1, end + 1)]
+        entries = self.backend.get_many(keys)
+        if len(entries) < len(keys):
+            return None
+        return [entries[key] for key in keys]
+
+    def get(self, user_id):
+        version = self._get_version(user_id)
+        count = self.backend.get(self.added_key(user_id, version)) or 0
+        with self._lock:
+            cached = self._indexes.get(user_id)
+        # A counter lower than the cached one was evicted and restarted, so its numbers are reused.
+        if cached and cached[0] == version and cached[1] <= count:
+            added = self._get_added(user_id, version, cached[1], count)
+            if added is not None:
+                index = cached[2].with_hashes(added) if added else cached[2]
+                self._store(user_id, version, count, index)
+                return index
+
+        # Hashes numbered up to count are in the rows read now; later ones are added on a later lookup.
+        index = SimilarityIndex.for_user(user_id)
+        self._store(user_id, version, count, index)
+        return index
+
+    def _store(self, user_id, version, count, index):
+        with self._lock:
+            self._indexes[user_id] = (version, count, index)
+            self._indexes.move_to_end(user_id)
+            while len(self._indexes) > settings.IMAGE_SIMILARITY_INDEX_USERS:
+                self._indexes.popitem(last=False)
+
+    def add(self, user_id, image_id, phash):
+        """
+        Record a new or changed signed hash of one of the user's images.
+        """
+        version = self._get_version(user_id)
+        key = self.added_key(user_id, version)
+        # incr is a get and a set outside the memory and memcached backends,
+        # so without the lock concurrent adds could take the same number.
+        with cache_lock(self.backend, key) as locked:
+            if locked:
+                self.backend.add(key, 0, None)
+                try:
+                    number = self.backend.incr(key)
+                except ValueError:
+                    # The counter was evicted between add and incr.
+                    locked = False
+                else:
+                    self.backend.set(self.added_key(user_id, version, number), (image_id, phash))
+        if not locked:
+            self.invalidate_user(user_id)
+
+    def invalidate_user(self, user_id):
+        self.backend.set(self.version_key(user_id), uuid.uuid4().hex, None)
+        with self._lock:
+            self._indexes.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+
+
+similarity_indexes = SimilarityIndexCache()
+
+
+def find_similar_images(image, max_distance=None, limit=None):
+    """
+    Return (image id, distance) pairs for the owner's other images whose hash
+    is within max_distance bits of the image's, closest first.
+    """
+    if image.phash is None:
+        return []
+    if max_distance is None:
+        max_distance = settings.IMAGE_SIMILARITY_MAX_DISTANCE
+    index = similarity_indexes.get(image.user_id)
+    return index.search(to_unsigned(image.phash), max_distance, limit=limit, exclude=image.pk)
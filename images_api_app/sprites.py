@@ -0,0 +1,212 @@
+"""
+Sprite sheets of a user's thumbnails for gallery grids.
+
+A sheet packs the existing renditions of up to IMAGE_SPRITE_MAX_IMAGES
+images at one height into rows at most IMAGE_SPRITE_MAX_WIDTH pixels wide,
+together with a map of each image's box in the sheet, so a page of
+thumbnails costs one image request. Sheets are built in the background and
+written to storage under IMAGE_SPRITE_DIRECTORY; the cache only holds each
+sheet's storage name and map, under a key that contains a per-user version
+token. The token is replaced whenever one of the user's images or
+thumbnails changes, which makes every sheet of that user unreachable, and
+the unreachable files are deleted in the background, as are all of a
+user's sheets when the user is deleted. Thumbnails that have not been
+rendered yet are left out and reported as missing.
+"""
+import hashlib
+import logging
+import uuid
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from .hotcache import rendition_cache
+from .metrics import timed
+from .tasks import enqueue
+
+
+class SpriteSheetCache:
+
+    @property
+    def backend(self):
+        return caches[settings.IMAGE_SPRITE_CACHE_ALIAS]
+
+    def version_key(self, user_id):
+        return f'sprite:version:{user_id}'
+
+    def get_version(self, user_id):
+        version = self.backend.get(self.version_key(user_id))
+        if version is None:
+            self.backend.add(self.version_key(user_id), uuid.uuid4().hex, None)
+            version = self.backend.get(self.version_key(user_id))
+        return version
+
+    def token(self, user_id, height, image_ids):
+        """
+        Return the token naming the sheet of image_ids at height under the user's current version.
+        """
+        digest = hashlib.md5(f'{height}:{",".join(map(str, image_ids))}'.encode()).hexdigest()
+        return f'{self.get_version(user_id)}{digest}'
+
+    def key(self, user_id, token):
+        return f'sprite:sheet:{user_id}:{token}'
+
+    def get(self, user_id, token):
+        """
+        Return a cached sheet, or None when it is missing or from an earlier version.
+        """
+        if not token.startswith(self.get_version(user_id)):
+            return None
+        return self.backend.get(self.key(user_id, token))
+
+    def set(self, user_id, token, sheet):
+        self.backend.set(self.key(user_id, token), sheet, settings.IMAGE_SPRITE_CACHE_TIMEOUT)
+
+    def claim(self, user_id, token):
+        """
+        Return whether the caller should build the sheet, i.e. no build of it is in progress.
+        """
+        return self.backend.add(
+            f'{self.key(user_id, token)}:building', True, settings.IMAGE_SPRITE_BUILD_TIMEOUT)
+
+    def release(self, user_id, token):
+        self.backend.delete(f'{self.key(user_id, token)}:building')
+
+    def stored_key(self, user_id):
+        return f'sprite:stored:{user_id}'
+
+    def invalidate_user(self, user_id):
+        """
+        Make the user's sheets unreachable and delete their files in the
+        background, when any were stored since the last invalidation.
+        """
+        self.backend.set(self.version_key(user_id), uuid.uuid4().hex, None)
+        if self.backend.get(self.stored_key(user_id)):
+            self.backend.delete(self.stored_key(user_id))
+            enqueue(self.prune_files, user_id)
+
+    def delete_user(self, user_id):
+        self.backend.delete_many([self.version_key(user_id), self.stored_key(user_id)])
+        enqueue(self.delete_files, user_id)
+
+    def directory(self, user_id):
+        return f'{settings.IMAGE_SPRITE_DIRECTORY}/{user_id}'
+
+    def save_file(self, user_id, token, data, extension):
+        name = f'{self.directory(user_id)}/{token}.{extension}'
+        # A sheet whose cache entry expired is rebuilt under the same name.
+        if default_storage.exists(name):
+            default_storage.delete(name)
+        name = default_storage.save(name, ContentFile(data))
+        self.backend.set(self.stored_key(user_id), True, None)
+        return name
+
+    def prune_files(self, user_id):
+        """
+        Delete the user's sheet files from earlier versions.
+        """
+        self.delete_files(user_id, keep=self.get_version(user_id))
+
+    def delete_files(self, user_id, keep=None):
+        """
+        Delete the user's sheet files, except those of the version keep.
+        """
+        directory = self.directory(user_id)
+        try:
+            _, files = default_storage.listdir(directory)
+        except OSError:
+            return
+        for file_name in files:
+            if keep is None or not file_name.startswith(keep):
+                try:
+                    default_storage.delete(f'{directory}/{file_name}')
+                except OSError as e:
+                    logging.error(f"An error occurred while deleting sprite sheet {file_name}: {e}")
+
+
+def pack(sizes, max_width):
+    """
+    Place (width, height) tiles left to right in rows no wider than max_width.
+    Return the (x, y) of every tile and the size of the sheet.
+    """
+    positions = []
+    x = y = row_height = sheet_width = 0
+    for width, height in sizes:
+        if x and x + width > max_width:
+            y += row_height
+            x = row_height = 0
+        positions.append((x, y))
+        x += width
+        row_height = max(row_height, height)
+        sheet_width = max(sheet_width, x)
+    return positions, (sheet_width, y + row_height)
+
+
+def read_thumbnail(name):
+    data = rendition_cache.get(name)
+    if data is None:
+        with default_storage.open(name, 'rb') as f:
+            data = f.read()
+    return data
+
+
+def build_sprite_sheet(user_id, token, image_ids, height):
+    """
+    Compose the user's existing thumbnails of image_ids at height into a
+    sheet, store it and cache its name with its map.
+    """
+    from PIL import Image as PILImage
+
+    from .models import ImageThumbnail
+
+    try:
+        with timed('sprite_build'):
+            names = dict(ImageThumbnail.objects.filter(
+                image__user_id=user_id, image_id__in=image_ids, thumbnail_size__height=height,
+            ).exclude(thumbnail='').exclude(thumbnail__isnull=True).values_list('image_id', 'thumbnail'))
+            tiles = []
+            missing = []
+            for pk in image_ids:
+                name = names.get(pk)
+                if not name:
+                    missing.append(pk)
+                    continue
+                try:
+                    tile = PILImage.open(BytesIO(read_thumbnail(name)))
+                    tile.load()
+                except Exception as e:
+                    logging.error(f"An error occurred while adding thumbnail {name} to a sprite sheet: {e}")
+                    missing.append(pk)
+                    continue
+                tiles.append((pk, tile))
+
+            positions, sheet_size = pack([tile.size for _, tile in tiles], settings.IMAGE_SPRITE_MAX_WIDTH)
+            image_format = settings.IMAGE_SPRITE_FORMAT
+            mode = 'RGB' if image_format == 'JPEG' else 'RGBA'
+            sheet = PILImage.new(mode, (max(sheet_size[0], 1), max(sheet_size[1], 1)), 'white')
+            images = {}
+            for (pk, tile), (x, y) in zip(tiles, positions):
+                tile = tile.convert('RGBA')
+                sheet.paste(tile, (x, y), tile)
+                images[pk] = {'x': x, 'y': y, 'width': tile.width, 'height': tile.height}
+            output = BytesIO()
+            sheet.save(output, format=image_format, quality=settings.IMAGE_SPRITE_QUALITY)
+
+        name = sprite_sheets.save_file(user_id, token, output.getvalue(), image_format.lower())
+        sprite_sheets.set(user_id, token, {
+            'name': name,
+            'content_type': PILImage.MIME[image_format],
+            'width': sheet_size[0],
+            'height': sheet_size[1],
+            'images': images,
+            'missing': missing,
+        })
+        sprite_sheets.prune_files(user_id)
+    finally:
+        sprite_sheets.release(user_id, token)
+
+
+sprite_sheets = SpriteSheetCache()
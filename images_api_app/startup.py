@@ -0,0 +1,44 @@
+"""
+Start-up work done once per server process tree.
+
+Under gunicorn --preload the WSGI module is imported in the master and the
+workers are forked from it, sharing its memory copy-on-write. preload()
+does the imports each worker would otherwise do on its first request (the
+URLconf with every view and serializer, and with IMAGE_PRELOAD_IMAGING also
+PIL and NumPy) and then freezes the garbage collector's view of everything
+allocated so far, so collections in the workers do not write to, and so
+copy, the shared pages.
+
+Nothing here opens database connections, starts threads or maps the hot
+cache arena; each worker creates those lazily after the fork.
+"""
+import gc
+import importlib
+
+from django.conf import settings
+from django.urls import get_resolver
+
+IMAGING_MODULES = [
+    'numpy',
+    'PIL.Image',
+    'PIL.ImageOps',
+    'PIL.ImageSequence',
+    'images_api_app.smartcrop',
+]
+
+
+def preload():
+    """
+    Import the URLconf and, with IMAGE_PRELOAD_IMAGING, the imaging stack,
+    then move all objects to the permanent generation and re-enable the
+    collector (see wsgi.py, which disables it during start-up).
+    """
+    get_resolver().url_patterns
+    if settings.IMAGE_PRELOAD_IMAGING:
+        for name in IMAGING_MODULES:
+            importlib.import_module(name)
+        # Registers the JPEG, PNG and GIF plugins that are otherwise loaded on the first open().
+        from PIL import Image as PILImage
+        PILImage.preinit()
+    gc.freeze()
+    gc.enable()
@@ -0,0 +1,126 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+
+from .coldstorage import delete_archived
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+_reclaim_lock = threading.Lock()
+_reclaim_names = []
+_reclaim_scheduled = False
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_TASK_WORKERS, thread_name_prefix='image-tasks')
+    return _executor
+
+
+def run_task(func, args, kwargs):
+    try:
+        func(*args, **kwargs)
+    except Exception as e:
+        logging.error(f"Background task {func.__name__} failed: {e}")
+    finally:
+        connection.close()
+
+
+def enqueue(func, *args, **kwargs):
+    """
+    Run a function off the request path once the current transaction commits.
+    With IMAGE_TASKS_EAGER the function runs immediately instead.
+    """
+    if settings.IMAGE_TASKS_EAGER:
+        func(*args, **kwargs)
+        return
+    transaction.on_commit(lambda: get_executor().submit(run_task, func, args, kwargs))
+
+
+def render_thumbnails(image_ids, sizes):
+    """
+    Render the given thumbnail sizes for a batch of images, and log the
+    images that got a new thumbnail file.
+    """
+    from .models import Image, ImageChange
+
+    rendered = []
+    for image in Image.objects.filter(pk__in=image_ids):
+        stored = [image.ensure_thumbnail(size)[1] for size in sizes]
+        if any(stored):
+            rendered.append(image)
+    ImageChange.objects.bulk_create([
+        ImageChange(user_id=image.user_id, image_id=image.pk, action=ImageChange.RENDERED)
+        for image in rendered
+    ])
+
+
+def reclaim_files(names):
+    """
+    Delete stored files, and their cold storage copies, that are no longer
+    referenced by any image or thumbnail.
+    """
+    from .models import Image, ImageThumbnail
+
+    referenced = set(Image.objects.filter(image__in=names).values_list('image', flat=True))
+    referenced.update(
+        ImageThumbnail.objects.filter(thumbnail__in=names).values_list('thumbnail', flat=True))
+    for name in names:
+        if name in referenced:
+            continue
+        try:
+            default_storage.delete(name)
+        except OSError as e:
+            logging.error(f"An error occurred while deleting {name}: {e}")
+        delete_archived(name)
+
+
+def drain_file_reclamation():
+    global _reclaim_scheduled
+    while True:
+        with _reclaim_lock:
+            batch = _reclaim_names[:settings.IMAGE_RECLAIM_BATCH_SIZE]
+            del _reclaim_names[:settings.IMAGE_RECLAIM_BATCH_SIZE]
+            if not batch:
+                _reclaim_scheduled = False
+                return
+        try:
+            reclaim_files(batch)
+        except Exception as e:
+            logging.error(f"An error occurred while reclaiming files: {e}")
+
+
+def queue_file_reclamation(names):
+    """
+    Add file names to the reclamation buffer, which a background task deletes
+    in batches of IMAGE_RECLAIM_BATCH_SIZE.
+    """
+    global _reclaim_scheduled
+    with _reclaim_lock:
+        _reclaim_names.extend(names)
+        if _reclaim_scheduled:
+            return
+        _reclaim_scheduled = True
+    get_executor().submit(run_task, drain_file_reclamation, (), {})
+
+
+def schedule_file_reclamation(names):
+    """
+    Reclaim the storage used by deleted images once the deleting transaction commits.
+    """
+    names = [name for name in names if name]
+    if not names:
+        return
+    if settings.IMAGE_TASKS_EAGER:
+        reclaim_files(names)
+        return
+    transaction.on_commit(lambda: queue_file_reclamation(names))
@@ -0,0 +1,63 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .test_models import create_test_image
+from .test_views import BaseViewsTest
+from images_api_app.admin import EstimatedCountPaginator
+from images_api_app.db import estimate_row_count
+from images_api_app.models import Image, ImageThumbnail
+
+
+class AdminTest(BaseViewsTest):
+
+    def setUp(self):
+        settings_override = override_settings(
+            STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(self.admin)
+
+    def changelist_queries(self, model_name):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(f'admin:images_api_app_{model_name}_changelist'))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        self.uploaded_image.get_thumbnail(200)
+        counts = {name: self.changelist_queries(name) for name in ('image', 'imagethumbnail', 'userprofile')}
+        for _ in range(3):
+            image = Image.objects.create(user=self.user, image=create_test_image())
+            image.get_thumbnail(200)
+        for name, count in counts.items():
+            self.assertEqual(self.changelist_queries(name), count, name)
+
+    def test_changelist_shows_preview(self):
+        thumbnail_url = self.uploaded_image.get_thumbnail(200)
+        response = self.client.get(reverse('admin:images_api_app_image_changelist'))
+        self.assertContains(response, f'<img src="{thumbnail_url}"')
+
+    def test_estimated_count(self):
+        Image.objects.create(user=self.user, image=create_test_image()).delete()
+        Image.objects.create(user=self.user, image=create_test_image())
+        images = Image.objects.order_by('pk')
+        self.assertEqual(estimate_row_count(Image), images.last().pk)
+        with override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=0):
+            self.assertEqual(EstimatedCountPaginator(images, 10).count, estimate_row_count(Image))
+            self.assertEqual(EstimatedCountPaginator(images.filter(pk=self.uploaded_image.pk), 10).count, 1)
+        self.assertEqual(EstimatedCountPaginator(images, 10).count, 2)
+
+    def test_rerender_thumbnails_action(self):
+        self.uploaded_image.get_thumbnail(200)
+        old = ImageThumbnail.objects.get(image=self.uploaded_image)
+        response = self.client.post(reverse('admin:images_api_app_image_changelist'), {
+            'action': 'rerender_thumbnails', '_selected_action': [self.uploaded_image.pk]})
+        self.assertEqual(response.status_code, 302)
+        new = ImageThumbnail.objects.get(image=self.uploaded_image)
+        self.assertNotEqual(new.pk, old.pk)
+        self.assertEqual(new.thumbnail_size.height, 200)
+        self.assertTrue(new.thumbnail)
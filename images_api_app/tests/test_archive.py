@@ -0,0 +1,85 @@
+import zipfile
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+
+from .test_models import create_test_user, create_test_image
+from .test_views import BaseViewsTest
+from images_api_app.archive import stream_zip
+from images_api_app.models import AccountTier, Image
+
+
+class StreamZipTest(TestCase):
+
+    def setUp(self):
+        self.names = []
+        for index, size in enumerate([0, 10, 100_000]):
+            name = default_storage.save(f'archive_test/file_{index}.bin', ContentFile(bytes([index]) * size))
+            self.names.append(name)
+            self.addCleanup(default_storage.delete, name)
+
+    def test_stream_zip(self):
+        entries = [(f'file_{index}.bin', name, (2024, 1, 1, 0, 0, 0)) for index, name in enumerate(self.names)]
+        entries.append(('missing.bin', 'archive_test/missing.bin', (2024, 1, 1, 0, 0, 0)))
+        chunks = list(stream_zip(entries, chunk_size=4096))
+
+        self.assertTrue(all(chunks))
+        self.assertLess(max(len(chunk) for chunk in chunks), 4096 + 1024)
+        with zipfile.ZipFile(BytesIO(b''.join(chunks))) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(archive.namelist(), ['file_0.bin', 'file_1.bin', 'file_2.bin'])
+            self.assertEqual(archive.read('file_2.bin'), b'\x02' * 100_000)
+            self.assertTrue(all(info.compress_type == zipfile.ZIP_STORED for info in archive.infolist()))
+
+
+class UserImagesZipExportViewTest(BaseViewsTest):
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.uploaded_image.get_thumbnail(200)
+        self.uploaded_image.get_thumbnail(400)
+
+    def export(self, data):
+        response = self.client.post(reverse('export_images_zip'), data)
+        if response.status_code == status.HTTP_200_OK:
+            self.assertEqual(response['Content-Type'], 'application/zip')
+            return response, zipfile.ZipFile(BytesIO(b''.join(response.streaming_content)))
+        return response, None
+
+    def test_export_all_renditions(self):
+        pk = self.uploaded_image.pk
+        other = Image.objects.create(user=create_test_user('other'), image=create_test_image())
+        response, archive = self.export({'ids': [pk, other.pk]})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            archive.namelist(), [f'{pk}/original.png', f'{pk}/thumbnail_200.png', f'{pk}/thumbnail_400.png'])
+        with self.uploaded_image.image.open('rb') as f:
+            self.assertEqual(archive.read(f'{pk}/original.png'), f.read())
+
+    def test_export_selected_renditions(self):
+        pk = self.uploaded_image.pk
+        response, archive = self.export({'ids': [pk], 'renditions': ['200']})
+        self.assertEqual(archive.namelist(), [f'{pk}/thumbnail_200.png'])
+
+    def test_basic_tier_gets_no_originals(self):
+        self.user.userprofile.account_tier = AccountTier.objects.create(name='Basic')
+        self.user.userprofile.save()
+        pk = self.uploaded_image.pk
+        response, archive = self.export({'ids': [pk]})
+        self.assertEqual(archive.namelist(), [f'{pk}/thumbnail_200.png'])
+
+        response, _ = self.export({'ids': [pk], 'renditions': ['original']})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    @override_settings(IMAGE_ZIP_EXPORT_MAX_IMAGES=1)
+    def test_too_many_ids(self):
+        response, _ = self.export({'ids': [1, 2]})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_missing_ids(self):
+        response, _ = self.export({})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,100 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from images_api_app.authentication import get_token_serializer, issue_token, revoked_tokens
+from images_api_app.models import AccountTier, RevokedToken, ThumbnailSize
+
+
+class SignedTokenAuthenticationTest(TestCase):
+
+    def setUp(self):
+        caches['throttle'].clear()
+        revoked_tokens.clear()
+        self.user = User.objects.create_user(username='tokenuser', password='tokenpass')
+        self.user.userprofile.account_tier = AccountTier.objects.create(name='Basic')
+        self.user.userprofile.save()
+        ThumbnailSize.objects.create(height=200)
+        self.client = APIClient()
+
+    def obtain_token(self):
+        response = self.client.post(reverse('obtain_token'), {'username': 'tokenuser', 'password': 'tokenpass'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['token']
+
+    def test_obtain_token_invalid_credentials(self):
+        response = self.client.post(reverse('obtain_token'), {'username': 'tokenuser', 'password': 'wrong'})
+        self.assertIn(response.status_code, [status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN])
+
+    def test_bearer_token_authenticates_without_password_hashing(self):
+        token = self.obtain_token()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        with mock.patch('django.contrib.auth.hashers.check_password') as check_password:
+            response = self.client.get(reverse('list_images'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        check_password.assert_not_called()
+
+    def test_invalid_token(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {issue_token(self.user)}x')
+        response = self.client.get(reverse('list_images'))
+        self.assertIn(response.status_code, [status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN])
+
+    def test_expired_token(self):
+        token = self.obtain_token()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        with self.settings(API_TOKEN_MAX_AGE=-1):
+            response = self.client.get(reverse('list_images'))
+        self.assertIn(response.status_code, [status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN])
+        self.assertEqual(response.data['detail'], 'Token has expired.')
+
+    def test_revoked_token(self):
+        token = self.obtain_token()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('revoke_token'))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        response = self.client.get(reverse('list_images'))
+        self.assertEqual(response.data['detail'], 'Token has been revoked.')
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.obtain_token()}')
+        self.assertEqual(self.client.get(reverse('list_images')).status_code, status.HTTP_200_OK)
+
+    def test_revocation_is_shared_and_pruned(self):
+        token = self.obtain_token()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        RevokedToken.objects.create(jti='expired', expires_at=timezone.now() - timezone.timedelta(seconds=1))
+        self.client.post(reverse('revoke_token'))
+        # Another worker, or a restarted one, has none of this process's cache.
+        caches['throttle'].clear()
+        revoked_tokens.clear()
+        response = self.client.get(reverse('list_images'))
+        self.assertEqual(response.data['detail'], 'Token has been revoked.')
+        self.assertFalse(RevokedToken.objects.filter(jti='expired').exists())
+
+    def test_revocation_is_checked_without_queries(self):
+        token = self.obtain_token()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.client.get(reverse('list_images'))
+        payload = get_token_serializer().loads(token)
+        with self.assertNumQueries(0):
+            self.assertFalse(revoked_tokens.is_revoked(payload['jti']))
+
+        # A revocation in another worker replaces the version token.
+        RevokedToken.objects.create(jti=payload['jti'], expires_at=timezone.now() + timezone.timedelta(days=1))
+        revoked_tokens.invalidate()
+        response = self.client.get(reverse('list_images'))
+        self.assertEqual(response.data['detail'], 'Token has been revoked.')
+
+    @override_settings(API_TOKEN_REQUESTS_PER_MINUTE=2)
+    def test_obtain_token_is_throttled(self):
+        for password in ('wrong', 'tokenpass'):
+            self.client.post(reverse('obtain_token'), {'username': 'tokenuser', 'password': password})
+        response = self.client.post(reverse('obtain_token'), {'username': 'tokenuser', 'password': 'tokenpass'})
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', response)
@@ -0,0 +1,60 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from images_api_app.benchmarks import run_all
+
+
+class BenchmarkSmokeTest(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.media_root)
+
+    def test_run_all_produces_json_results(self):
+        with override_settings(MEDIA_ROOT=self.media_root):
+            results = run_all(
+                width=64, height=48, uploads=2, library_sizes=(1, 3), repeat=2, serve_requests=2)
+        json.dumps(results)
+        self.assertEqual(results['upload']['runs'], 2)
+        self.assertEqual(set(results['list']), {'1', '3'})
+        self.assertEqual(results['thumbnail']['cold']['runs'], 2)
+        self.assertGreater(results['serve']['requests_per_s'], 0)
+
+
+class RunBenchmarksCommandTest(TestCase):
+
+    def test_runs_with_throwaway_caches(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        backends = {}
+
+        def fake_run_all(**kwargs):
+            for alias in ('default', 'image_list'):
+                caches[alias].set('key', 'value')
+                backends[alias] = type(caches[alias])
+            return {}
+
+        command = 'images_api_app.management.commands.run_benchmarks'
+        file_cache = {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.path.join(directory, 'image_list'),
+        }
+        with override_settings(CACHES={'default': file_cache, 'image_list': file_cache}), \
+                mock.patch(f'{command}.run_all', side_effect=fake_run_all), \
+                mock.patch(f'{command}.connection'), \
+                mock.patch(f'{command}.setup_test_environment'), \
+                mock.patch(f'{command}.teardown_test_environment'):
+            call_command('run_benchmarks', stdout=StringIO())
+        self.assertEqual(backends, {'default': LocMemCache, 'image_list': LocMemCache})
+        self.assertEqual(os.listdir(directory), [])
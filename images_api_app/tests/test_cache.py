@@ -0,0 +1,92 @@
+import tempfile
+from unittest import mock
+
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+
+from .test_models import create_test_image
+from .test_views import BaseViewsTest
+from images_api_app.cache import image_list_cache
+from images_api_app.models import AccountTier, Image
+from images_api_app.tasks import render_thumbnails
+
+
+class ImageListCacheTest(BaseViewsTest):
+
+    def setUp(self):
+        image_list_cache.backend.clear()
+        image_list_cache.reset_stats()
+        self.client.force_login(self.user)
+        # Uploads render their thumbnails in the background before they are listed.
+        for size in (200, 400):
+            self.uploaded_image.get_thumbnail(size)
+
+    def test_second_request_is_served_from_cache(self):
+        first = self.client.get(reverse('list_images'))
+        second = self.client.get(reverse('list_images'))
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(image_list_cache.stats()['hits'], 1)
+        self.assertEqual(image_list_cache.stats()['misses'], 1)
+
+    def test_upload_invalidates_user_pages(self):
+        self.client.get(reverse('list_images'))
+        response = self.client.post(reverse('upload_image'), {'image': create_test_image()})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.get(reverse('list_images'))
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(response.data), Image.objects.filter(user=self.user).count())
+
+    def test_delete_invalidates_user_pages(self):
+        image = Image.objects.create(user=self.user, image=create_test_image())
+        self.client.get(reverse('list_images'))
+        image.delete()
+        response = self.client.get(reverse('list_images'))
+        self.assertEqual(response['X-Cache'], 'MISS')
+
+    def test_thumbnail_render_invalidates_user_pages(self):
+        image = Image.objects.create(user=self.user, image=create_test_image())
+        with mock.patch('images_api_app.models.enqueue') as enqueue:
+            with mock.patch('images_api_app.serializers.take_render_quota', return_value=False):
+                response = self.client.get(reverse('list_images'))
+        self.assertIsNone(next(item for item in response.data if item['id'] == image.pk)['thumbnail_200'])
+        render_thumbnails(*enqueue.call_args_list[0].args[1:])
+        response = self.client.get(reverse('list_images'))
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertIsNotNone(next(item for item in response.data if item['id'] == image.pk)['thumbnail_200'])
+
+    def test_account_tier_change_invalidates_all_pages(self):
+        self.client.get(reverse('list_images'))
+        self.user.userprofile.account_tier = AccountTier.objects.create(name='Basic')
+        self.user.userprofile.save()
+        response = self.client.get(reverse('list_images'))
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertNotIn('thumbnail_400', response.data[0])
+
+        self.enterprise_tier.allow_original_link = True
+        self.enterprise_tier.save()
+        self.assertEqual(self.client.get(reverse('list_images'))['X-Cache'], 'MISS')
+
+
+class FileBasedImageListCacheTest(ImageListCacheTest):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.cache_dir = tempfile.TemporaryDirectory()
+        cls.settings_override = override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'image_list': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': cls.cache_dir.name,
+            },
+        })
+        cls.settings_override.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.settings_override.disable()
+        cls.cache_dir.cleanup()
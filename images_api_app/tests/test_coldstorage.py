@@ -0,0 +1,139 @@
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .test_models import create_test_image
+from .test_views import BaseViewsTest
+from images_api_app.archive import stream_zip
+from images_api_app.management.commands.archive_cold_images import Command
+from images_api_app.coldstorage import cold_paths, rehydrate
+from images_api_app.models import Image, ImageAccessStats
+from images_api_app.usage import write_counters
+
+
+class ColdStorageTest(BaseViewsTest):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(IMAGE_COLD_STORAGE_ROOT=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client.force_login(self.user)
+
+        self.image = Image.objects.create(user=self.user, image=create_test_image())
+        with self.image.image.open('rb') as f:
+            self.image_bytes = f.read()
+        old = timezone.now() - timezone.timedelta(days=60)
+        Image.objects.filter(pk=self.image.pk).update(uploaded_at=old)
+
+    def archive(self, *args):
+        out = StringIO()
+        call_command('archive_cold_images', *args, stdout=out)
+        self.image.refresh_from_db()
+        return out.getvalue()
+
+    def test_archive_and_rehydrate_on_access(self):
+        self.assertIn('Archived 1 originals', self.archive())
+        self.assertIsNotNone(self.image.archived_at)
+        self.assertFalse(os.path.exists(self.image.image.path))
+        self.assertTrue(os.path.exists(cold_paths(self.image.image.name)[0]))
+
+        response = self.client.get(reverse('serve_image', args=[self.image.expiring_image_link]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.image_bytes)
+        self.image.refresh_from_db()
+        self.assertIsNone(self.image.archived_at)
+        self.assertFalse(any(os.path.exists(path) for path in cold_paths(self.image.image.name)))
+        self.assertIsNotNone(ImageAccessStats.objects.get(image=self.image).original_last_accessed)
+        self.assertIn('Archived 0 originals', self.archive())
+
+    def test_original_link_rehydrates(self):
+        self.archive()
+        url, = [item['image'] for item in self.client.get(reverse('list_images')).data
+                if item['id'] == self.image.pk]
+        self.assertTrue(url.endswith(reverse('original_image', args=[self.image.pk])))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.image_bytes)
+        self.image.refresh_from_db()
+        self.assertIsNone(self.image.archived_at)
+
+    def test_hot_copy_removed_while_opening_is_rehydrated(self):
+        self.archive()
+        calls = []
+
+        def stale_rehydrate(name):
+            # The first check still saw the hot copy the archiver has since removed.
+            calls.append(name)
+            return True if len(calls) == 1 else rehydrate(name)
+
+        with mock.patch('images_api_app.coldstorage.rehydrate', side_effect=stale_rehydrate):
+            response = self.client.get(reverse('original_image', args=[self.image.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.image_bytes)
+        self.assertEqual(len(calls), 2)
+
+    def test_original_link_requires_tier(self):
+        self.enterprise_tier.name = 'Basic'
+        self.enterprise_tier.save()
+        response = self.client.get(reverse('original_image', args=[self.image.pk]))
+        self.assertEqual(response.status_code, 403)
+
+    def test_originals_served_after_selection_stay_hot(self):
+        command = Command()
+        cutoff = timezone.now() - timezone.timedelta(days=30)
+        batch = list(command.cold_images(cutoff).values_list('pk', 'image', 'file_size'))
+        ImageAccessStats.objects.create(image=self.image, original_last_accessed=timezone.now())
+        self.assertEqual(command.archive_batch(batch, cutoff), (0, 0))
+        self.assertTrue(os.path.exists(self.image.image.path))
+        self.assertFalse(any(os.path.exists(path) for path in cold_paths(self.image.image.name)))
+
+    @override_settings(IMAGE_COLD_STORAGE_COMPRESS=True)
+    def test_compressed_archive(self):
+        self.archive()
+        self.assertTrue(cold_paths(self.image.image.name)[0].endswith('.gz'))
+        self.assertTrue(rehydrate(self.image.image.name))
+        with self.image.image.open('rb') as f:
+            self.assertEqual(f.read(), self.image_bytes)
+
+    def test_recently_accessed_originals_stay_hot(self):
+        ImageAccessStats.objects.create(image=self.image, original_last_accessed=timezone.now())
+        self.assertIn('Archived 0 originals', self.archive())
+        self.assertTrue(os.path.exists(self.image.image.path))
+
+    def test_thumbnail_requests_do_not_keep_originals_hot(self):
+        self.image.get_thumbnail(200)
+        thumbnail_name = self.image.image_thumbnails.get().thumbnail.name
+        old = timezone.now() - timezone.timedelta(days=60)
+        write_counters({self.image.image.name: [1, 10, old], thumbnail_name: [1, 10, timezone.now()]})
+        stats = ImageAccessStats.objects.get(image=self.image)
+        self.assertEqual(stats.original_last_accessed, old)
+        self.assertGreater(stats.last_accessed, old)
+        self.assertIn('Archived 1 originals', self.archive())
+
+    def test_dry_run(self):
+        self.assertIn('Would archive 1 originals', self.archive('--dry-run'))
+        self.assertIsNone(self.image.archived_at)
+
+    def test_thumbnails_and_exports_rehydrate(self):
+        self.archive()
+        self.assertIsNotNone(self.image.get_thumbnail(200))
+        self.image.refresh_from_db()
+        self.assertIsNone(self.image.archived_at)
+
+        self.archive('--days=0')
+        archive = b''.join(stream_zip([('original.png', self.image.image.name, (2024, 1, 1, 0, 0, 0))], 1024))
+        self.assertIn(self.image_bytes, archive)
+
+    def test_delete_removes_cold_copy(self):
+        self.archive()
+        name = self.image.image.name
+        self.image.delete()
+        self.assertFalse(any(os.path.exists(path) for path in cold_paths(name)))
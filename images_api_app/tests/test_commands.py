@@ -0,0 +1,55 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from .test_models import create_test_user, create_test_image
+from images_api_app.models import Image
+
+
+class ScanOrphanedFilesCommandTest(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.image = Image.objects.create(user=create_test_user(), image=create_test_image())
+        self.orphan_path = os.path.join(self.media_root, 'images', 'orphan.png')
+        with open(self.orphan_path, 'wb') as f:
+            f.write(b'orphan')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def test_scan_reports_orphans_without_deleting(self):
+        out = StringIO()
+        call_command('scan_orphaned_files', '--min-age=0', stdout=out)
+        self.assertIn('Found 1 orphaned files (6 bytes).', out.getvalue())
+        self.assertTrue(os.path.exists(self.orphan_path))
+
+    def test_scan_deletes_only_orphans(self):
+        out = StringIO()
+        call_command('scan_orphaned_files', '--min-age=0', '--delete', stdout=out)
+        self.assertIn('Deleted 1 orphaned files', out.getvalue())
+        self.assertFalse(os.path.exists(self.orphan_path))
+        self.assertTrue(os.path.exists(self.image.image.path))
+
+    def test_scan_skips_sprite_sheets(self):
+        sprite_path = os.path.join(self.media_root, settings.IMAGE_SPRITE_DIRECTORY, '1', 'sheet.jpeg')
+        os.makedirs(os.path.dirname(sprite_path))
+        with open(sprite_path, 'wb') as f:
+            f.write(b'sprite')
+        out = StringIO()
+        call_command('scan_orphaned_files', '--min-age=0', '--delete', stdout=out)
+        self.assertIn('Deleted 1 orphaned files (6 bytes).', out.getvalue())
+        self.assertTrue(os.path.exists(sprite_path))
+
+    def test_scan_skips_recent_files(self):
+        out = StringIO()
+        call_command('scan_orphaned_files', stdout=out)
+        self.assertIn('Found 0 orphaned files', out.getvalue())
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase
+
+
+class SqliteConnectionTest(TestCase):
+
+    def test_pragmas_applied_on_connect(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], settings.SQLITE_PRAGMAS['busy_timeout'])
+            cursor.execute('PRAGMA temp_store')
+            self.assertEqual(cursor.fetchone()[0], 2)
+
+    def test_thumbnail_lookup_uses_unique_index(self):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, 'images_api_app_imagethumbnail')
+        self.assertTrue(any(
+            constraint['unique'] and constraint['columns'] == ['image_id', 'thumbnail_size_id']
+            for constraint in constraints.values()))
+
+    def test_image_listing_index(self):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, 'images_api_app_image')
+        self.assertTrue(any(
+            constraint['index'] and constraint['columns'] == ['user_id', 'uploaded_at']
+            for constraint in constraints.values()))
@@ -0,0 +1,159 @@
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+from django.test import override_settings
+from django.urls import reverse
+from PIL import Image as PILImage
+from rest_framework import status
+
+from .test_models import create_test_user, create_test_image
+from .test_pipeline import create_exif_image
+from .test_views import BaseViewsTest
+from images_api_app.models import Image, ImageThumbnail, StorageUsage
+from images_api_app.utils import load_upload_token
+
+
+class DirectUploadTest(BaseViewsTest):
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.image_bytes = create_test_image().read()
+
+    def issue(self, file_name='test_image.png', size=None):
+        return self.client.post(reverse('direct_upload'), {
+            'file_name': file_name, 'size': len(self.image_bytes) if size is None else size})
+
+    def put(self, url, data=None):
+        return self.client.generic(
+            'PUT', url, self.image_bytes if data is None else data, content_type='application/octet-stream')
+
+    def finalize(self, token):
+        return self.client.post(reverse('direct_upload_finalize'), {'token': token})
+
+    def test_direct_upload(self):
+        response = self.issue()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.put(response.data['upload_url']).status_code, status.HTTP_201_CREATED)
+
+        finalized = self.finalize(response.data['token'])
+        self.assertEqual(finalized.status_code, status.HTTP_201_CREATED)
+        image = Image.objects.get(pk=finalized.data['id'])
+        self.assertEqual(image.user, self.user)
+        self.assertTrue(image.image.name.startswith('images/'))
+        self.assertTrue(image.expiring_image_link)
+        with image.image.open('rb') as f:
+            self.assertEqual(f.read(), self.image_bytes)
+        self.assertEqual(image.image_thumbnails.count(), 2)
+
+    def test_finalize_runs_ingest_pipeline(self):
+        self.image_bytes = create_exif_image().read()
+        response = self.issue('photo.jpg')
+        self.put(response.data['upload_url'])
+        finalized = self.finalize(response.data['token'])
+        self.assertEqual(finalized.status_code, status.HTTP_201_CREATED)
+        image = Image.objects.get(pk=finalized.data['id'])
+        with image.image.open('rb') as f, PILImage.open(f) as stored:
+            self.assertEqual(stored.size, (50, 100))
+        self.assertGreater(image.ingest_saved_bytes, 0)
+        self.assertEqual(image.file_size, image.image.size)
+        self.assertEqual(image.file_size, len(self.image_bytes) - image.ingest_saved_bytes)
+        self.assertEqual(
+            StorageUsage.objects.get(user=self.user).bytes,
+            sum(Image.objects.filter(user=self.user).values_list('file_size', flat=True))
+            + sum(ImageThumbnail.objects.filter(image__user=self.user).values_list('file_size', flat=True)))
+
+    def test_issue_rejects_invalid_extension(self):
+        self.assertEqual(self.issue('test_image.txt').status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(IMAGE_DIRECT_UPLOAD_MAX_BYTES=100)
+    def test_issue_rejects_large_file(self):
+        self.assertEqual(self.issue().status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_put_rejects_invalid_token(self):
+        response = self.put(reverse('direct_upload_put', args=['invalid']))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_put_rejects_more_bytes_than_announced(self):
+        response = self.issue(size=10)
+        self.assertEqual(self.put(response.data['upload_url']).status_code, 413)
+
+    def test_put_rejects_reused_link(self):
+        url = self.issue().data['upload_url']
+        self.assertEqual(self.put(url).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.put(url).status_code, status.HTTP_409_CONFLICT)
+
+    def test_finalize_requires_uploaded_file(self):
+        response = self.finalize(self.issue().data['token'])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_finalize_rejects_other_user(self):
+        response = self.issue()
+        self.put(response.data['upload_url'])
+        self.client.force_login(create_test_user('other'))
+        self.assertEqual(self.finalize(response.data['token']).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_finalize_only_once(self):
+        response = self.issue()
+        self.put(response.data['upload_url'])
+        self.assertEqual(self.finalize(response.data['token']).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.finalize(response.data['token']).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_finalize_deletes_invalid_file(self):
+        response = self.issue(size=100)
+        self.put(response.data['upload_url'], b'not an image')
+        finalized = self.finalize(response.data['token'])
+        self.assertEqual(finalized.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('Upload a valid image.', str(finalized.data))
+        self.assertEqual(Image.objects.filter(user=self.user).count(), 1)
+        self.assertFalse(default_storage.exists(load_upload_token(response.data['token'], 60)['name']))
+
+    def test_finalize_rejects_large_image(self):
+        response = self.issue()
+        self.put(response.data['upload_url'])
+        with override_settings(IMAGE_MAX_PIXELS=1000):
+            finalized = self.finalize(response.data['token'])
+        self.assertEqual(finalized.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('Image is too large', str(finalized.data))
+        self.assertFalse(default_storage.exists(load_upload_token(response.data['token'], 60)['name']))
+
+
+class DirectUploadThrottlingTest(BaseViewsTest):
+
+    def setUp(self):
+        caches['throttle'].clear()
+        self.client.force_login(self.user)
+        self.image_bytes = create_test_image().read()
+        response = self.client.post(reverse('direct_upload'), {
+            'file_name': 'test_image.png', 'size': len(self.image_bytes)})
+        self.url = response.data['upload_url']
+        self.name = load_upload_token(response.data['token'], 60)['name']
+        # The link is used without the session, as by a client that only holds the URL.
+        self.client.logout()
+
+    def tearDown(self):
+        self.enterprise_tier.requests_per_second = None
+        self.enterprise_tier.concurrent_uploads = None
+        self.enterprise_tier.save()
+
+    def put(self):
+        return self.client.generic('PUT', self.url, self.image_bytes, content_type='application/octet-stream')
+
+    def test_put_takes_an_upload_slot(self):
+        self.enterprise_tier.concurrent_uploads = 1
+        self.enterprise_tier.save()
+        key = f'throttle:concurrent_uploads:{self.user.pk}'
+        caches['throttle'].set(key, 1)
+        response = self.put()
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', response)
+        self.assertFalse(default_storage.exists(self.name))
+
+        caches['throttle'].set(key, 0)
+        self.assertEqual(self.put().status_code, status.HTTP_201_CREATED)
+        self.assertEqual(caches['throttle'].get(key), 0)
+
+    def test_put_counts_against_request_rate(self):
+        self.enterprise_tier.requests_per_second = 1
+        self.enterprise_tier.save()
+        caches['throttle'].clear()
+        self.assertEqual(self.put().status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.put().status_code, status.HTTP_429_TOO_MANY_REQUESTS)
@@ -0,0 +1,133 @@
+import os
+import tempfile
+
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+
+from .test_views import BaseViewsTest
+from images_api_app.hotcache import LRUStore, MmapArena, rendition_cache
+from images_api_app.metrics import registry
+from images_api_app.models import ImageThumbnail
+
+
+class LRUStoreTest(SimpleTestCase):
+
+    def test_evicts_least_recently_used_by_size(self):
+        store = LRUStore(max_bytes=10, timeout=60)
+        store.set('a', b'1234')
+        store.set('b', b'1234')
+        store.get('a')
+        store.set('c', b'1234')
+        self.assertEqual(store.get('a'), b'1234')
+        self.assertIsNone(store.get('b'))
+        self.assertEqual(store.get('c'), b'1234')
+        self.assertEqual(store.size, 8)
+        self.assertEqual(store.evictions, 1)
+
+    def test_entries_expire(self):
+        store = LRUStore(max_bytes=10, timeout=-1)
+        store.set('a', b'1234')
+        self.assertIsNone(store.get('a'))
+        self.assertEqual(store.size, 0)
+
+
+class MmapArenaTest(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'arena')
+
+    def test_shared_between_instances(self):
+        writer = MmapArena(self.path, slots=16, slot_size=32)
+        reader = MmapArena(self.path, slots=16, slot_size=32)
+        writer.set('thumbnails/200/a.png', b'first')
+        self.assertEqual(reader.get('thumbnails/200/a.png'), b'first')
+        self.assertIsNone(reader.get('thumbnails/200/b.png'))
+
+        writer.set('thumbnails/200/a.png', b'second')
+        self.assertEqual(reader.get('thumbnails/200/a.png'), b'second')
+        reader.delete('thumbnails/200/a.png')
+        self.assertIsNone(writer.get('thumbnails/200/a.png'))
+
+    def test_colliding_names_replace_each_other(self):
+        arena = MmapArena(self.path, slots=1, slot_size=32)
+        arena.set('a', b'1')
+        arena.set('b', b'2')
+        self.assertIsNone(arena.get('a'))
+        self.assertEqual(arena.get('b'), b'2')
+        self.assertEqual(arena.evictions, 1)
+
+
+class ServeThumbnailTest(BaseViewsTest):
+
+    def setUp(self):
+        rendition_cache.clear()
+        rendition_cache.reset_stats()
+        self.uploaded_image.get_thumbnail(200)
+        self.thumbnail = ImageThumbnail.objects.get(image=self.uploaded_image, thumbnail_size__height=200)
+        self.url = self.thumbnail.thumbnail.url
+
+    def get(self, url=None):
+        return self.client.get(url or self.url)
+
+    def test_serves_from_cache(self):
+        first = self.get()
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(first['Content-Type'], 'image/png')
+        second = self.get()
+        self.assertEqual(second['X-Cache'], 'HIT')
+        with self.thumbnail.thumbnail.open('rb') as f:
+            self.assertEqual(second.content, f.read())
+        self.assertEqual(rendition_cache.stats()['hit_ratio'], 0.5)
+        self.assertIn(
+            f'image_api_rendition_cache_requests_total{{result="hit",pid="{os.getpid()}"}} 1', registry.render())
+
+    def test_rerender_invalidates(self):
+        self.get()
+        name = self.thumbnail.thumbnail.name
+        self.thumbnail.delete()
+        self.assertIsNone(rendition_cache.store.get(name))
+
+    @override_settings(IMAGE_HOT_CACHE_MAX_ITEM_BYTES=10)
+    def test_large_files_are_not_cached(self):
+        self.assertEqual(b''.join(self.get().streaming_content)[:4], b'\x89PNG')
+        self.assertNotIn('X-Cache', self.get())
+
+    def test_shared_arena(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        with override_settings(IMAGE_HOT_CACHE_ARENA_PATH=os.path.join(directory.name, 'arena')):
+            self.assertEqual(self.get()['X-Cache'], 'MISS')
+            self.assertEqual(self.get()['X-Cache'], 'HIT')
+            self.thumbnail.delete()
+            self.assertEqual(self.get().status_code, 404)
+
+    def assert_conditional_get(self, response):
+        self.assertIn('Last-Modified', response)
+        not_modified = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+        not_modified = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_conditional_get_from_cache(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        with override_settings(IMAGE_HOT_CACHE_ARENA_PATH=os.path.join(directory.name, 'arena')):
+            self.get()
+            response = self.get()
+            self.assertEqual(response['X-Cache'], 'HIT')
+            self.assert_conditional_get(response)
+
+    @override_settings(IMAGE_HOT_CACHE_MAX_ITEM_BYTES=10)
+    def test_conditional_get_from_file(self):
+        response = self.get()
+        self.assertNotIn('X-Cache', response)
+        self.assert_conditional_get(response)
+
+    def test_missing_thumbnail(self):
+        self.assertEqual(self.get(self.url + 'missing').status_code, 404)
+        self.assertEqual(self.get(reverse('serve_thumbnail', args=['../../etc/passwd'])).status_code, 404)
@@ -0,0 +1,65 @@
+import os
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+
+from .test_views import BaseViewsTest
+from images_api_app.metrics import DURATION_BUCKETS, Histogram, Registry
+
+
+class HistogramTest(TestCase):
+
+    def test_render_cumulative_buckets(self):
+        histogram = Histogram('test_seconds', 'Test histogram.', DURATION_BUCKETS)
+        histogram.observe(0.003, view='a')
+        histogram.observe(0.2, view='a')
+        histogram.observe(20, view='a')
+        lines = histogram.render()
+        self.assertIn('test_seconds_bucket{view="a",le="0.005"} 1', lines)
+        self.assertIn('test_seconds_bucket{view="a",le="0.25"} 2', lines)
+        self.assertIn('test_seconds_bucket{view="a",le="+Inf"} 3', lines)
+        self.assertIn('test_seconds_count{view="a"} 3', lines)
+
+
+class RegistryTest(TestCase):
+
+    def test_samples_are_labelled_with_the_process(self):
+        registry = Registry()
+        registry.storage_bytes.inc(10, direction='storage_read')
+        registry.extra_collectors.append(lambda: ['# TYPE test_total counter', 'test_total 1'])
+        lines = registry.render().splitlines()
+        pid = os.getpid()
+        self.assertIn(f'image_api_storage_bytes_total{{direction="storage_read",pid="{pid}"}} 10.0', lines)
+        self.assertIn(f'test_total{{pid="{pid}"}} 1', lines)
+        self.assertIn('# TYPE test_total counter', lines)
+
+
+class PerformanceMiddlewareTest(BaseViewsTest):
+
+    def test_server_timing_header(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('list_images'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('total;dur=', response['Server-Timing'])
+
+    def test_serve_image_records_storage_read(self):
+        response = self.client.get(reverse('serve_image', args=[self.uploaded_image.expiring_image_link]))
+        self.assertIn('storage_read;dur=', response['Server-Timing'])
+        self.assertIn(f'{self.uploaded_image.image.size}B', response['Server-Timing'])
+
+    def test_metrics_endpoint(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('list_images'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_403_FORBIDDEN)
+
+        admin_user = User.objects.create_superuser(username='admin', password='adminpass', email='admin@test.com')
+        self.client.force_login(admin_user)
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = response.content.decode()
+        self.assertIn('image_api_request_duration_seconds_bucket{view="list_images"', body)
+        self.assertIn('image_api_phase_duration_seconds_count{phase="db",pid=', body)
+        self.assertIn('image_api_list_cache_requests_total{result="hit",pid=', body)
@@ -7,6 +7,7 @@ from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
 from PIL import Image as PILImage
 
 from images_api_app.models import (
@@ -182,10 +183,16 @@ class ImageThumbnailModelTest(BaseImageModelTest):
         super().tearDown()
 
     def test_image_thumbnail_creation(self):
+        thumbnail_size = ThumbnailSize.objects.create(height=150)
         thumbnail = ImageThumbnail.objects.create(
-            image=self.image_instance, thumbnail_size=self.thumbnail_size, thumbnail=self.image)
+            image=self.image_instance, thumbnail_size=thumbnail_size, thumbnail=self.image)
         self.assertEqual(thumbnail.image, self.image_instance)
-        self.assertEqual(thumbnail.thumbnail_size, self.thumbnail_size)
+        self.assertEqual(thumbnail.thumbnail_size, thumbnail_size)
+
+    def test_image_thumbnail_unique_per_size(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ImageThumbnail.objects.create(
+                image=self.image_instance, thumbnail_size=self.thumbnail_size, thumbnail=self.image)
 
     def test_thumbnail_upload_path_200px(self):
         thumbnail_size_instance = ThumbnailSize.objects.create(height=200)
@@ -0,0 +1,64 @@
+from io import BytesIO
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from PIL import Image as PILImage
+
+from images_api_app.models import AccountTier
+from images_api_app.pipeline import EXIF_ORIENTATION, ingest_upload
+
+
+def create_exif_image(orientation=6, size=(100, 50), format='JPEG'):
+    img = PILImage.new('RGB', size, color='green')
+    exif = PILImage.Exif()
+    exif[EXIF_ORIENTATION] = orientation
+    exif[0x010F] = 'Camera maker ' * 200
+    img_io = BytesIO()
+    img.save(img_io, format=format, exif=exif.tobytes())
+    return SimpleUploadedFile(f'photo.{format.lower()}', img_io.getvalue())
+
+
+def open_result(image_file):
+    image_file.seek(0)
+    return PILImage.open(BytesIO(image_file.read()))
+
+
+class IngestPipelineTest(TestCase):
+
+    def test_auto_orient_and_strip_metadata(self):
+        upload = create_exif_image()
+        image_file, saved_bytes = ingest_upload(upload, AccountTier(name='Basic'))
+        image = open_result(image_file)
+        self.assertEqual(image.size, (50, 100))
+        self.assertEqual(dict(image.getexif()), {})
+        self.assertGreater(saved_bytes, 0)
+        self.assertEqual(image_file.name, 'photo.jpeg')
+
+    def test_retain_metadata_tier(self):
+        image_file, _ = ingest_upload(create_exif_image(), AccountTier(name='Pro', retain_metadata=True))
+        image = open_result(image_file)
+        self.assertEqual(image.size, (50, 100))
+        exif = image.getexif()
+        self.assertNotIn(EXIF_ORIENTATION, exif)
+        self.assertIn(0x010F, exif)
+
+    def test_unchanged_upload_is_returned_as_is(self):
+        upload = create_exif_image(orientation=1)
+        with override_settings(IMAGE_INGEST_STAGES=['auto_orient']):
+            image_file, saved_bytes = ingest_upload(upload)
+        self.assertIs(image_file, upload)
+        self.assertEqual(saved_bytes, 0)
+
+    def test_recompress_oversized_original(self):
+        img = PILImage.frombytes('RGB', (300, 300), bytes(range(256)) * 1054 + bytes(276))
+        img_io = BytesIO()
+        img.save(img_io, format='JPEG', quality=100)
+        upload = SimpleUploadedFile('large.jpg', img_io.getvalue())
+        with override_settings(IMAGE_INGEST_MAX_BYTES=1000):
+            image_file, saved_bytes = ingest_upload(upload)
+        self.assertIsNot(image_file, upload)
+        self.assertGreater(saved_bytes, 0)
+
+    def test_invalid_image_is_left_to_validation(self):
+        upload = SimpleUploadedFile('broken.png', b'not an image')
+        self.assertEqual(ingest_upload(upload), (upload, 0))
@@ -0,0 +1,97 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework import status
+
+from .test_models import create_test_image, create_test_user
+from .test_views import BaseViewsTest
+from images_api_app.models import Image, ImageChange, ImageThumbnail, StorageUsage, ThumbnailSize
+from images_api_app.quota import get_storage_usage
+
+
+class StorageUsageTest(BaseViewsTest):
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def usage(self):
+        return get_storage_usage(self.user.pk)
+
+    def stored(self):
+        sizes = list(Image.objects.filter(user=self.user).values_list('file_size', flat=True))
+        sizes += ImageThumbnail.objects.filter(image__user=self.user).values_list('file_size', flat=True)
+        return sum(sizes), len(sizes)
+
+    def test_counters_follow_uploads_thumbnails_and_deletes(self):
+        start = self.usage()
+        response = self.client.post(reverse('upload_image'), {'image': create_test_image()})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        image = Image.objects.get(pk=response.data['id'])
+        self.assertEqual(image.file_size, image.image.size)
+        thumbnail = ImageThumbnail.objects.filter(image=image).first()
+        self.assertEqual(thumbnail.file_size, thumbnail.thumbnail.size)
+        self.assertEqual(self.usage(), self.stored())
+
+        thumbnail.delete()
+        self.assertEqual(self.usage(), self.stored())
+        image.delete()
+        self.assertEqual(self.usage(), start)
+
+    def test_bulk_upload_is_counted(self):
+        response = self.client.post(
+            reverse('bulk_upload_images'), {'images': [create_test_image('a.png'), create_test_image('b.png')]})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.usage(), self.stored())
+
+    def test_user_delete_removes_usage(self):
+        user = create_test_user('quotauser')
+        image = Image.objects.create(user=user, image=create_test_image())
+        ImageThumbnail.objects.create(image=image, thumbnail_size=ThumbnailSize.objects.get(height=200))
+        user.delete()
+        self.assertFalse(StorageUsage.objects.filter(user_id=user.pk).exists())
+        self.assertFalse(ImageChange.objects.filter(user_id=user.pk).exists())
+
+    def test_reconcile_fixes_drift(self):
+        expected = self.usage()
+        Image.objects.filter(pk=self.uploaded_image.pk).update(file_size=1)
+        StorageUsage.objects.filter(user=self.user).update(bytes=5, files=9)
+
+        out = StringIO()
+        call_command('reconcile_storage_usage', '--dry-run', stdout=out)
+        self.assertIn('Found 1 image sizes, 0 thumbnail sizes and 1 user totals', out.getvalue())
+        self.assertEqual(self.usage(), (5, 9))
+
+        call_command('reconcile_storage_usage', '--workers=2', stdout=StringIO())
+        self.assertEqual(self.usage(), expected)
+        self.uploaded_image.refresh_from_db()
+        self.assertEqual(self.uploaded_image.file_size, self.uploaded_image.image.size)
+
+
+class StorageQuotaTest(BaseViewsTest):
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        used_bytes, _ = get_storage_usage(self.user.pk)
+        self.enterprise_tier.storage_quota_bytes = used_bytes + 100
+        self.enterprise_tier.save()
+
+    def test_upload_over_quota_is_rejected(self):
+        count = Image.objects.count()
+        response = self.client.post(reverse('upload_image'), {'image': create_test_image()})
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertEqual(Image.objects.count(), count)
+
+    def test_bulk_upload_over_quota_is_rejected(self):
+        response = self.client.post(reverse('bulk_upload_images'), {'images': [create_test_image()]})
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+    def test_direct_upload_over_quota_is_rejected(self):
+        response = self.client.post(reverse('direct_upload'), {'file_name': 'a.png', 'size': 1000})
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+    def test_upload_within_quota(self):
+        self.enterprise_tier.storage_quota_bytes = None
+        self.enterprise_tier.save()
+        response = self.client.post(reverse('upload_image'), {'image': create_test_image()})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
@@ -0,0 +1,163 @@
+import time
+from io import BytesIO
+from unittest import mock
+
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+
+from .test_models import create_test_user, create_test_image
+from .test_views import BaseViewsTest
+from images_api_app.models import Image
+from PIL import Image as PILImage, features
+
+from images_api_app.rendering import RenderError, render_in_subprocess, render_thumbnail_bytes
+
+
+class RenderingTest(TestCase):
+
+    def setUp(self):
+        self.image_bytes = create_test_image(size=(300, 150)).read()
+
+    def test_render_in_subprocess(self):
+        thumbnail = render_in_subprocess(self.image_bytes, 100)
+        self.assertEqual(thumbnail, render_thumbnail_bytes(self.image_bytes, 100))
+
+    def test_subprocess_timings_are_recorded(self):
+        with mock.patch('images_api_app.rendering.record_timings') as record_timings:
+            render_in_subprocess(self.image_bytes, 100)
+        timings, = record_timings.call_args.args
+        self.assertEqual({phase for phase, _ in timings}, {'pil_decode', 'pil_encode'})
+
+    @override_settings(IMAGE_MAX_PIXELS=1000)
+    def test_render_rejects_too_many_pixels(self):
+        with self.assertRaises(ValidationError):
+            render_thumbnail_bytes(self.image_bytes, 100)
+        with self.assertRaisesMessage(RenderError, 'Image is too large'):
+            render_in_subprocess(self.image_bytes, 100)
+
+    @override_settings(IMAGE_MAX_DECODE_BYTES=1000)
+    def test_render_rejects_too_much_decode_memory(self):
+        with self.assertRaises(ValidationError):
+            render_thumbnail_bytes(self.image_bytes, 100)
+
+    @override_settings(IMAGE_RENDER_TIMEOUT=0, IMAGE_RENDER_START_METHOD='fork')
+    def test_render_timeout(self):
+        # The forked child inherits the patch, so it cannot answer before the poll.
+        with mock.patch('images_api_app.rendering.render_thumbnail_bytes', side_effect=lambda *args: time.sleep(5)):
+            with self.assertRaisesMessage(RenderError, 'Rendering took longer than'):
+                render_in_subprocess(self.image_bytes, 100)
+
+    @override_settings(IMAGE_MAX_PIXELS=1000)
+    def test_get_thumbnail_fails_gracefully(self):
+        with override_settings(IMAGE_MAX_PIXELS=10 ** 6):
+            image = Image.objects.create(user=create_test_user(), image=create_test_image())
+        self.assertIsNone(image.get_thumbnail(50))
+
+
+COLORS = ['red', 'green', 'blue', 'yellow']
+
+
+def create_animated_image(image_format='GIF', colors=COLORS, size=(300, 150)):
+    frames = [PILImage.new('RGB', size, color) for color in colors]
+    output = BytesIO()
+    frames[0].save(output, format=image_format, save_all=True, append_images=frames[1:], duration=100, loop=0)
+    return output.getvalue()
+
+
+def frame_colors(data):
+    with PILImage.open(BytesIO(data)) as image:
+        colors = []
+        for index in range(getattr(image, 'n_frames', 1)):
+            image.seek(index)
+            colors.append(image.convert('RGB').getpixel((0, 0)))
+        return image.size, colors
+
+
+@override_settings(IMAGE_THUMBNAIL_FRAME=0, IMAGE_ANIMATED_THUMBNAILS=False)
+class AnimatedRenderingTest(TestCase):
+
+    def assertFrames(self, data, size, colors):
+        thumbnail_size, thumbnail_colors = frame_colors(data)
+        self.assertEqual(thumbnail_size, size)
+        self.assertEqual(len(thumbnail_colors), len(colors))
+        for actual, expected in zip(thumbnail_colors, colors):
+            for channel, value in zip(actual, PILImage.new('RGB', (1, 1), expected).getpixel((0, 0))):
+                self.assertAlmostEqual(channel, value, delta=8)
+
+    def test_gif_thumbnail_uses_first_frame(self):
+        self.assertFrames(render_thumbnail_bytes(create_animated_image(), 100), (100, 50), ['red'])
+
+    @override_settings(IMAGE_THUMBNAIL_FRAME=2)
+    def test_gif_thumbnail_uses_selected_frame(self):
+        self.assertFrames(render_thumbnail_bytes(create_animated_image(), 100), (100, 50), ['blue'])
+
+    @override_settings(IMAGE_THUMBNAIL_FRAME=10)
+    def test_selected_frame_falls_back_to_first(self):
+        self.assertFrames(render_thumbnail_bytes(create_animated_image(), 100), (100, 50), ['red'])
+
+    def test_apng_thumbnail_uses_first_frame(self):
+        data = create_animated_image('PNG')
+        self.assertFrames(render_thumbnail_bytes(data, 100), (100, 50), ['red'])
+
+    @override_settings(IMAGE_ANIMATED_THUMBNAILS=True, IMAGE_ANIMATED_MAX_FRAMES=3)
+    def test_animated_thumbnail_is_capped_by_frames(self):
+        self.assertFrames(render_thumbnail_bytes(create_animated_image(), 100), (100, 50), COLORS[:3])
+
+    @override_settings(IMAGE_ANIMATED_THUMBNAILS=True, IMAGE_ANIMATED_MAX_PIXELS=300 * 150 * 2)
+    def test_animated_thumbnail_is_capped_by_pixels(self):
+        self.assertFrames(render_thumbnail_bytes(create_animated_image(), 100), (100, 50), COLORS[:2])
+
+    @override_settings(IMAGE_ANIMATED_THUMBNAILS=True, IMAGE_ANIMATED_MAX_FRAMES=1)
+    def test_animated_thumbnail_falls_back_to_still(self):
+        self.assertFrames(render_thumbnail_bytes(create_animated_image(), 100), (100, 50), ['red'])
+
+    @override_settings(IMAGE_ANIMATED_THUMBNAILS=True)
+    def test_animated_thumbnail_in_subprocess(self):
+        data = create_animated_image()
+        self.assertEqual(render_in_subprocess(data, 100), render_thumbnail_bytes(data, 100))
+
+    def test_webp_thumbnail_uses_first_frame(self):
+        if not features.check('webp_anim'):
+            self.skipTest('Pillow was built without animated WebP support.')
+        data = create_animated_image('WEBP')
+        self.assertFrames(render_thumbnail_bytes(data, 100), (100, 50), ['red'])
+
+
+class AnimatedUploadTest(BaseViewsTest):
+
+    def test_upload_animated_gif(self):
+        self.client.force_login(self.user)
+        upload = SimpleUploadedFile('animated.gif', create_animated_image(), content_type='image/gif')
+        response = self.client.post(reverse('upload_image'), {'image': upload})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        image = Image.objects.get(pk=response.data['id'])
+        with PILImage.open(image.image.path) as original:
+            self.assertEqual(original.n_frames, len(COLORS))
+        self.assertIsNotNone(image.get_thumbnail(200))
+
+
+class UploadLimitsTest(BaseViewsTest):
+
+    def setUp(self):
+        settings_override = override_settings(IMAGE_MAX_PIXELS=1000)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_model_validation_rejects_large_image(self):
+        with self.assertRaises(ValidationError):
+            Image.objects.create(user=self.user, image=create_test_image())
+
+    def test_upload_view_rejects_large_image(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('upload_image'), {'image': create_test_image()})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('Image is too large', str(response.data))
+
+    def test_bulk_upload_rejects_large_image(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('bulk_upload_images'), {'images': [create_test_image()]})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('Image is too large', response.data['results'][0]['errors'][0])
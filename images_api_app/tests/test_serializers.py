@@ -1,3 +1,5 @@
+from unittest import mock
+
 from django.test import TestCase, RequestFactory
 from rest_framework.exceptions import ValidationError
 
@@ -88,6 +90,17 @@ class ImageSerializerTest(BaseSerializerTest):
         self.assertIn('thumbnail_200', data)
         self.assertIn('thumbnail_400', data)
 
+    def test_image_serializer_renders_each_thumbnail_once(self):
+        request = self.factory.get('/')
+        request.user = self.user
+        with mock.patch('images_api_app.serializers.take_render_quota', return_value=False) as take, \
+                mock.patch('images_api_app.models.enqueue') as enqueue:
+            data = ImageSerializer(instance=self.uploaded_image, context={'request': request}).data
+        self.assertIsNone(data['thumbnail_200'])
+        self.assertIsNone(data['thumbnail_400'])
+        self.assertEqual(take.call_count, 2)
+        self.assertEqual(enqueue.call_count, 2)
+
     def test_image_serializer_handle_user_validation(self):
         self.user.userprofile.account_tier = None
         self.user.userprofile.save()
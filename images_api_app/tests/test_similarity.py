@@ -0,0 +1,178 @@
+import multiprocessing
+import os
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+
+import numpy as np
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image as PILImage
+from rest_framework import status
+
+from .test_models import create_test_user
+from .test_views import BaseViewsTest
+from images_api_app.models import Image
+from images_api_app.similarity import (
+    SimilarityIndex, SimilarityIndexCache, dhash, popcount, similarity_indexes, to_signed, to_unsigned
+)
+
+
+def create_pattern_image(seed, size=(400, 300), format='PNG', file_name='pattern.png'):
+    """
+    Return an upload of smooth random blotches, a different picture for every seed.
+    """
+    cells = np.random.default_rng(seed).integers(0, 256, (6, 8, 3), dtype=np.uint8)
+    image = PILImage.fromarray(cells).resize(size, PILImage.BICUBIC)
+    output = BytesIO()
+    image.save(output, format=format)
+    return SimpleUploadedFile(file_name, output.getvalue(), content_type=f'image/{format.lower()}')
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+def open_upload(upload):
+    upload.seek(0)
+    return PILImage.open(BytesIO(upload.read()))
+
+
+def add_hashes(user_id, image_ids):
+    for image_id in image_ids:
+        similarity_indexes.add(user_id, image_id, to_signed(image_id))
+
+
+class PerceptualHashTest(TestCase):
+
+    def test_resized_copy_hashes_close(self):
+        original = dhash(open_upload(create_pattern_image(1)))
+        copy = dhash(open_upload(create_pattern_image(1, size=(200, 150), format='JPEG')))
+        other = dhash(open_upload(create_pattern_image(2)))
+        self.assertLessEqual(hamming(original, copy), 4)
+        self.assertGreater(hamming(original, other), 10)
+
+    def test_popcount(self):
+        values = np.random.default_rng(0).integers(0, 2 ** 63, 1000, dtype=np.int64).view(np.uint64)
+        values[0] = np.uint64(2 ** 64 - 1)
+        expected = [bin(int(value)).count('1') for value in values]
+        self.assertEqual(popcount(values).tolist(), expected)
+
+    def test_signed_round_trip(self):
+        for value in (0, 1, 2 ** 63 - 1, 2 ** 63, 2 ** 64 - 1):
+            self.assertEqual(to_unsigned(to_signed(value)), value)
+            self.assertLess(to_signed(value), 2 ** 63)
+
+    def test_index_search(self):
+        base = 2 ** 64 - 1
+        hashes = [base, base ^ 0b1, base ^ 0b111, 0]
+        index = SimilarityIndex([1, 2, 3, 4], [to_signed(value) for value in hashes])
+        self.assertEqual(index.search(base, 3), [(1, 0), (2, 1), (3, 3)])
+        self.assertEqual(index.search(base, 3, limit=2, exclude=1), [(2, 1), (3, 3)])
+        self.assertEqual(index.search(0, 0), [(4, 0)])
+
+    def test_with_hashes_adds_and_replaces(self):
+        index = SimilarityIndex([1, 2], [to_signed(0), to_signed(0b1)])
+        updated = index.with_hashes([(2, to_signed(0b11)), (3, to_signed(2 ** 64 - 1))])
+        self.assertEqual(index.search(0b1, 0), [(2, 0)])
+        self.assertEqual(updated.search(0b11, 0), [(2, 0)])
+        self.assertEqual(updated.search(2 ** 64 - 1, 0), [(3, 0)])
+        self.assertEqual(len(updated), 3)
+
+
+@skipUnless(hasattr(os, 'fork'), 'Needs forked processes.')
+class SimilarityIndexCacheProcessesTest(SimpleTestCase):
+
+    def test_concurrent_adds_keep_every_hash(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'image_list': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': directory,
+            },
+        }):
+            version = similarity_indexes._get_version(1)
+            context = multiprocessing.get_context('fork')
+            processes = [
+                context.Process(target=add_hashes, args=(1, range(start, start + 50)))
+                for start in range(0, 200, 50)
+            ]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+
+            self.assertEqual(similarity_indexes._get_version(1), version)
+            count = similarity_indexes.backend.get(similarity_indexes.added_key(1, version))
+            added = similarity_indexes._get_added(1, version, 0, count)
+            self.assertEqual(sorted(image_id for image_id, _ in added), list(range(200)))
+
+
+class SimilarImagesTest(BaseViewsTest):
+
+    def setUp(self):
+        similarity_indexes.clear()
+        self.client.force_login(self.user)
+
+    def upload(self, upload):
+        response = self.client.post(reverse('upload_image'), {'image': upload})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response
+
+    def test_upload_reports_near_duplicates(self):
+        first = self.upload(create_pattern_image(1))
+        self.assertEqual(first.data['similar_images'], [])
+        self.assertIsNotNone(Image.objects.get(pk=first.data['id']).phash)
+
+        self.upload(create_pattern_image(2))
+        copy = self.upload(create_pattern_image(1, size=(200, 150), format='JPEG', file_name='copy.jpg'))
+        self.assertEqual(copy.data['similar_images'], [first.data['id']])
+
+    def test_new_hashes_do_not_rebuild_index(self):
+        self.upload(create_pattern_image(1))
+        other_process = SimilarityIndexCache()
+        other_process.get(self.user.pk)
+        with mock.patch.object(SimilarityIndex, 'for_user', wraps=SimilarityIndex.for_user) as for_user:
+            self.upload(create_pattern_image(2))
+            copy = self.upload(create_pattern_image(1, size=(200, 150), format='JPEG', file_name='copy.jpg'))
+            self.assertEqual(len(other_process.get(self.user.pk)), 3)
+        for_user.assert_not_called()
+        self.assertEqual(len(copy.data['similar_images']), 1)
+
+    def test_similar_images_view(self):
+        first = Image.objects.create(user=self.user, image=create_pattern_image(1))
+        copy = Image.objects.create(
+            user=self.user, image=create_pattern_image(1, size=(200, 150), format='JPEG', file_name='copy.jpg'))
+        other = Image.objects.create(user=self.user, image=create_pattern_image(2))
+        copy.get_thumbnail(200)
+
+        response = self.client.get(reverse('similar_images', args=[first.pk]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([image['id'] for image in response.data['similar']], [copy.pk])
+        self.assertLessEqual(response.data['similar'][0]['distance'], 4)
+        self.assertNotIn(other.pk, [image['id'] for image in response.data['similar']])
+
+        copy.delete()
+        response = self.client.get(reverse('similar_images', args=[first.pk]))
+        self.assertEqual(response.data['similar'], [])
+
+    def test_compute_image_hashes_command(self):
+        image = Image.objects.create(user=self.user, image=create_pattern_image(1))
+        stdout = StringIO()
+        call_command('compute_image_hashes', stdout=stdout)
+        self.assertIn('Hashed 2 images, 0 failed.', stdout.getvalue())
+        image.refresh_from_db()
+        expected = dhash(open_upload(create_pattern_image(1)))
+        self.assertLessEqual(hamming(to_unsigned(image.phash), expected), 2)
+        self.assertFalse(Image.objects.filter(phash__isnull=True).exists())
+
+    def test_similar_images_of_other_user(self):
+        image = Image.objects.create(user=create_test_user('other'), image=create_pattern_image(1))
+        response = self.client.get(reverse('similar_images', args=[image.pk]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_invalid_distance(self):
+        response = self.client.get(reverse('similar_images', args=[self.uploaded_image.pk]), {'distance': 65})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
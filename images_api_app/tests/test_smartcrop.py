@@ -0,0 +1,97 @@
+from io import BytesIO
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase
+from PIL import Image as PILImage, ImageDraw
+from PIL.JpegImagePlugin import JpegImageFile
+
+from .test_views import BaseViewsTest
+from images_api_app.models import Image, ImageThumbnail, ThumbnailSize
+from images_api_app.rendering import render_in_subprocess, render_thumbnail_bytes
+from images_api_app.smartcrop import smart_crop_box
+
+
+def image_with_subject(size, subject_box, format='PNG'):
+    image = PILImage.new('RGB', size, color='gray')
+    draw = ImageDraw.Draw(image)
+    draw.rectangle(subject_box, fill='red', outline='yellow', width=3)
+    output = BytesIO()
+    image.save(output, format=format)
+    return output.getvalue()
+
+
+class SmartCropBoxTest(SimpleTestCase):
+
+    def test_crops_around_subject_horizontally(self):
+        image = PILImage.open(BytesIO(image_with_subject((600, 200), (460, 40, 560, 160))))
+        left, upper, right, lower = smart_crop_box(image, 1)
+        self.assertEqual((upper, right - left, lower), (0, 200, 200))
+        self.assertLessEqual(left, 460)
+        self.assertGreaterEqual(right, 560)
+
+    def test_crops_around_subject_vertically(self):
+        image = PILImage.open(BytesIO(image_with_subject((200, 600), (40, 20, 160, 120))))
+        left, upper, right, lower = smart_crop_box(image, 1)
+        self.assertEqual((left, right, lower - upper), (0, 200, 200))
+        self.assertLessEqual(upper, 20)
+
+    def test_flat_image_is_centre_cropped(self):
+        image = PILImage.new('RGB', (400, 200), color='blue')
+        self.assertEqual(smart_crop_box(image, 1), (100, 0, 300, 200))
+
+    def test_matching_aspect_is_not_cropped(self):
+        image = PILImage.new('RGB', (400, 200))
+        self.assertEqual(smart_crop_box(image, 2), (0, 0, 400, 200))
+
+
+class CroppedRenderingTest(SimpleTestCase):
+
+    def setUp(self):
+        self.image_bytes = image_with_subject((600, 300), (400, 50, 550, 250))
+
+    def test_renders_exact_size(self):
+        thumbnail = PILImage.open(BytesIO(render_thumbnail_bytes(self.image_bytes, 100, crop_width=150)))
+        self.assertEqual(thumbnail.size, (150, 100))
+        self.assertEqual(thumbnail.getpixel((110, 50))[:3], (255, 0, 0))
+
+    def test_small_images_are_not_enlarged(self):
+        thumbnail = PILImage.open(BytesIO(render_thumbnail_bytes(self.image_bytes, 1000, crop_width=1000)))
+        self.assertEqual(thumbnail.size, (300, 300))
+
+    def test_large_jpeg_is_drafted(self):
+        image_bytes = image_with_subject((2400, 1200), (1600, 200, 2200, 1000), format='JPEG')
+        draft = JpegImageFile.draft
+        with mock.patch.object(JpegImageFile, 'draft', autospec=True, side_effect=draft) as spy:
+            thumbnail = PILImage.open(BytesIO(render_thumbnail_bytes(image_bytes, 100, crop_width=150)))
+        # Decoded at 1/8 scale, 300x150, whose widest 3:2 crop still covers 150x100.
+        spy.assert_called_once_with(mock.ANY, 'RGB', (200, 100))
+        self.assertEqual(thumbnail.size, (150, 100))
+        red, green, blue = thumbnail.getpixel((110, 50))
+        self.assertGreater(red, 200)
+        self.assertLess(green, 60)
+
+    def test_render_in_subprocess(self):
+        self.assertEqual(
+            render_in_subprocess(self.image_bytes, 100, 100),
+            render_thumbnail_bytes(self.image_bytes, 100, crop_width=100))
+
+
+class CroppedThumbnailTest(BaseViewsTest):
+
+    def test_get_thumbnail_uses_crop_width(self):
+        ThumbnailSize.objects.create(height=120, crop_width=120)
+        self.uploaded_image.get_thumbnail(120)
+        thumbnail = ImageThumbnail.objects.get(image=self.uploaded_image, thumbnail_size__height=120)
+        with PILImage.open(thumbnail.thumbnail) as image:
+            self.assertEqual(image.size, (120, 120))
+        self.assertEqual(str(thumbnail.thumbnail_size), '120x120px')
+
+    def test_cropped_rendition_is_not_hashed(self):
+        ThumbnailSize.objects.create(height=120, crop_width=60)
+        image = Image.objects.create(
+            user=self.user, image=SimpleUploadedFile('wide.png', image_with_subject((400, 200), (20, 20, 80, 80))))
+        image.get_thumbnail(120)
+        self.assertIsNone(image.phash)
+        image.get_thumbnail(200)
+        self.assertIsNotNone(image.phash)
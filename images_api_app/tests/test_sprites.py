@@ -0,0 +1,124 @@
+from io import BytesIO
+
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from PIL import Image as PILImage
+from rest_framework import status
+
+from .test_models import create_test_image, create_test_user
+from .test_views import BaseViewsTest
+from images_api_app.models import Image
+from images_api_app.sprites import pack, sprite_sheets
+
+
+class PackTest(SimpleTestCase):
+
+    def test_wraps_rows_at_max_width(self):
+        positions, size = pack([(60, 40), (60, 50), (30, 40), (100, 20)], max_width=150)
+        self.assertEqual(positions, [(0, 0), (60, 0), (120, 0), (0, 50)])
+        self.assertEqual(size, (150, 70))
+
+    def test_wide_tile_gets_own_row(self):
+        self.assertEqual(pack([(200, 10)], max_width=100), ([(0, 0)], (200, 10)))
+
+
+class SpriteSheetTest(BaseViewsTest):
+
+    def setUp(self):
+        caches['image_list'].clear()
+        self.client.force_login(self.user)
+        self.other = Image.objects.create(user=self.user, image=create_test_image(color='red', size=(400, 200)))
+        self.other.get_thumbnail(200)
+        self.uploaded_image.get_thumbnail(200)
+
+    def request_sprite(self, ids, height=200):
+        return self.client.post(reverse('sprite_images'), {'ids': ids, 'height': height})
+
+    def test_sprite_sheet(self):
+        response = self.request_sprite([self.uploaded_image.pk, self.other.pk])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['missing'], [])
+        boxes = response.data['images']
+        self.assertEqual(boxes[self.uploaded_image.pk], {'x': 0, 'y': 0, 'width': 200, 'height': 200})
+        self.assertEqual(boxes[self.other.pk], {'x': 200, 'y': 0, 'width': 200, 'height': 100})
+
+        sheet = self.client.get(response.data['sprite'])
+        self.assertEqual(sheet.status_code, status.HTTP_200_OK)
+        self.assertEqual(sheet['Content-Type'], 'image/jpeg')
+        image = PILImage.open(BytesIO(b''.join(sheet.streaming_content)))
+        self.assertEqual(image.size, (400, 200))
+        red, green, blue = image.getpixel((300, 50))
+        self.assertGreater(red, 200)
+        self.assertLess(blue, 60)
+
+    def test_unrendered_and_foreign_images_are_missing(self):
+        foreign = Image.objects.create(user=create_test_user('other'), image=create_test_image())
+        foreign.get_thumbnail(200)
+        response = self.request_sprite([self.uploaded_image.pk, foreign.pk])
+        self.assertEqual(response.data['missing'], [foreign.pk])
+        self.assertEqual(list(response.data['images']), [self.uploaded_image.pk])
+
+    def test_cached_until_images_change(self):
+        first = self.request_sprite([self.uploaded_image.pk, self.other.pk]).data['sprite']
+        self.assertEqual(self.request_sprite([self.other.pk, self.uploaded_image.pk]).data['sprite'], first)
+        self.other.image_thumbnails.get().delete()
+        response = self.request_sprite([self.uploaded_image.pk, self.other.pk])
+        self.assertNotEqual(response.data['sprite'], first)
+        self.assertEqual(response.data['missing'], [self.other.pk])
+        self.assertEqual(self.client.get(first).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_sheets_are_stored_and_pruned(self):
+        first = self.request_sprite([self.uploaded_image.pk]).data['sprite']
+        token = first.rstrip('/').rsplit('/', 1)[-1]
+        sheet = sprite_sheets.get(self.user.pk, token)
+        self.assertNotIn('data', sheet)
+        self.assertTrue(default_storage.exists(sheet['name']))
+
+        self.other.image_thumbnails.get().delete()
+        self.request_sprite([self.uploaded_image.pk])
+        self.assertFalse(default_storage.exists(sheet['name']))
+        _, files = default_storage.listdir(sprite_sheets.directory(self.user.pk))
+        self.assertEqual(len(files), 1)
+
+    def test_sheets_are_deleted_with_their_images_and_user(self):
+        user = create_test_user('spriteuser')
+        user.userprofile.account_tier = self.enterprise_tier
+        user.userprofile.save()
+        image = Image.objects.create(user=user, image=create_test_image())
+        image.get_thumbnail(200)
+        self.client.force_login(user)
+        token = self.request_sprite([image.pk]).data['sprite'].rstrip('/').rsplit('/', 1)[-1]
+        name = sprite_sheets.get(user.pk, token)['name']
+
+        image.delete()
+        self.assertFalse(default_storage.exists(name))
+
+        image = Image.objects.create(user=user, image=create_test_image())
+        image.get_thumbnail(200)
+        token = self.request_sprite([image.pk]).data['sprite'].rstrip('/').rsplit('/', 1)[-1]
+        name = sprite_sheets.get(user.pk, token)['name']
+        user.delete()
+        self.assertFalse(default_storage.exists(name))
+
+    def test_pending_while_building(self):
+        ids = [self.uploaded_image.pk]
+        token = sprite_sheets.token(self.user.pk, 200, ids)
+        sprite_sheets.claim(self.user.pk, token)
+        response = self.request_sprite(ids)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response['Retry-After'], '1')
+
+    def test_sheet_is_private(self):
+        sprite = self.request_sprite([self.uploaded_image.pk]).data['sprite']
+        self.client.force_login(create_test_user('other'))
+        self.assertEqual(self.client.get(sprite).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_height_must_be_allowed(self):
+        self.assertEqual(self.request_sprite([self.uploaded_image.pk], 300).status_code, status.HTTP_403_FORBIDDEN)
+
+    @override_settings(IMAGE_SPRITE_MAX_IMAGES=1)
+    def test_too_many_images(self):
+        response = self.request_sprite([self.uploaded_image.pk, self.other.pk])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,16 @@
+import json
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import SimpleTestCase
+
+
+class MeasureStartupTest(SimpleTestCase):
+
+    def test_imaging_is_loaded_by_preload_only(self):
+        out = StringIO()
+        call_command('measure_startup', '--repeat=1', '--json', stdout=out)
+        run, = json.loads(out.getvalue())
+        self.assertFalse(run['imaging_at_setup'])
+        self.assertGreater(run['preload_rss'], 0)
+        self.assertGreater(run['setup'], 0)
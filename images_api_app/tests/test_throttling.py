@@ -0,0 +1,126 @@
+import threading
+import time
+from unittest import mock
+
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+
+from .test_models import create_test_image
+from .test_views import BaseViewsTest
+from images_api_app.models import Image
+from images_api_app.tasks import render_thumbnails
+from images_api_app.throttling import TokenBucket
+
+
+class TokenBucketTest(TestCase):
+
+    def setUp(self):
+        caches['throttle'].clear()
+
+    def test_consume_until_empty_then_refill(self):
+        bucket = TokenBucket('test', capacity=2, rate=1)
+        with mock.patch('images_api_app.throttling.time.time', return_value=1000.0):
+            self.assertEqual(bucket.consume(), 0)
+            self.assertEqual(bucket.consume(), 0)
+            self.assertAlmostEqual(bucket.consume(), 1.0)
+        with mock.patch('images_api_app.throttling.time.time', return_value=1000.5):
+            self.assertAlmostEqual(bucket.consume(), 0.5)
+        with mock.patch('images_api_app.throttling.time.time', return_value=1001.0):
+            self.assertEqual(bucket.consume(), 0)
+
+    def test_concurrent_consumers_share_the_tokens(self):
+        bucket = TokenBucket('test', capacity=5, rate=1)
+        barrier = threading.Barrier(20)
+        results = []
+
+        def consume():
+            barrier.wait()
+            results.append(bucket.consume())
+
+        def slow_get(cache, *args, **kwargs):
+            # Widens the window between reading and writing the bucket.
+            value = get(cache, *args, **kwargs)
+            time.sleep(0.01)
+            return value
+
+        get = LocMemCache.get
+        with mock.patch('images_api_app.throttling.time.time', return_value=1000.0), \
+                mock.patch.object(LocMemCache, 'get', slow_get):
+            threads = [threading.Thread(target=consume) for _ in range(20)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(results.count(0), 5)
+
+    def test_many_buckets_keep_their_limits(self):
+        bucket = TokenBucket('test', capacity=1, rate=0.001)
+        self.assertEqual(bucket.consume(), 0)
+        # More buckets than a cache with the default MAX_ENTRIES keeps.
+        for i in range(400):
+            TokenBucket(f'filler:{i}', capacity=1, rate=0.001).consume()
+        self.assertGreater(bucket.consume(), 0)
+
+    @override_settings(THROTTLE_LOCK_WAIT=0)
+    def test_locked_bucket_throttles(self):
+        caches['throttle'].set('throttle:test:lock', True)
+        self.assertGreater(TokenBucket('test', capacity=2, rate=1).consume(), 0)
+
+
+class TierThrottlingTest(BaseViewsTest):
+
+    def setUp(self):
+        caches['throttle'].clear()
+        self.client.force_login(self.user)
+
+    def tearDown(self):
+        for field in ('requests_per_second', 'concurrent_uploads', 'upload_bytes_per_day', 'renders_per_minute'):
+            setattr(self.enterprise_tier, field, None)
+        self.enterprise_tier.save()
+
+    def test_requests_per_second(self):
+        self.enterprise_tier.requests_per_second = 2
+        self.enterprise_tier.save()
+        responses = [self.client.get(reverse('list_images')) for _ in range(3)]
+        self.assertEqual([r.status_code for r in responses[:2]], [status.HTTP_200_OK] * 2)
+        self.assertEqual(responses[2].status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', responses[2])
+
+    def test_upload_bytes_per_day(self):
+        self.enterprise_tier.upload_bytes_per_day = 100
+        self.enterprise_tier.save()
+        response = self.client.post(reverse('upload_image'), {'image': create_test_image()})
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_concurrent_uploads(self):
+        self.enterprise_tier.concurrent_uploads = 1
+        self.enterprise_tier.save()
+        caches['throttle'].set(f'throttle:concurrent_uploads:{self.user.pk}', 1)
+        response = self.client.post(reverse('upload_image'), {'image': create_test_image()})
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+        caches['throttle'].set(f'throttle:concurrent_uploads:{self.user.pk}', 0)
+        response = self.client.post(reverse('upload_image'), {'image': create_test_image()})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(caches['throttle'].get(f'throttle:concurrent_uploads:{self.user.pk}'), 0)
+
+    def test_renders_per_minute(self):
+        self.enterprise_tier.renders_per_minute = 1
+        self.enterprise_tier.save()
+        image = Image.objects.create(user=self.user, image=create_test_image())
+        with mock.patch('images_api_app.models.enqueue') as enqueue:
+            response = self.client.get(reverse('list_images'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        thumbnails = [item[f'thumbnail_{size}'] for item in response.data for size in (200, 400)]
+        self.assertIn(None, thumbnails)
+        self.assertIn(mock.call(render_thumbnails, [image.pk], [400]), enqueue.call_args_list)
+
+    def test_render_quota_does_not_fail_upload(self):
+        self.enterprise_tier.renders_per_minute = 1
+        self.enterprise_tier.save()
+        response = self.client.post(reverse('upload_image'), {'image': create_test_image()})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Image.objects.filter(user=self.user).count(), 2)
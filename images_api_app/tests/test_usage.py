@@ -0,0 +1,90 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+
+from .test_views import BaseViewsTest
+from images_api_app.hotcache import rendition_cache
+from images_api_app.models import ImageAccessStats, UserUsageStats
+from images_api_app.usage import access_counters, write_counters
+
+
+class AccessCountersTest(BaseViewsTest):
+
+    def setUp(self):
+        access_counters.flush()
+        settings_override = override_settings(IMAGE_USAGE_FLUSH_INTERVAL=3600, IMAGE_USAGE_FLUSH_MAX_NAMES=1000)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.uploaded_image.get_thumbnail(200)
+        self.thumbnail_name = self.uploaded_image.image_thumbnails.get().thumbnail.name
+
+    def test_counters_are_written_behind(self):
+        for _ in range(3):
+            access_counters.record(self.uploaded_image.image.name, 1000)
+        access_counters.record(self.thumbnail_name, 10)
+        access_counters.record('images/unknown.png', 10)
+        self.assertFalse(ImageAccessStats.objects.exists())
+        self.assertEqual(access_counters.pending(), 3)
+
+        access_counters.flush()
+        access_counters.record(self.uploaded_image.image.name, 1000)
+        access_counters.flush()
+
+        stats = ImageAccessStats.objects.get(image=self.uploaded_image)
+        self.assertEqual((stats.original_views, stats.thumbnail_views, stats.egress_bytes), (4, 1, 4010))
+        self.assertIsNotNone(stats.last_accessed)
+        usage = UserUsageStats.objects.get(user=self.user)
+        self.assertEqual((usage.requests, usage.egress_bytes), (5, 4010))
+
+    def test_late_flush_keeps_latest_access(self):
+        latest = timezone.now()
+        write_counters({self.uploaded_image.image.name: [1, 10, latest]})
+        write_counters({self.uploaded_image.image.name: [1, 10, latest - timezone.timedelta(minutes=5)]})
+        stats = ImageAccessStats.objects.get(image=self.uploaded_image)
+        self.assertEqual((stats.last_accessed, stats.original_last_accessed), (latest, latest))
+        self.assertEqual(UserUsageStats.objects.get(user=self.user).last_accessed, latest)
+
+    def test_names_are_looked_up_by_index(self):
+        with connection.cursor() as cursor:
+            for table, column in (('images_api_app_image', 'image'), ('images_api_app_imagethumbnail', 'thumbnail')):
+                cursor.execute(f'EXPLAIN QUERY PLAN SELECT id FROM {table} WHERE {column} IN (%s, %s)', ['a', 'b'])
+                self.assertIn('USING', ' '.join(str(row[-1]) for row in cursor.fetchall()))
+
+    @override_settings(IMAGE_USAGE_FLUSH_MAX_NAMES=2)
+    def test_flush_when_enough_names_are_pending(self):
+        access_counters.record(self.uploaded_image.image.name, 1000)
+        self.assertFalse(ImageAccessStats.objects.exists())
+        access_counters.record(self.thumbnail_name, 10)
+        self.assertEqual(access_counters.pending(), 0)
+        self.assertTrue(ImageAccessStats.objects.exists())
+
+    def test_served_files_are_counted(self):
+        rendition_cache.clear()
+        self.client.get(f'/media/{self.thumbnail_name}')
+        self.client.get(f'/media/{self.thumbnail_name}')
+        self.client.get(reverse('serve_image', args=[self.uploaded_image.expiring_image_link]))
+        access_counters.flush()
+        stats = ImageAccessStats.objects.get(image=self.uploaded_image)
+        self.assertEqual((stats.original_views, stats.thumbnail_views), (1, 2))
+
+
+class UsageStatsViewTest(BaseViewsTest):
+
+    def test_admin_only(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('usage_stats'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_usage_stats(self):
+        access_counters.record(self.uploaded_image.image.name, 1000)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        response = self.client.get(reverse('usage_stats'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['images'][0]['id'], self.uploaded_image.pk)
+        self.assertEqual(response.data['images'][0]['original_views'], 1)
+        self.assertEqual(response.data['users'][0]['username'], self.user.username)
+        self.assertEqual(response.data['tiers'], [
+            {'tier': 'Enterprise', 'users': 1, 'requests': 1, 'egress_bytes': 1000}])
@@ -51,7 +51,8 @@ class UtilsTestCase(TestCase):
             self.assertIsNone(result)
 
     def test_valid_file_extensions(self):
-        valid_extensions = ["test_image.jpg", "test_image.JPG", "test_image.jpeg", "test_image.png"]
+        valid_extensions = ["test_image.jpg", "test_image.JPG", "test_image.jpeg", "test_image.png",
+                            "test_image.gif", "test_image.webp"]
         for ext in valid_extensions:
             self.assertTrue(is_valid_file_extension(ext))
 
@@ -1,14 +1,19 @@
+import json
 import os
 import shutil
 
-from django.test import TestCase, Client
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.conf import settings
 from django.contrib.auth.models import User
 from rest_framework import status
 
 from .test_models import create_test_user, create_test_image
-from images_api_app.models import AccountTier, Image, ThumbnailSize
+from images_api_app.models import AccountTier, Image, ImageChange, ThumbnailSize
+from images_api_app.quota import get_storage_usage
+from images_api_app.tasks import render_thumbnails
 from images_api_app.utils import generate_signed_url
 
 
@@ -104,6 +109,96 @@ class ImageUploadViewTest(BaseViewsTest):
             self.assertIsNotNone(response.data.get('expiring_image_link'))
 
 
+class BulkImageUploadViewTest(BaseViewsTest):
+
+    def test_bulk_upload_creates_all_images(self):
+        self.client.force_login(self.user)
+        files = [create_test_image(file_name=f'bulk_{i}.png') for i in range(3)]
+        response = self.client.post(reverse('bulk_upload_images'), {'images': files, 'expiry_time': 500})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        ids = [result['id'] for result in response.data['results']]
+        self.assertEqual(len(ids), 3)
+        for image in Image.objects.filter(pk__in=ids):
+            self.assertEqual(image.expiry_time, 500)
+            self.assertIsNotNone(image.expiring_image_link)
+            self.assertEqual(image.image_thumbnails.count(), 2)
+
+    def test_bulk_upload_partial_failure(self):
+        self.client.force_login(self.user)
+        files = [
+            create_test_image(file_name='bulk_valid.png'),
+            create_test_image(file_name='bulk_invalid.tiff', format='TIFF'),
+        ]
+        response = self.client.post(reverse('bulk_upload_images'), {'images': files})
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        valid, invalid = response.data['results']
+        self.assertEqual(valid['status'], 'created')
+        self.assertTrue(Image.objects.filter(pk=valid['id']).exists())
+        self.assertEqual(invalid['status'], 'error')
+        self.assertIn('Unsupported file extension', invalid['errors'][0])
+
+    def test_bulk_upload_all_invalid(self):
+        self.client.force_login(self.user)
+        response = self.client.post(
+            reverse('bulk_upload_images'),
+            {'images': [create_test_image(file_name='bulk_invalid.tiff', format='TIFF')]})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_upload_invalid_expiry_time(self):
+        self.client.force_login(self.user)
+        response = self.client.post(
+            reverse('bulk_upload_images'), {'images': [create_test_image()], 'expiry_time': 1})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('Image expiry link duration must be between 300 and 30000.', str(response.data))
+
+
+class BulkImageDeleteViewTest(BaseViewsTest):
+
+    def test_bulk_delete_removes_images_and_files(self):
+        self.client.force_login(self.user)
+        images = [Image.objects.create(user=self.user, image=create_test_image()) for _ in range(2)]
+        thumbnail_url = images[0].get_thumbnail(200)
+        paths = [image.image.path for image in images]
+        paths.append(os.path.join(settings.MEDIA_ROOT, thumbnail_url.replace(settings.MEDIA_URL, '', 1)))
+        response = self.client.post(
+            reverse('bulk_delete_images'), {'ids': [image.id for image in images] + [999999]})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['deleted'], sorted(image.id for image in images))
+        self.assertEqual(response.data['not_found'], [999999])
+        self.assertFalse(Image.objects.filter(pk__in=response.data['deleted']).exists())
+        for path in paths:
+            self.assertFalse(os.path.exists(path))
+
+    def test_bulk_delete_batches_side_effects(self):
+        self.client.force_login(self.user)
+
+        def delete_batch(count):
+            images = [Image.objects.create(user=self.user, image=create_test_image()) for _ in range(count)]
+            for image in images:
+                image.get_thumbnail(200)
+            with CaptureQueriesContext(connection) as queries:
+                self.client.post(reverse('bulk_delete_images'), {'ids': [image.id for image in images]})
+            return len(queries)
+
+        self.assertEqual(delete_batch(2), delete_batch(10))
+        self.assertEqual(get_storage_usage(self.user.pk), (self.uploaded_image.file_size, 1))
+        self.assertEqual(ImageChange.objects.filter(user=self.user, action=ImageChange.DELETED).count(), 12)
+
+    def test_bulk_delete_ignores_other_users_images(self):
+        other_user = create_test_user(username='otheruser')
+        other_image = Image.objects.create(user=other_user, image=create_test_image())
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('bulk_delete_images'), {'ids': [other_image.id]})
+        self.assertEqual(response.data['not_found'], [other_image.id])
+        self.assertTrue(Image.objects.filter(pk=other_image.id).exists())
+        self.assertTrue(os.path.exists(other_image.image.path))
+
+    def test_bulk_delete_requires_ids(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('bulk_delete_images'), {})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
 class UserImagesListViewTest(BaseViewsTest):
 
     def test_user_images_list_view(self):
@@ -114,6 +209,112 @@ class UserImagesListViewTest(BaseViewsTest):
         self.assertTrue(len(response.data) > 0)
 
 
+class UserImagesExportViewTest(BaseViewsTest):
+
+    def test_export_json(self):
+        Image.objects.create(user=self.user, image=create_test_image())
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('export_images'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([image['id'] for image in data],
+                         list(Image.objects.filter(user=self.user).order_by('pk').values_list('pk', flat=True)))
+        self.assertIn('thumbnail_400', data[0])
+
+    @override_settings(IMAGE_EXPORT_CHUNK_SIZE=2)
+    def test_export_does_not_render(self):
+        self.uploaded_image.get_thumbnail(200)
+        unrendered = Image.objects.create(user=self.user, image=create_test_image())
+        Image.objects.create(user=self.user, image=create_test_image())
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('export_images'))
+        with self.assertNumQueries(6):
+            data = {image['id']: image for image in json.loads(b''.join(response.streaming_content))}
+        self.assertTrue(data[self.uploaded_image.pk]['thumbnail_200'].endswith('_200.png'))
+        self.assertIsNone(data[unrendered.pk]['thumbnail_200'])
+        self.assertFalse(unrendered.image_thumbnails.exists())
+
+    def test_export_ndjson(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('export_images'), {'output': 'ndjson'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), Image.objects.filter(user=self.user).count())
+        self.assertEqual(json.loads(lines[0])['user'], self.user.username)
+
+    def test_export_empty_library(self):
+        other_user = create_test_user(username='emptyuser')
+        other_user.userprofile.account_tier = self.enterprise_tier
+        other_user.userprofile.save()
+        self.client.force_login(other_user)
+        response = self.client.get(reverse('export_images'))
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), [])
+
+    def test_export_invalid_output(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('export_images'), {'output': 'xml'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class UserImagesChangesViewTest(BaseViewsTest):
+
+    def get_changes(self, **params):
+        response = self.client.get(reverse('image_changes'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_changes_since_cursor(self):
+        self.client.force_login(self.user)
+        cursor = self.get_changes()['cursor']
+        self.assertEqual(self.get_changes(cursor=cursor)['images'], [])
+
+        created = Image.objects.create(user=self.user, image=create_test_image())
+        deleted = Image.objects.create(user=self.user, image=create_test_image())
+        deleted_id = deleted.id
+        deleted.delete()
+        data = self.get_changes(cursor=cursor)
+        self.assertEqual([image['id'] for image in data['images']], [created.id])
+        self.assertEqual(data['deleted'], [deleted_id])
+        self.assertGreater(data['cursor'], cursor)
+
+        data = self.get_changes(cursor=data['cursor'])
+        self.assertEqual(data['images'], [])
+        self.assertEqual(data['deleted'], [])
+
+    def test_changes_include_bulk_uploads(self):
+        self.client.force_login(self.user)
+        cursor = self.get_changes()['cursor']
+        response = self.client.post(reverse('bulk_upload_images'), {'images': [create_test_image()]})
+        data = self.get_changes(cursor=cursor)
+        self.assertEqual([image['id'] for image in data['images']], [response.data['results'][0]['id']])
+
+    def test_changes_include_only_stored_renders(self):
+        self.client.force_login(self.user)
+        self.uploaded_image.get_thumbnail(200)
+        image = Image.objects.create(user=self.user, image=create_test_image())
+        # Listing the changes would render the new image's thumbnails.
+        cursor = ImageChange.objects.latest('pk').pk
+        render_thumbnails([self.uploaded_image.pk, image.pk], [200])
+        self.assertEqual([item['id'] for item in self.get_changes(cursor=cursor)['images']], [image.id])
+
+    def test_changes_paging(self):
+        self.client.force_login(self.user)
+        cursor = self.get_changes()['cursor']
+        for _ in range(2):
+            Image.objects.create(user=self.user, image=create_test_image())
+        data = self.get_changes(cursor=cursor, limit=1)
+        self.assertTrue(data['has_more'])
+        self.assertEqual(len(data['images']), 1)
+
+    def test_changes_only_for_own_images(self):
+        other_user = create_test_user(username='otheruser')
+        self.client.force_login(self.user)
+        cursor = self.get_changes()['cursor']
+        Image.objects.create(user=other_user, image=create_test_image())
+        self.assertEqual(self.get_changes(cursor=cursor)['images'], [])
+
+
 class GenerateExpiringLinkViewTest(BaseViewsTest):
 
     def test_generate_expiring_link_view_valid(self):
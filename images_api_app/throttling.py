@@ -0,0 +1,187 @@
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.exceptions import Throttled
+from rest_framework.throttling import BaseThrottle
+
+from .cache import cache_lock
+
+
+class TokenBucket:
+    """
+    Token bucket whose state is kept in the THROTTLE_CACHE_ALIAS cache, so all
+    workers sharing that cache share the bucket. Each update holds the
+    bucket's cache_lock, so concurrent requests cannot spend the same tokens.
+    """
+
+    def __init__(self, key, capacity, rate):
+        self.key = f'throttle:{key}'
+        self.capacity = capacity
+        self.rate = rate
+
+    @property
+    def cache(self):
+        return caches[settings.THROTTLE_CACHE_ALIAS]
+
+    def consume(self, amount=1):
+        """
+        Take amount tokens from the bucket. Return 0 when they were available,
+        otherwise the number of seconds until they will be, or until the lock
+        expires when it could not be taken.
+        """
+        with cache_lock(self.cache, self.key) as locked:
+            if not locked:
+                return settings.THROTTLE_LOCK_TIMEOUT
+            now = time.time()
+            tokens, updated = self.cache.get(self.key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+            timeout = math.ceil(self.capacity / self.rate) + 1
+            if tokens >= amount:
+                self.cache.set(self.key, (tokens - amount, now), timeout)
+                return 0
+            self.cache.set(self.key, (tokens, now), timeout)
+            return (amount - tokens) / self.rate
+
+
+def get_account_tier(user):
+    if not user or not user.is_authenticated or user.is_staff:
+        return None
+    profile = getattr(user, 'userprofile', None)
+    return profile.account_tier if profile else None
+
+
+class TierThrottle(BaseThrottle):
+    """
+    Base class for throttles configured by an AccountTier field. A tier
+    without a value for the field, staff and users without a tier are not limited.
+    """
+    tier_field = None
+    period = 1
+
+    def get_amount(self, request):
+        return 1
+
+    def allow_request(self, request, view):
+        self.wait_time = self.consume(request.user, self.get_amount(request))
+        return not self.wait_time
+
+    def consume(self, user, amount=1):
+        """
+        Charge amount to the user's bucket and return the seconds to wait, or
+        None when the user is not limited.
+        """
+        tier = get_account_tier(user)
+        limit = getattr(tier, self.tier_field, None) if tier else None
+        if not limit:
+            return None
+        bucket = TokenBucket(f'{self.tier_field}:{user.pk}', limit, limit / self.period)
+        return bucket.consume(amount)
+
+    def wait(self):
+        return self.wait_time
+
+
+class TierRateThrottle(TierThrottle):
+    tier_field = 'requests_per_second'
+
+
+class UploadBytesThrottle(TierThrottle):
+    tier_field = 'upload_bytes_per_day'
+    period = 24 * 60 * 60
+
+    def get_amount(self, request):
+        return int(request.META.get('CONTENT_LENGTH') or 0)
+
+
+class DirectUploadBytesThrottle(UploadBytesThrottle):
+    """
+    Charge a direct upload's announced size when its upload URL is issued.
+    """
+
+    def get_amount(self, request):
+        try:
+            return max(0, int(request.data.get('size') or 0))
+        except (TypeError, ValueError):
+            return 0
+
+
+class ObtainTokenThrottle(BaseThrottle):
+    """
+    Limit password checks at the token endpoint to API_TOKEN_REQUESTS_PER_MINUTE
+    per client address, whether or not they succeed.
+    """
+
+    def allow_request(self, request, view):
+        limit = settings.API_TOKEN_REQUESTS_PER_MINUTE
+        bucket = TokenBucket(f'obtain_token:{self.get_ident(request)}', limit, limit / 60)
+        self.wait_time = bucket.consume()
+        return not self.wait_time
+
+    def wait(self):
+        return self.wait_time
+
+
+def take_render_quota(user):
+    """
+    Take one render from the user's renders_per_minute bucket and return
+    whether one was left. Renders happen while a response is serialized,
+    after uploads are stored, so running out defers the render instead of
+    failing the request.
+    """
+    tier = get_account_tier(user)
+    if not tier or not tier.renders_per_minute:
+        return True
+    limit = tier.renders_per_minute
+    bucket = TokenBucket(f'renders_per_minute:{user.pk}', limit, limit / 60)
+    return not bucket.consume()
+
+
+def take_upload_slot(user):
+    """
+    Take one of the user's concurrent_uploads slots and return its key, to be
+    passed to release_upload_slot, or None when the user is not limited.
+    Raise Throttled when all slots are taken.
+    """
+    tier = get_account_tier(user)
+    if not tier or not tier.concurrent_uploads:
+        return None
+    cache = caches[settings.THROTTLE_CACHE_ALIAS]
+    key = f'throttle:concurrent_uploads:{user.pk}'
+    # incr and decr are a get and a set outside the memory and memcached backends.
+    with cache_lock(cache, key) as locked:
+        cache.add(key, 0, settings.THROTTLE_UPLOAD_SLOT_TIMEOUT)
+        if not locked or cache.incr(key) > tier.concurrent_uploads:
+            if locked:
+                cache.decr(key)
+            raise Throttled(wait=1, detail='Too many uploads in progress.')
+    return key
+
+
+def release_upload_slot(key):
+    if not key:
+        return
+    cache = caches[settings.THROTTLE_CACHE_ALIAS]
+    with cache_lock(cache, key):
+        try:
+            cache.decr(key)
+        except ValueError:
+            pass
+
+
+class UploadConcurrencyMixin:
+    """
+    Limit how many uploads a user can have in progress at once to the
+    tier's concurrent_uploads.
+    """
+    upload_slot_key = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.upload_slot_key = take_upload_slot(request.user)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        release_upload_slot(self.upload_slot_key)
+        self.upload_slot_key = None
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -2,18 +2,38 @@ from django.urls import path
 
 from .views import (
     AccountTierListView, AccountTierDetailView, UserProfileListView, UserProfileDetailView, ImageUploadView,
-    UserImagesListView, GenerateExpiringLinkView, ThumbnailSizeListView, ThumbnailSizeDetailView, serve_image
+    BulkImageUploadView, BulkImageDeleteView, UserImagesListView, UserImagesExportView,
+    UserImagesZipExportView, UserImagesChangesView, GenerateExpiringLinkView, ThumbnailSizeListView,
+    ThumbnailSizeDetailView, MetricsView, ObtainTokenView, RevokeTokenView, DirectUploadView,
+    DirectUploadFinalizeView, SimilarImagesView, UsageStatsView, UserImagesSpriteView, SpriteSheetView,
+    OriginalImageView, direct_upload, serve_image
 )
 
 urlpatterns = [
+    path('token/', ObtainTokenView.as_view(), name='obtain_token'),
+    path('token/revoke/', RevokeTokenView.as_view(), name='revoke_token'),
     path('account-tier/', AccountTierListView.as_view(), name='account_tier_list'),
     path('account-tier/<int:pk>/', AccountTierDetailView.as_view(), name='account_tier_detail'),
     path('user-profile/', UserProfileListView.as_view(), name='user_profile_list'),
     path('user-profile/<int:pk>/', UserProfileDetailView.as_view(), name='user_profile_detail'),
     path('upload/', ImageUploadView.as_view(), name='upload_image'),
+    path('upload/bulk/', BulkImageUploadView.as_view(), name='bulk_upload_images'),
+    path('upload/direct/', DirectUploadView.as_view(), name='direct_upload'),
+    path('upload/direct/finalize/', DirectUploadFinalizeView.as_view(), name='direct_upload_finalize'),
+    path('upload/direct/<str:token>/', direct_upload, name='direct_upload_put'),
+    path('delete/', BulkImageDeleteView.as_view(), name='bulk_delete_images'),
     path('list/', UserImagesListView.as_view(), name='list_images'),
+    path('list/export/', UserImagesExportView.as_view(), name='export_images'),
+    path('list/export/zip/', UserImagesZipExportView.as_view(), name='export_images_zip'),
+    path('list/sprite/', UserImagesSpriteView.as_view(), name='sprite_images'),
+    path('list/sprite/<str:token>/', SpriteSheetView.as_view(), name='sprite_sheet'),
+    path('list/changes/', UserImagesChangesView.as_view(), name='image_changes'),
+    path('original/<int:pk>/', OriginalImageView.as_view(), name='original_image'),
+    path('similar/<int:pk>/', SimilarImagesView.as_view(), name='similar_images'),
     path('expiring-link/<int:pk>/', GenerateExpiringLinkView.as_view(), name='generate_expiring_link'),
     path('thumbnail-size/', ThumbnailSizeListView.as_view(), name='thumbnail_size_list'),
     path('thumbnail-size/<int:pk>/', ThumbnailSizeDetailView.as_view(), name='thumbnail_size_detail'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    path('usage/', UsageStatsView.as_view(), name='usage_stats'),
     path('serve-image/<str:signed_url>/', serve_image, name='serve_image'),
 ]
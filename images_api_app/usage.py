@@ -0,0 +1,152 @@
+"""
+Write-behind access counters for served files.
+
+Serving a file only bumps an in-memory counter keyed by its storage name.
+The counters are flushed in the background every IMAGE_USAGE_FLUSH_INTERVAL
+seconds or IMAGE_USAGE_FLUSH_MAX_NAMES names, resolving names to images with
+two queries and adding them to the stats tables with one multi-row upsert
+per table. Counts of a worker that dies between flushes are lost.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .tasks import get_executor, run_task
+
+
+class AccessCounters:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._flush_scheduled = False
+        self._last_flush = time.monotonic()
+
+    def record(self, name, size):
+        """
+        Count one request for a stored file and the bytes sent for it.
+        """
+        if not name:
+            return
+        now = time.monotonic()
+        with self._lock:
+            counts = self._pending.get(name)
+            if counts is None:
+                self._pending[name] = [1, size, timezone.now()]
+            else:
+                counts[0] += 1
+                counts[1] += size
+                counts[2] = timezone.now()
+            due = (
+                len(self._pending) >= settings.IMAGE_USAGE_FLUSH_MAX_NAMES
+                or now - self._last_flush >= settings.IMAGE_USAGE_FLUSH_INTERVAL)
+            if not due or self._flush_scheduled:
+                return
+            self._flush_scheduled = True
+        if settings.IMAGE_TASKS_EAGER:
+            self.flush()
+        else:
+            get_executor().submit(run_task, self.flush, (), {})
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """
+        Write the pending counters to ImageAccessStats and UserUsageStats.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._flush_scheduled = False
+            self._last_flush = time.monotonic()
+        if not pending:
+            return
+        try:
+            write_counters(pending)
+        except Exception as e:
+            logging.error(f"An error occurred while flushing access counters: {e}")
+
+
+def write_counters(pending):
+    from .models import Image, ImageAccessStats, ImageThumbnail, UserUsageStats
+
+    names = list(pending)
+    images = {}
+    for name, image_id, user_id in Image.objects.filter(image__in=names).values_list('image', 'pk', 'user_id'):
+        images[name] = (image_id, user_id, True)
+    thumbnails = ImageThumbnail.objects.filter(thumbnail__in=names).values_list(
+        'thumbnail', 'image_id', 'image__user_id')
+    for name, image_id, user_id in thumbnails:
+        images[name] = (image_id, user_id, False)
+
+    image_rows = defaultdict(lambda: [0, 0, 0, None, None])
+    user_rows = defaultdict(lambda: [0, 0, None])
+    for name, (requests, size, accessed) in pending.items():
+        if name not in images:
+            continue
+        image_id, user_id, is_original = images[name]
+        row = image_rows[image_id]
+        row[0 if is_original else 1] += requests
+        row[2] += size
+        row[3] = max(row[3], accessed) if row[3] else accessed
+        if is_original:
+            row[4] = max(row[4], accessed) if row[4] else accessed
+        row = user_rows[user_id]
+        row[0] += requests
+        row[1] += size
+        row[2] = max(row[2], accessed) if row[2] else accessed
+
+    with transaction.atomic():
+        upsert(
+            ImageAccessStats, 'image_id', ['original_views', 'thumbnail_views', 'egress_bytes'],
+            [(image_id, *row) for image_id, row in image_rows.items()],
+            timestamps=['last_accessed', 'original_last_accessed'])
+        upsert(
+            UserUsageStats, 'user_id', ['requests', 'egress_bytes'],
+            [(user_id, *row) for user_id, row in user_rows.items()])
+
+
+def upsert(model, key, counters, rows, timestamps=('last_accessed',)):
+    """
+    Add counter values to a stats table in one statement per batch, inserting
+    missing rows, and advance the timestamp columns. Rows are
+    (key, *counters, *timestamps); a None timestamp leaves its column as is.
+    """
+    if not rows:
+        return
+    quote = connection.ops.quote_name
+    columns = [key, *counters, *timestamps]
+    updates = [f'{quote(column)} = {quote(model._meta.db_table)}.{quote(column)} + excluded.{quote(column)}'
+               for column in counters]
+    # A flush of older counters, e.g. from another worker, must not move a timestamp back.
+    for column in timestamps:
+        current = f'{quote(model._meta.db_table)}.{quote(column)}'
+        latest = f'excluded.{quote(column)}'
+        updates.append(
+            f'{quote(column)} = CASE WHEN {current} IS NULL OR {latest} > {current} '
+            f'THEN {latest} ELSE {current} END')
+    placeholders = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    batch_size = max(1, 900 // len(columns))
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            params = []
+            for row in batch:
+                params.extend(row[:-len(timestamps)])
+                params.extend(connection.ops.adapt_datetimefield_value(value) for value in row[-len(timestamps):])
+            cursor.execute(
+                f'INSERT INTO {quote(model._meta.db_table)} ({", ".join(quote(c) for c in columns)}) '
+                f'VALUES {", ".join([placeholders] * len(batch))} '
+                f'ON CONFLICT ({quote(key)}) DO UPDATE SET {", ".join(updates)}',
+                params)
+
+
+access_counters = AccessCounters()
+atexit.register(access_counters.flush)
@@ -12,6 +12,21 @@ def generate_signed_url(url, expiry_time):
     return signed_url
 
 
+def get_upload_serializer():
+    return URLSafeTimedSerializer(settings.SECRET_KEY, salt='direct-upload')
+
+
+def generate_upload_token(user_id, name, size):
+    """
+    Sign the storage name a user may upload at most size bytes to.
+    """
+    return get_upload_serializer().dumps({'user': user_id, 'name': name, 'size': size})
+
+
+def load_upload_token(token, max_age):
+    return get_upload_serializer().loads(token, max_age=max_age)
+
+
 def get_expiring_image_link(request, obj):
     user = request.user if request else None
     if user and hasattr(user, 'userprofile') and user.userprofile.account_tier:
@@ -25,6 +40,6 @@ def get_expiring_image_link(request, obj):
 
 
 def is_valid_file_extension(file_name):
-    valid_extensions = ['.jpeg', '.jpg', '.png']
+    valid_extensions = ['.jpeg', '.jpg', '.png', '.apng', '.gif', '.webp']
     ext = os.path.splitext(file_name)[1].lower()
     return ext in valid_extensions
@@ -1,17 +1,58 @@
+import json
+import mimetypes
 import os
+import uuid
 from urllib.parse import urlparse
 
 from django.conf import settings
-from django.http import FileResponse, HttpResponseForbidden
-from rest_framework import generics, permissions, status, serializers
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import User
+from django.core.exceptions import SuspiciousFileOperation, ValidationError
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Count, F, Prefetch, Sum
+from django.http import (
+    FileResponse, Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, StreamingHttpResponse
+)
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.utils._os import safe_join
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+from rest_framework import exceptions, generics, permissions, status, serializers, views
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils import encoders
 from itsdangerous import URLSafeTimedSerializer, SignatureExpired, BadSignature, BadTimeSignature
 
-from .models import AccountTier, Image, ThumbnailSize, UserProfile
+from .archive import stream_zip
+from .authentication import issue_token, revoke_token
+from .cache import image_list_cache
+from .coldstorage import open_original
+from .hotcache import rendition_cache
+from .metrics import record_bytes, registry, timed
+from .models import (
+    AccountTier, Image, ImageAccessStats, ImageChange, ImageThumbnail, ThumbnailSize, UserProfile, UserUsageStats,
+    delete_images,
+)
+from .pipeline import ingest_upload
+from .quota import StorageQuotaMixin, adjust_storage_usage, check_storage_quota
+from .rendering import check_upload_limits
 from .serializers import (
-    AccountTierSerializer, ImageSerializer, ThumbnailSizeSerializer, UserProfileSerializer
+    AccountTierSerializer, ImageSerializer, ThumbnailSizeSerializer, UserProfileSerializer,
+    get_allowed_thumbnail_sizes, is_original_allowed
 )
-from .utils import is_valid_file_extension
+from .similarity import dhash_file, find_similar_images
+from .sprites import build_sprite_sheet, sprite_sheets
+from .tasks import enqueue, render_thumbnails
+from .usage import access_counters
+from .throttling import (
+    DirectUploadBytesThrottle, ObtainTokenThrottle, TierRateThrottle, UploadBytesThrottle, UploadConcurrencyMixin,
+    get_account_tier, release_upload_slot, take_upload_slot,
+)
+from .utils import generate_signed_url, generate_upload_token, is_valid_file_extension, load_upload_token
 
 
 def serve_image(request, signed_url):
@@ -23,12 +64,18 @@ def serve_image(request, signed_url):
         expiry_time = data['expiry_time']
         s.loads(signed_url, max_age=expiry_time)
         url_path = urlparse(expiring_url).path
-        file_path = settings.MEDIA_ROOT + url_path.replace(
-            settings.MEDIA_URL, '/'
-        )
-        if not os.path.exists(file_path) or os.path.isdir(file_path):
-            return HttpResponseForbidden('Image not found')
-        return FileResponse(open(file_path, 'rb'))
+        name = url_path.replace(settings.MEDIA_URL, '', 1)
+        with timed('storage_read'):
+            # Originals moved to cold storage are restored on first access.
+            try:
+                f = open_original(name)
+            except (FileNotFoundError, IsADirectoryError):
+                return HttpResponseForbidden('Image not found')
+            response = FileResponse(f)
+        size = os.fstat(f.fileno()).st_size
+        record_bytes('storage_read', size)
+        access_counters.record(name, size)
+        return response
 
     except SignatureExpired:
         return HttpResponseForbidden('The image link has expired')
@@ -36,6 +83,227 @@ def serve_image(request, signed_url):
         return HttpResponseForbidden('Invalid image link')
 
 
+def serve_thumbnail(request, path):
+    """
+    Serve a rendered thumbnail, straight from the rendition cache when it is
+    hot. Small files read from disk are added to the cache. Responses carry
+    the file's Last-Modified and ETag, and conditional requests that match
+    are answered with 304 without reading the file or the cache.
+    """
+    name = f'thumbnails/{path}'
+    try:
+        file_path = safe_join(settings.MEDIA_ROOT, name)
+        stat = os.stat(file_path)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404('Thumbnail not found')
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if not_modified is not None:
+        access_counters.record(name, 0)
+        return set_file_validators(not_modified, etag, stat)
+
+    data = rendition_cache.get(name)
+    if data is None:
+        try:
+            with timed('storage_read'):
+                f = open(file_path, 'rb')
+        except OSError:
+            raise Http404('Thumbnail not found')
+        size = os.fstat(f.fileno()).st_size
+        record_bytes('storage_read', size)
+        if not rendition_cache.cacheable(size):
+            access_counters.record(name, size)
+            return set_file_validators(FileResponse(f), etag, stat)
+        with f:
+            data = f.read()
+        rendition_cache.set(name, data)
+        cache_status = 'MISS'
+    else:
+        cache_status = 'HIT'
+
+    access_counters.record(name, len(data))
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    response = HttpResponse(data, content_type=content_type)
+    response['X-Cache'] = cache_status
+    return set_file_validators(response, etag, stat)
+
+
+def set_file_validators(response, etag, stat):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    return response
+
+
+@csrf_exempt
+@require_http_methods(['PUT'])
+def direct_upload(request, token):
+    """
+    Write the request body straight to storage under the name signed into the
+    token. Only the signature and size are checked here; the file itself is
+    validated when the upload is finalized. The request counts against the
+    token user's requests_per_second and takes one of their concurrent_uploads
+    slots while the body is written.
+    """
+    try:
+        payload = load_upload_token(token, settings.IMAGE_DIRECT_UPLOAD_MAX_AGE)
+    except SignatureExpired:
+        return HttpResponseForbidden('The upload link has expired')
+    except (BadSignature, BadTimeSignature):
+        return HttpResponseForbidden('Invalid upload link')
+    user = User.objects.select_related('userprofile__account_tier').filter(pk=payload['user']).first()
+    if user is None:
+        return HttpResponseForbidden('Invalid upload link')
+
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        length = 0
+    if not length:
+        return HttpResponseBadRequest('Content-Length required')
+    if length > payload['size']:
+        return HttpResponse('Upload is larger than announced', status=413)
+
+    wait = TierRateThrottle().consume(user)
+    if wait:
+        return throttled_response(exceptions.Throttled(wait))
+    try:
+        slot = take_upload_slot(user)
+    except exceptions.Throttled as e:
+        return throttled_response(e)
+    try:
+        if default_storage.exists(payload['name']):
+            return HttpResponse('The upload link has already been used', status=409)
+        with timed('storage_write'):
+            name = default_storage.save(payload['name'], File(request, name=payload['name']))
+        if name != payload['name']:
+            # Another request with the same link won the race.
+            default_storage.delete(name)
+            return HttpResponse('The upload link has already been used', status=409)
+    finally:
+        release_upload_slot(slot)
+    record_bytes('storage_write', length)
+    return HttpResponse(status=201)
+
+
+def throttled_response(exception):
+    response = HttpResponse(exception.detail, status=exception.status_code)
+    response['Retry-After'] = str(exception.wait)
+    return response
+
+
+def parse_expiry_time(value):
+    try:
+        expiry_time = int(value)
+    except ValueError:
+        raise serializers.ValidationError('Image expiry link duration must be numbers.')
+    if expiry_time not in range(300, 30001):
+        raise serializers.ValidationError(
+            'Image expiry link duration must be between 300 and 30000.'
+        )
+    return expiry_time
+
+
+def parse_image_ids(request, max_ids=None):
+    ids = request.data.getlist('ids') if hasattr(request.data, 'getlist') else request.data.get('ids')
+    if not ids or not isinstance(ids, list):
+        raise serializers.ValidationError('Image ids not provided.')
+    try:
+        ids = {int(pk) for pk in ids}
+    except (TypeError, ValueError):
+        raise serializers.ValidationError('Image ids must be numbers.')
+    if max_ids and len(ids) > max_ids:
+        raise serializers.ValidationError(f'At most {max_ids} images can be requested at once.')
+    return ids
+
+
+class MetricsView(views.APIView):
+    """
+    Expose request and phase timing histograms in the Prometheus text format.
+    The metrics are those of the worker process serving the request, see
+    images_api_app.metrics.Registry.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4')
+
+
+class UsageStatsView(views.APIView):
+    """
+    Report the most viewed images, the users with the most egress and usage
+    per account tier, from the write-behind access counters.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            limit = int(request.query_params.get('limit', 50))
+        except ValueError:
+            raise serializers.ValidationError('Limit must be a number.')
+        limit = max(1, min(limit, 1000))
+        access_counters.flush()
+
+        images = ImageAccessStats.objects.annotate(
+            views=F('original_views') + F('thumbnail_views'),
+        ).order_by('-views').values(
+            'image_id', 'image__user_id', 'original_views', 'thumbnail_views', 'egress_bytes', 'last_accessed',
+        )[:limit]
+        users = UserUsageStats.objects.order_by('-egress_bytes').values(
+            'user_id', 'user__username', 'requests', 'egress_bytes', 'last_accessed')[:limit]
+        tiers = UserUsageStats.objects.values(
+            tier=F('user__userprofile__account_tier__name'),
+        ).annotate(
+            users=Count('user_id'), requests=Sum('requests'), egress_bytes=Sum('egress_bytes'),
+        ).order_by('-egress_bytes')
+        return Response({
+            'images': [
+                {
+                    'id': row['image_id'], 'user': row['image__user_id'], 'original_views': row['original_views'],
+                    'thumbnail_views': row['thumbnail_views'], 'egress_bytes': row['egress_bytes'],
+                    'last_accessed': row['last_accessed'],
+                }
+                for row in images
+            ],
+            'users': [
+                {
+                    'id': row['user_id'], 'username': row['user__username'], 'requests': row['requests'],
+                    'egress_bytes': row['egress_bytes'], 'last_accessed': row['last_accessed'],
+                }
+                for row in users
+            ],
+            'tiers': list(tiers),
+        })
+
+
+class ObtainTokenView(views.APIView):
+    """
+    Exchange a username and password for a signed bearer token.
+    """
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+    throttle_classes = [ObtainTokenThrottle]
+
+    def post(self, request, *args, **kwargs):
+        user = authenticate(
+            request, username=request.data.get('username'), password=request.data.get('password'))
+        if user is None:
+            raise exceptions.AuthenticationFailed('Invalid username or password.')
+        return Response({'token': issue_token(user), 'expires_in': settings.API_TOKEN_MAX_AGE})
+
+
+class RevokeTokenView(views.APIView):
+    """
+    Revoke the bearer token used to authenticate this request.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        if not isinstance(request.auth, dict) or 'jti' not in request.auth:
+            raise serializers.ValidationError('Request was not authenticated with a bearer token.')
+        revoke_token(request.auth)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 class AccountTierListView(generics.ListCreateAPIView):
     queryset = AccountTier.objects.all()
     serializer_class = AccountTierSerializer
@@ -72,13 +340,26 @@ class UserProfileDetailView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [permissions.IsAdminUser]
 
 
-class ImageUploadView(generics.CreateAPIView):
+class ImageUploadView(StorageQuotaMixin, UploadConcurrencyMixin, generics.CreateAPIView):
     """
-    Upload JPG or PNG image.
+    Upload JPG, PNG, GIF or WebP image.
     """
     queryset = Image.objects.all()
     serializer_class = ImageSerializer
     permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = api_settings.DEFAULT_THROTTLE_CLASSES + [UploadBytesThrottle]
+
+    def create(self, request, *args, **kwargs):
+        """
+        Upload the image and list the user's existing images it is a near duplicate of.
+        """
+        response = super().create(request, *args, **kwargs)
+        response.data['similar_images'] = [
+            pk for pk, _ in find_similar_images(
+                self.created_image, settings.IMAGE_SIMILARITY_DUPLICATE_DISTANCE,
+                limit=settings.IMAGE_SIMILARITY_MAX_RESULTS)
+        ]
+        return response
 
     def perform_create(self, serializer):
         """
@@ -87,26 +368,231 @@ class ImageUploadView(generics.CreateAPIView):
         uploaded_file = self.request.FILES.get('image')
         if uploaded_file:
             if is_valid_file_extension(uploaded_file.name):
-                expiry_time = self.request.data.get('expiry_time', 300)
+                expiry_time = parse_expiry_time(self.request.data.get('expiry_time', 300))
                 try:
-                    expiry_time = int(expiry_time)
-                    if expiry_time in range(300, 30001):
-                        serializer.save(
-                            user=self.request.user, image=uploaded_file, expiry_time=expiry_time)
-                    else:
-                        raise serializers.ValidationError(
-                            'Image expiry link duration must be between 300 and 30000.'
-                        )
-                except ValueError:
-                    raise serializers.ValidationError(
-                        'Image expiry link duration must be numbers.')
+                    check_upload_limits(uploaded_file)
+                except ValidationError as e:
+                    raise serializers.ValidationError(e.messages)
+                image_file, saved_bytes = ingest_upload(uploaded_file, get_account_tier(self.request.user))
+                check_storage_quota(self.request.user, image_file.size)
+                self.created_image = serializer.save(
+                    user=self.request.user, image=image_file, expiry_time=expiry_time,
+                    ingest_saved_bytes=saved_bytes)
             else:
                 raise serializers.ValidationError(
-                    'Unsupported file extension. Only JPG and PNG are supported.')
+                    'Unsupported file extension. Only JPG, PNG, GIF and WebP are supported.')
         else:
             raise serializers.ValidationError('Image file not provided.')
 
 
+class DirectUploadView(StorageQuotaMixin, generics.GenericAPIView):
+    """
+    Issue a short-lived signed URL the client can PUT an image to, so the
+    upload bytes skip the API views. The upload is then finalized with
+    DirectUploadFinalizeView.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = api_settings.DEFAULT_THROTTLE_CLASSES + [DirectUploadBytesThrottle]
+
+    def get_incoming_bytes(self, request):
+        try:
+            return max(int(request.data.get('size')), 0)
+        except (TypeError, ValueError):
+            return 0
+
+    def post(self, request, *args, **kwargs):
+        file_name = request.data.get('file_name')
+        if not file_name:
+            raise serializers.ValidationError('File name not provided.')
+        if not is_valid_file_extension(file_name):
+            raise serializers.ValidationError(
+                'Unsupported file extension. Only JPG, PNG, GIF and WebP are supported.')
+        try:
+            size = int(request.data.get('size'))
+        except (TypeError, ValueError):
+            raise serializers.ValidationError('File size must be a number.')
+        if size not in range(1, settings.IMAGE_DIRECT_UPLOAD_MAX_BYTES + 1):
+            raise serializers.ValidationError(
+                f'File size must be between 1 and {settings.IMAGE_DIRECT_UPLOAD_MAX_BYTES} bytes.')
+
+        extension = os.path.splitext(file_name)[1].lower()
+        name = Image.image.field.generate_filename(None, f'{uuid.uuid4().hex}{extension}')
+        token = generate_upload_token(request.user.pk, name, size)
+        return Response({
+            'token': token,
+            'upload_url': request.build_absolute_uri(reverse('direct_upload_put', args=[token])),
+            'expires_in': settings.IMAGE_DIRECT_UPLOAD_MAX_AGE,
+        })
+
+
+class DirectUploadFinalizeView(generics.GenericAPIView):
+    """
+    Create the image for a file uploaded to a direct upload URL.
+    """
+    queryset = Image.objects.all()
+    serializer_class = ImageSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        """
+        Check the stored file's image header, run it through the ingest
+        pipeline, rewriting it when that changed it, and create the image.
+        Files that fail validation are deleted. Thumbnails are rendered in the
+        background.
+        """
+        token = request.data.get('token')
+        if not token:
+            raise serializers.ValidationError('Upload token not provided.')
+        try:
+            payload = load_upload_token(token, settings.IMAGE_DIRECT_UPLOAD_FINALIZE_MAX_AGE)
+        except SignatureExpired:
+            raise serializers.ValidationError('Upload token has expired.')
+        except (BadSignature, BadTimeSignature):
+            raise serializers.ValidationError('Invalid upload token.')
+        if payload['user'] != request.user.pk:
+            raise exceptions.PermissionDenied()
+
+        name = payload['name']
+        if not default_storage.exists(name):
+            raise serializers.ValidationError('File has not been uploaded.')
+        if Image.objects.filter(image=name).exists():
+            raise serializers.ValidationError('Upload has already been finalized.')
+        expiry_time = parse_expiry_time(request.data.get('expiry_time', 300))
+
+        image = Image(user=request.user, expiry_time=expiry_time)
+        try:
+            with default_storage.open(name) as stored_file:
+                check_upload_limits(stored_file, require_image=True)
+                image_file, image.ingest_saved_bytes = ingest_upload(stored_file, get_account_tier(request.user))
+            check_storage_quota(request.user, image_file.size)
+            if image_file is not stored_file:
+                default_storage.delete(name)
+                name = default_storage.save(name, image_file)
+            image.image.name = name
+            image.save()
+        except ValidationError as e:
+            default_storage.delete(name)
+            raise serializers.ValidationError(e.messages)
+        except exceptions.APIException:
+            default_storage.delete(name)
+            raise
+
+        enqueue(render_thumbnails, [image.pk], get_allowed_thumbnail_sizes(request.user) or [])
+        return Response(
+            {'id': image.pk, 'image': request.build_absolute_uri(image.image.url)},
+            status=status.HTTP_201_CREATED)
+
+
+class BulkImageUploadView(StorageQuotaMixin, UploadConcurrencyMixin, generics.GenericAPIView):
+    """
+    Upload several JPG, PNG, GIF or WebP images in one request.
+    """
+    queryset = Image.objects.all()
+    serializer_class = ImageSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = api_settings.DEFAULT_THROTTLE_CLASSES + [UploadBytesThrottle]
+
+    def post(self, request, *args, **kwargs):
+        """
+        Validate every file, store the valid ones in a single transaction and
+        report the outcome for each file. Thumbnails are rendered in the background.
+        """
+        uploaded_files = request.FILES.getlist('images')
+        if not uploaded_files:
+            raise serializers.ValidationError('Image files not provided.')
+        if len(uploaded_files) > settings.IMAGE_BULK_UPLOAD_MAX_FILES:
+            raise serializers.ValidationError(
+                f'At most {settings.IMAGE_BULK_UPLOAD_MAX_FILES} images can be uploaded at once.')
+        expiry_time = parse_expiry_time(request.data.get('expiry_time', 300))
+
+        account_tier = get_account_tier(request.user)
+        results = []
+        images = []
+        for uploaded_file in uploaded_files:
+            result = {'file': uploaded_file.name}
+            results.append(result)
+            if not is_valid_file_extension(uploaded_file.name):
+                result.update(status='error', errors=[
+                    'Unsupported file extension. Only JPG, PNG, GIF and WebP are supported.'])
+                continue
+            image_file, saved_bytes = ingest_upload(uploaded_file, account_tier)
+            image = Image(
+                user=request.user, image=image_file, expiry_time=expiry_time, ingest_saved_bytes=saved_bytes)
+            try:
+                image.full_clean()
+            except ValidationError as e:
+                result.update(status='error', errors=e.messages)
+                continue
+            images.append((result, image))
+
+        if images:
+            check_storage_quota(request.user, sum(image.image.size for _, image in images))
+            created = self.create_images(request.user, [image for _, image in images])
+            for result, image in images:
+                result.update(status='created', id=created[image.image.name].pk)
+            enqueue(
+                render_thumbnails, [image.pk for image in created.values()],
+                get_allowed_thumbnail_sizes(request.user) or [])
+
+        if len(images) == len(results):
+            response_status = status.HTTP_201_CREATED
+        elif images:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response({'results': results}, status=response_status)
+
+    def create_images(self, user, images):
+        """
+        Store the files and insert all rows with one bulk_create, returning the
+        created images keyed by their stored file name.
+        """
+        try:
+            with transaction.atomic():
+                for image in images:
+                    image.file_size = image.image.size
+                    image.image.save(image.image.name, image.image.file, save=False)
+                    image.expiring_image_link = generate_signed_url(image.image.url, image.expiry_time)
+                Image.objects.bulk_create(images)
+                # bulk_create sends no post_save, so count the files here
+                adjust_storage_usage(user.id, sum(image.file_size for image in images), len(images))
+                names = [image.image.name for image in images]
+                created = {image.image.name: image for image in Image.objects.filter(user=user, image__in=names)}
+                ImageChange.objects.bulk_create([
+                    ImageChange(user=user, image_id=image.pk, action=ImageChange.CREATED)
+                    for image in created.values()
+                ])
+        except Exception:
+            for image in images:
+                if image.image._committed:
+                    image.image.storage.delete(image.image.name)
+            raise
+
+        image_list_cache.invalidate_user(user.id)
+        return created
+
+
+class BulkImageDeleteView(generics.GenericAPIView):
+    """
+    Delete several of the authenticated user's images in one request.
+    """
+    serializer_class = ImageSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return Image.objects.filter(user=self.request.user)
+
+    def post(self, request, *args, **kwargs):
+        """
+        Delete the images listed in 'ids'. Their files are removed from storage
+        in the background once the deletion is committed.
+        """
+        ids = parse_image_ids(request)
+
+        deleted = delete_images(self.get_queryset().filter(pk__in=ids))
+        return Response({'deleted': sorted(deleted), 'not_found': sorted(ids - deleted)})
+
+
 class UserImagesListView(generics.ListAPIView):
     """
     List all images uploaded by the authenticated user.
@@ -120,6 +606,321 @@ class UserImagesListView(generics.ListAPIView):
         """
         return Image.objects.filter(user=self.request.user)
 
+    def list(self, request, *args, **kwargs):
+        """
+        Serve the serialized list from the per-user cache when it is still current.
+        A page is not cached when it was invalidated while it was built, for
+        example by a thumbnail it rendered; the next request caches it.
+        """
+        page = request.build_absolute_uri()
+        cache_key = image_list_cache.page_key(request.user.id, page)
+        data = image_list_cache.get(cache_key)
+        if data is not None:
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        response = super().list(request, *args, **kwargs)
+        if image_list_cache.page_key(request.user.id, page) == cache_key:
+            image_list_cache.set(cache_key, response.data)
+        response['X-Cache'] = 'MISS'
+        return response
+
+
+class UserImagesExportView(generics.GenericAPIView):
+    """
+    Stream all images uploaded by the authenticated user as a JSON array or,
+    with ?output=ndjson, as newline-delimited JSON.
+    """
+    serializer_class = ImageSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return Image.objects.filter(user=self.request.user).order_by('pk')
+
+    def get(self, request, *args, **kwargs):
+        output = request.query_params.get('output', 'json')
+        if output not in ('json', 'ndjson'):
+            raise serializers.ValidationError('Output must be json or ndjson.')
+
+        serializer = self.get_serializer()
+        images = self.iter_images()
+        if output == 'ndjson':
+            content = self.stream_ndjson(serializer, images)
+            content_type = 'application/x-ndjson'
+        else:
+            content = self.stream_json(serializer, images)
+            content_type = 'application/json'
+        return StreamingHttpResponse(content, content_type=content_type)
+
+    def get_serializer_context(self):
+        # The body streams after the response has started, so nothing is rendered
+        # or throttled while exporting; thumbnails not rendered yet are null.
+        return dict(super().get_serializer_context(), render=False)
+
+    def iter_images(self):
+        """
+        Yield the images chunk by chunk, with each chunk's related rows fetched
+        in one query per relation.
+        """
+        queryset = self.get_queryset().select_related('user').prefetch_related('thumbnails', Prefetch(
+            'image_thumbnails', queryset=ImageThumbnail.objects.select_related('thumbnail_size')))
+        last_pk = 0
+        while True:
+            chunk = list(queryset.filter(pk__gt=last_pk)[:settings.IMAGE_EXPORT_CHUNK_SIZE])
+            yield from chunk
+            if len(chunk) < settings.IMAGE_EXPORT_CHUNK_SIZE:
+                return
+            last_pk = chunk[-1].pk
+
+    def dumps(self, serializer, image):
+        return json.dumps(serializer.to_representation(image), cls=encoders.JSONEncoder)
+
+    def stream_ndjson(self, serializer, images):
+        for image in images:
+            yield self.dumps(serializer, image) + '\n'
+
+    def stream_json(self, serializer, images):
+        separator = '['
+        for image in images:
+            yield separator + self.dumps(serializer, image)
+            separator = ','
+        yield ']' if separator == ',' else '[]'
+
+
+class UserImagesZipExportView(generics.GenericAPIView):
+    """
+    Stream a ZIP archive of the authenticated user's selected images.
+    """
+    serializer_class = ImageSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return Image.objects.filter(user=self.request.user)
+
+    def post(self, request, *args, **kwargs):
+        """
+        Archive the images listed in 'ids' with the renditions listed in
+        'renditions' ('original' or thumbnail heights), by default everything
+        the account tier can access. Thumbnails that have not been rendered
+        yet are left out.
+        """
+        ids = parse_image_ids(request, settings.IMAGE_ZIP_EXPORT_MAX_IMAGES)
+        allowed_sizes = set(get_allowed_thumbnail_sizes(request.user) or [])
+        original_allowed = is_original_allowed(request.user)
+        renditions = request.data.getlist('renditions') if hasattr(request.data, 'getlist') \
+            else request.data.get('renditions')
+        if renditions:
+            include_original = 'original' in renditions
+            try:
+                sizes = {int(rendition) for rendition in renditions if rendition != 'original'}
+            except (TypeError, ValueError):
+                raise serializers.ValidationError("Renditions must be 'original' or thumbnail heights.")
+            if (include_original and not original_allowed) or not sizes <= allowed_sizes:
+                raise exceptions.PermissionDenied('Your account tier does not include these renditions.')
+        else:
+            include_original = original_allowed
+            sizes = allowed_sizes
+
+        response = StreamingHttpResponse(
+            stream_zip(self.get_entries(ids, include_original, sizes), settings.IMAGE_ZIP_CHUNK_SIZE),
+            content_type='application/zip')
+        response['Content-Disposition'] = 'attachment; filename="images.zip"'
+        return response
+
+    def get_entries(self, ids, include_original, sizes):
+        """
+        Return (archive name, storage name, date_time) for every file, as
+        {id}/original.{ext} and {id}/thumbnail_{height}.{ext}.
+        """
+        images = self.get_queryset().filter(pk__in=ids).order_by('pk').values_list('pk', 'image', 'uploaded_at')
+        date_times = {}
+        entries = []
+        for pk, name, uploaded_at in images:
+            date_times[pk] = uploaded_at.timetuple()[:6]
+            if include_original:
+                entries.append((f'{pk}/original{os.path.splitext(name)[1]}', name, date_times[pk]))
+        thumbnails = ImageThumbnail.objects.filter(
+            image__in=list(date_times), thumbnail_size__height__in=sizes,
+        ).exclude(thumbnail='').exclude(thumbnail__isnull=True).values_list(
+            'image_id', 'thumbnail_size__height', 'thumbnail')
+        for pk, height, name in thumbnails:
+            entries.append((f'{pk}/thumbnail_{height}{os.path.splitext(name)[1]}', name, date_times[pk]))
+        entries.sort()
+        return entries
+
+
+class UserImagesSpriteView(generics.GenericAPIView):
+    """
+    Compose the authenticated user's thumbnails into one sprite sheet.
+    """
+    serializer_class = ImageSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        """
+        Return the sheet URL and each image's box in it for the images listed
+        in 'ids' at thumbnail 'height'. Sheets are built in the background;
+        until one is ready the response is 202 with a Retry-After header.
+        Images without a rendered thumbnail are listed as missing.
+        """
+        ids = sorted(parse_image_ids(request, settings.IMAGE_SPRITE_MAX_IMAGES))
+        try:
+            height = int(request.data.get('height'))
+        except (TypeError, ValueError):
+            raise serializers.ValidationError('Thumbnail height must be a number.')
+        if height not in (get_allowed_thumbnail_sizes(request.user) or []):
+            raise exceptions.PermissionDenied('Your account tier does not include this thumbnail size.')
+
+        token = sprite_sheets.token(request.user.pk, height, ids)
+        sheet = sprite_sheets.get(request.user.pk, token)
+        if sheet is None:
+            if sprite_sheets.claim(request.user.pk, token):
+                enqueue(build_sprite_sheet, request.user.pk, token, ids, height)
+            # Eager tasks have already built it.
+            sheet = sprite_sheets.get(request.user.pk, token)
+        if sheet is None:
+            response = Response({'status': 'pending'}, status=status.HTTP_202_ACCEPTED)
+            response['Retry-After'] = '1'
+            return response
+        return Response({
+            'sprite': request.build_absolute_uri(reverse('sprite_sheet', args=[token])),
+            'width': sheet['width'],
+            'height': sheet['height'],
+            'images': sheet['images'],
+            'missing': sheet['missing'],
+        })
+
+
+class SpriteSheetView(views.APIView):
+    """
+    Serve a sprite sheet built for the authenticated user.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, token, *args, **kwargs):
+        sheet = sprite_sheets.get(request.user.pk, token)
+        if sheet is None:
+            raise Http404('Sprite sheet not found')
+        try:
+            response = FileResponse(default_storage.open(sheet['name'], 'rb'), content_type=sheet['content_type'])
+        except OSError:
+            raise Http404('Sprite sheet not found')
+        # A token names one version of one sheet, so its bytes never change.
+        response['Cache-Control'] = f'private, max-age={settings.IMAGE_SPRITE_CACHE_TIMEOUT}'
+        return response
+
+
+class OriginalImageView(generics.GenericAPIView):
+    """
+    Serve the original of one of the authenticated user's images, restoring
+    it from cold storage when it has been archived.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return Image.objects.filter(user=self.request.user)
+
+    def get(self, request, *args, **kwargs):
+        if not is_original_allowed(request.user):
+            raise exceptions.PermissionDenied('Your account tier does not include original images.')
+        image = self.get_object()
+        name = image.image.name
+        with timed('storage_read'):
+            try:
+                f = open_original(name)
+            except FileNotFoundError:
+                raise Http404('Image not found')
+            response = FileResponse(f)
+        size = os.fstat(f.fileno()).st_size
+        record_bytes('storage_read', size)
+        access_counters.record(name, size)
+        return response
+
+
+class UserImagesChangesView(generics.GenericAPIView):
+    """
+    List the authenticated user's image changes since a cursor.
+    """
+    serializer_class = ImageSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return Image.objects.filter(user=self.request.user)
+
+    def get(self, request, *args, **kwargs):
+        """
+        Return images created or re-rendered and ids of images deleted after
+        ?cursor, collapsed to each image's latest change, with the cursor to
+        pass on the next call.
+        """
+        try:
+            cursor = int(request.query_params.get('cursor', 0))
+            limit = int(request.query_params.get('limit', settings.IMAGE_CHANGES_PAGE_SIZE))
+        except ValueError:
+            raise serializers.ValidationError('Cursor and limit must be numbers.')
+        limit = max(1, min(limit, settings.IMAGE_CHANGES_PAGE_SIZE))
+
+        changes = list(
+            ImageChange.objects.filter(user=request.user, pk__gt=cursor)
+            .order_by('pk').values_list('pk', 'image_id', 'action')[:limit + 1])
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+
+        latest = {}
+        for _, image_id, action in changes:
+            latest[image_id] = action
+        changed_ids = [image_id for image_id, action in latest.items() if action != ImageChange.DELETED]
+        images = list(self.get_queryset().filter(pk__in=changed_ids).order_by('pk'))
+        found = {image.pk for image in images}
+
+        return Response({
+            'cursor': changes[-1][0] if changes else cursor,
+            'has_more': has_more,
+            'images': self.get_serializer(images, many=True).data,
+            'deleted': sorted(image_id for image_id in latest if image_id not in found),
+        })
+
+
+class SimilarImagesView(generics.GenericAPIView):
+    """
+    List the authenticated user's images that look like the given image.
+    """
+    serializer_class = ImageSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return Image.objects.filter(user=self.request.user)
+
+    def get(self, request, *args, **kwargs):
+        """
+        Return images within ?distance bits of the image's perceptual hash,
+        closest first, each with its distance.
+        """
+        try:
+            distance = int(request.query_params.get('distance', settings.IMAGE_SIMILARITY_MAX_DISTANCE))
+        except ValueError:
+            raise serializers.ValidationError('Distance must be a number.')
+        if distance not in range(0, 65):
+            raise serializers.ValidationError('Distance must be between 0 and 64.')
+
+        image = self.get_object()
+        if image.phash is None:
+            try:
+                image.set_phash(dhash_file(image.image))
+            except Exception as e:
+                raise serializers.ValidationError(f'Image could not be hashed: {e}')
+
+        matches = find_similar_images(image, distance, limit=settings.IMAGE_SIMILARITY_MAX_RESULTS)
+        images = self.get_queryset().in_bulk([pk for pk, _ in matches])
+        similar = []
+        for pk, match_distance in matches:
+            if pk in images:
+                data = self.get_serializer(images[pk]).data
+                data['distance'] = match_distance
+                similar.append(data)
+        return Response({'id': image.pk, 'similar': similar})
+
 
 class GenerateExpiringLinkView(generics.GenericAPIView):
     """